@@ -1,50 +1,85 @@
 # scripts/data_health_check.py
 import os
+import sys
+from collections import Counter, defaultdict
+from itertools import islice
 from dotenv import load_dotenv
 import pandas as pd
 import matplotlib.pyplot as plt
-from pymongo import MongoClient
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.utils.mongo_client import get_database
 
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "aqi_feature_store"
 COLLECTION_NAME = "raw_aqi_weather_hourly"  # Update for hourly
+CHUNK_SIZE = 10_000
+# Only the fields the report looks at are sent over the wire
+PROJECTION = {"_id": 0, "city": 1, "timestamp": 1, "date": 1, "aqi": 1, "pollutants": 1, "weather": 1}
 
-# Connect to MongoDB
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
+# Connect to MongoDB (shared, pooled client, database from MONGO_URI)
+db = get_database()
 collection = db[COLLECTION_NAME]
 
-# Load data safely (hourly datasets may be huge)
-cursor = collection.find({}, batch_size=1000)
-data = pd.DataFrame(list(cursor))
+# Hourly datasets may be huge: aggregate chunk by chunk instead of
+# loading the whole collection into one DataFrame
+total = 0
+records_per_city = Counter()
+missing_per_city = defaultdict(Counter)
+first_seen, last_seen = {}, {}
 
-if data.empty:
-    print("❌ No data found in MongoDB!")
-else:
-    print(f"✅ Total records: {len(data)}\n")
+cursor = collection.find({}, PROJECTION).batch_size(CHUNK_SIZE)
+while True:
+    docs = list(islice(cursor, CHUNK_SIZE))
+    if not docs:
+        break
+    chunk = pd.json_normalize(docs, sep="_")
+    total += len(chunk)
+    time_col = "timestamp" if "timestamp" in chunk.columns else "date"
 
     # Convert dates safely
-    data['date'] = pd.to_datetime(data['date'], errors='coerce')
+    chunk[time_col] = pd.to_datetime(chunk[time_col], errors='coerce')
+
+    records_per_city.update(chunk['city'].value_counts().to_dict())
+
+    for city, nulls in chunk.isnull().groupby(chunk['city']).sum().iterrows():
+        missing_per_city[city].update(nulls.to_dict())
+
+    for city, dates in chunk.groupby('city')[time_col]:
+        first_seen[city] = min(first_seen.get(city, dates.min()), dates.min())
+        last_seen[city] = max(last_seen.get(city, dates.max()), dates.max())
+
+# Duplicates are counted server-side: only (city, time) keys seen more than
+# once come back, so memory does not grow with the collection
+duplicate_groups = collection.aggregate([
+    {"$group": {"_id": {"city": "$city", "time": {"$ifNull": ["$timestamp", "$date"]}}, "count": {"$sum": 1}}},
+    {"$match": {"count": {"$gt": 1}}},
+    {"$group": {"_id": None, "extra": {"$sum": {"$subtract": ["$count", 1]}}}},
+], allowDiskUse=True)
+duplicates = next(iter(duplicate_groups), {}).get("extra", 0)
+
+if total == 0:
+    print("❌ No data found in MongoDB!")
+else:
+    print(f"✅ Total records: {total}\n")
 
     # Records per city
     print("Records per city:")
-    print(data['city'].value_counts(), "\n")
+    print(pd.Series(records_per_city).sort_values(ascending=False), "\n")
 
     # Missing values per city
     print("Missing values per city:")
-    print(data.groupby('city').apply(lambda x: x.isnull().sum()), "\n")
+    print(pd.DataFrame(missing_per_city).T.fillna(0).astype(int), "\n")
 
     # Duplicates
-    print("Duplicate records (city + date):", data.duplicated(subset=['city', 'date']).sum(), "\n")
+    print("Duplicate records (city + date):", duplicates, "\n")
 
     # Date coverage per city
     print("Date range per city:")
-    for city in data['city'].unique():
-        city_dates = data[data['city'] == city]['date']
-        print(f"{city}: {city_dates.min()} → {city_dates.max()}")
+    for city in records_per_city:
+        print(f"{city}: {first_seen[city]} → {last_seen[city]}")
 
     # Optional plot
-    data['city'].value_counts().plot(kind='bar', title="Records per City")
+    pd.Series(records_per_city).plot(kind='bar', title="Records per City")
     plt.show()
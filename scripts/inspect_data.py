@@ -1,10 +1,10 @@
 import sys
 import os
 
-# Add src/ to path so Python can find storage.mongo
-sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+# Add the project root to path so Python can find src.storage.mongo
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from storage.mongo import MongoHandler
+from src.storage.mongo import MongoHandler
 from pymongo import ASCENDING
 
 mongo = MongoHandler()
@@ -0,0 +1,32 @@
+import sys
+import os
+import argparse
+
+# Add the project root to path so Python can find src.*
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv
+
+from src.utils.mongo_client import get_database
+from src.storage.timeseries import LAYOUTS, migrate_to_timeseries, timeseries_name
+
+load_dotenv()
+
+parser = argparse.ArgumentParser(description="Copy hourly collections into MongoDB time-series collections")
+parser.add_argument("collections", nargs="*", default=list(LAYOUTS), help="Source collections (default: all)")
+parser.add_argument("--db", help="Database name (default: the one in MONGO_URI)")
+parser.add_argument("--batch-size", type=int, default=5000)
+args = parser.parse_args()
+
+db = get_database(args.db)
+
+for name in args.collections:
+    copied = migrate_to_timeseries(db, name, batch_size=args.batch_size)
+    target = timeseries_name(name)
+    source_count = db[name].count_documents({})
+    target_count = db[target].count_documents({})
+    print(f"{name} -> {target}: copied {copied}, source {source_count}, target {target_count}")
+
+    stats = {n: db.command("collStats", n) for n in (name, target)}
+    for n, s in stats.items():
+        print(f"  {n}: storageSize={s.get('storageSize')} bytes, indexes={s.get('totalIndexSize')} bytes")
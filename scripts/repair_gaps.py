@@ -0,0 +1,43 @@
+import sys
+import os
+import argparse
+from datetime import datetime, timedelta
+
+# Add project root to path so Python can find src.*
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv
+
+from src.ingestion.gap_repair import DEFAULT_BRIDGE_HOURS, find_gaps, plan_repair_requests, repair_gaps
+from src.ingestion.merge_data import HISTORY_DAYS
+from src.utils.mongo_client import get_database
+
+load_dotenv()
+
+parser = argparse.ArgumentParser(description="Re-fetch missing hours of the merged hourly collection")
+parser.add_argument("--city", action="append", dest="cities", help="City to repair (repeatable)")
+parser.add_argument("--from", dest="from_date", type=datetime.fromisoformat,
+                    help=f"UTC start (default: {HISTORY_DAYS} days ago)")
+parser.add_argument("--to", dest="to_date", type=datetime.fromisoformat, help="UTC end, exclusive (default: now)")
+parser.add_argument("--max-days", type=int, help="Longest window per request (default: endpoint limit)")
+parser.add_argument("--bridge-hours", type=int, default=DEFAULT_BRIDGE_HOURS)
+parser.add_argument("--cache", action="store_true", help="Serve archived days from the response cache")
+parser.add_argument("--dry-run", action="store_true", help="Only print the planned requests")
+args = parser.parse_args()
+
+end = args.to_date or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+start = args.from_date or end - timedelta(days=HISTORY_DAYS)
+cities = args.cities or [os.getenv("CITY", "karachi")]
+db = get_database()
+
+if args.dry_run:
+    gaps = find_gaps(db, start, end, [c.lower() for c in cities])
+    for request in plan_repair_requests(gaps, args.max_days, args.bridge_hours):
+        print(f"{request.city}: {request.start} → {request.end} "
+              f"({len(request.gaps)} gaps, {request.missing_hours} missing hours, {request.days} days)")
+
+summary = repair_gaps(
+    os.getenv("AQICN_TOKEN"), start, end, cities, db=db, use_cache=args.cache,
+    max_days=args.max_days, bridge_hours=args.bridge_hours, dry_run=args.dry_run
+)
+print(summary)
@@ -1,19 +1,19 @@
 import sys
 import os
-import yaml
 
-# Add src/ to path
-sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+# Add project root to path so Python can find src.*
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from ingestion.backfill import run_backfill
+from src.ingestion.backfill import run_backfill
+from src.utils.config import load_ingestion_config
 
 # Load config
-with open(os.path.join(os.path.dirname(__file__), "..", "src", "config", "ingestion.yaml")) as f:
-    config = yaml.safe_load(f)
+config = load_ingestion_config()
 
 start_date = config["date_range"]["start_date"]
 end_date = config["date_range"]["end_date"]
-batch_size = config.get("batch_size_days", 10)
+batch_size = config["batch_size_days"]
+max_workers = config["max_workers"]
 
 if __name__ == "__main__":
-    run_backfill(start_date, end_date, batch_size)
+    print(run_backfill(start_date, end_date, batch_size, max_workers=max_workers))
@@ -1,11 +1,44 @@
 import os
-import requests
+import argparse
+import threading
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from pymongo import MongoClient, UpdateOne
+from typing import Optional
 from dotenv import load_dotenv
 from loguru import logger
 
+from src.features.lag_features import LAG_HOURS, add_change_rate, add_lag_features
+from src.features.materialization import (
+    MANIFEST_COLLECTION,
+    FeatureManifest,
+    affected_mask,
+    content_hash,
+    frame_hashes,
+)
+from src.features.rolling_features import (
+    ROLLING_COLUMNS,
+    ROLLING_STATE_COLLECTION,
+    ROLLING_WARMUP_HOURS,
+    RollingStateStore,
+    RollingWindowState,
+    add_rolling_features,
+    feature_names,
+    to_hour,
+)
+from src.features.time_features import add_time_features
+from src.ingestion.http_transport import get_transport
+from src.storage.hourly_array_store import HourlyArrayStore
+from src.storage.indexes import ensure_indexes_once
+from src.storage.mongo import bulk_upsert
+from src.utils.mongo_client import get_database
+from src.storage.timeseries import (
+    LAYOUTS,
+    create_timeseries_collection,
+    replace_timeseries_records,
+    timeseries_name,
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -18,14 +51,77 @@ MONGO_URI = os.getenv("MONGO_URI")
 
 CITY = "karachi"
 COLLECTION_NAME = "features_aqi_v1"
-FEATURE_VERSION = "v1"
+RAW_COLLECTION_NAME = "raw_aqi_weather"
+# v2: pollutant sub-indices and rolling-window features (rows written as
+# v1 lack them and are recomputed by run_batch)
+FEATURE_VERSION = "v2"
+WEATHER_FEATURES = ["temperature", "humidity", "wind_speed"]
+# AQICN per-pollutant sub-indices ("iaqi"), stored alongside the AQI
+POLLUTANT_FEATURES = [c for c in ROLLING_COLUMNS if c != "aqi"]
+# Raw values a feature row is computed from (hashed to detect changes)
+INPUT_COLUMNS = ["aqi", *POLLUTANT_FEATURES, *WEATHER_FEATURES]
+FEATURE_COLUMNS = [
+    "aqi", *(f"aqi_lag_{lag}" for lag in LAG_HOURS), "aqi_change_rate", "hour", "day", "month",
+    *POLLUTANT_FEATURES, *WEATHER_FEATURES, *feature_names()
+]
+BATCH_WRITE_SIZE = 1000
+# Batch rebuilds are processed in chunks of this many days (bounds memory)
+BATCH_CHUNK_DAYS = 90
+FEATURE_KEY_FIELDS = ("entity.city", "event_timestamp")
+# "document" or "timeseries" (features_aqi_v1_ts, see src/storage/timeseries.py)
+STORAGE_MODE = os.getenv("MONGO_STORAGE_MODE", "document")
+FEATURE_LAYOUT = LAYOUTS[COLLECTION_NAME]
+FEATURE_CITY_FIELD = FEATURE_LAYOUT.city_field if STORAGE_MODE == "timeseries" else "entity.city"
+# Read lag/rolling history from the local memmap store (src/storage/hourly_array_store.py)
+# instead of MongoDB; stored features are written through to it either way when enabled
+USE_ARRAY_STORE = os.getenv("AQI_USE_ARRAY_STORE", "0") == "1"
 
 # ------------------------------
-# MongoDB client
+# MongoDB collections (shared client, connected on first use)
 # ------------------------------
-client = MongoClient(MONGO_URI)
-db = client.get_database()  # uses database specified in URI
-collection = db[COLLECTION_NAME]
+def get_db():
+    return get_database()  # uses database specified in URI
+
+_prepared_dbs = set()
+_prepared_lock = threading.Lock()
+
+def prepare_collections(db):
+    """
+    Create the feature collection (as a time-series collection in that
+    storage mode) and the pipeline's indexes, once per process and
+    database, so that no first insert creates a plain collection.
+    """
+    with _prepared_lock:
+        if db.name in _prepared_dbs:
+            return
+        if STORAGE_MODE == "timeseries":
+            create_timeseries_collection(db, timeseries_name(COLLECTION_NAME), FEATURE_LAYOUT)
+            ensure_indexes_once(db, [RAW_COLLECTION_NAME, MANIFEST_COLLECTION])
+        else:
+            ensure_indexes_once(db, [COLLECTION_NAME, RAW_COLLECTION_NAME, MANIFEST_COLLECTION])
+        _prepared_dbs.add(db.name)
+
+def feature_collection():
+    db = get_db()
+    prepare_collections(db)
+    return db[timeseries_name(COLLECTION_NAME) if STORAGE_MODE == "timeseries" else COLLECTION_NAME]
+
+def raw_collection():
+    return get_db()[RAW_COLLECTION_NAME]
+
+def rolling_state_store():
+    return RollingStateStore(get_db()[ROLLING_STATE_COLLECTION])
+
+def feature_manifest():
+    return FeatureManifest(get_db()[MANIFEST_COLLECTION])
+
+_array_store = None
+
+def array_store() -> Optional[HourlyArrayStore]:
+    global _array_store
+    if USE_ARRAY_STORE and _array_store is None:
+        _array_store = HourlyArrayStore()
+    return _array_store
 
 # ------------------------------
 # Fetch AQI from AQICN
@@ -33,12 +129,14 @@ collection = db[COLLECTION_NAME]
 def fetch_aqi(city: str):
     url = f"https://api.waqi.info/feed/{city}/?token={AQICN_TOKEN}"
     try:
-        response = requests.get(url, timeout=10)
+        response = get_transport().get(url, timeout=10)
         response.raise_for_status()
         data = response.json()
         aqi = data.get("data", {}).get("aqi")
         ts = datetime.utcfromtimestamp(data.get("data", {}).get("time", {}).get("v", datetime.utcnow().timestamp()))
-        return {"aqi": aqi, "timestamp": ts}
+        iaqi = data.get("data", {}).get("iaqi", {})
+        pollutants = {name: iaqi[name].get("v") for name in POLLUTANT_FEATURES if name in iaqi}
+        return {"aqi": aqi, "timestamp": ts, "pollutants": pollutants}
     except Exception as e:
         logger.error(f"Error fetching AQI: {e}")
         return None
@@ -49,7 +147,7 @@ def fetch_aqi(city: str):
 def fetch_weather(city: str):
     url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={OPENWEATHER_API_KEY}&units=metric"
     try:
-        response = requests.get(url, timeout=10)
+        response = get_transport().get(url, timeout=10)
         response.raise_for_status()
         data = response.json()
         return {
@@ -64,18 +162,79 @@ def fetch_weather(city: str):
 # ------------------------------
 # Compute lag and trend features
 # ------------------------------
-def compute_features(aqi_doc):
+def load_lag_history(city: str, ts, max_lag: int = max(LAG_HOURS)):
+    """
+    One indexed range query for every AQI value in [ts - max_lag, ts),
+    keyed by event_timestamp, so all lags resolve in memory. With the
+    array store enabled each lag is a slot read instead.
+    """
+    store = array_store()
+    if store is not None:
+        lags = store.lags(city, "aqi", ts, range(1, max_lag + 1))
+        return {ts - timedelta(hours=k): value for k, value in lags.items() if value is not None}
+
+    cursor = feature_collection().find(
+        {
+            FEATURE_CITY_FIELD: city,
+            "event_timestamp": {"$gte": ts - timedelta(hours=max_lag), "$lt": ts}
+        },
+        {"_id": 0, "event_timestamp": 1, "features.aqi": 1}
+    )
+    return {doc["event_timestamp"]: doc.get("features", {}).get("aqi") for doc in cursor}
+
+def load_rolling_history(city: str, ts, hours: int = ROLLING_WARMUP_HOURS) -> pd.DataFrame:
+    """
+    Stored AQI and pollutant values for [ts - hours, ts), used to rebuild
+    a rolling state that is missing or unusable.
+    """
+    store = array_store()
+    if store is not None:
+        return store.read_frame(city, ROLLING_COLUMNS, ts - timedelta(hours=hours), ts - timedelta(hours=1))
+
+    cursor = feature_collection().find(
+        {
+            FEATURE_CITY_FIELD: city,
+            "event_timestamp": {"$gte": ts - timedelta(hours=hours), "$lt": ts}
+        },
+        {"_id": 0, "event_timestamp": 1, **{f"features.{c}": 1 for c in ROLLING_COLUMNS}}
+    )
+    rows = [{"event_timestamp": doc["event_timestamp"], **doc.get("features", {})} for doc in cursor]
+    return pd.DataFrame(rows, columns=["event_timestamp", *ROLLING_COLUMNS])
+
+def load_rolling_state(city: str, ts) -> RollingWindowState:
+    """
+    The persisted rolling state for `city`, brought up to the hour before
+    `ts` from stored features: hours stored since its last update (after
+    downtime, a backfill or a gap repair) are replayed, and a state that is
+    missing, ahead of `ts` or older than the warm-up horizon is rebuilt.
+    Either way it matches what add_rolling_features computes in batch.
+    """
+    hour = to_hour(ts)
+    state = rolling_state_store().load(city)
+    if state is None or state.last_timestamp is None or state.last_timestamp > hour \
+            or hour - state.last_timestamp > pd.Timedelta(hours=ROLLING_WARMUP_HOURS):
+        logger.info(f"Rebuilding rolling state for {city} from the last {ROLLING_WARMUP_HOURS}h")
+        return RollingWindowState.from_history(load_rolling_history(city, ts))
+
+    behind = int((hour - state.last_timestamp) / pd.Timedelta(hours=1))
+    if behind > 1:
+        # replay() skips rows before the state's latest hour and rewrites that hour
+        replayed = state.replay(load_rolling_history(city, ts, hours=behind))
+        if replayed:
+            logger.info(f"Replayed {replayed} stored hours into the rolling state for {city}")
+    return state
+
+def compute_features(aqi_doc, weather=None, history=None, city: str = CITY, rolling_state=None):
     # Convert timestamp to datetime
     ts = aqi_doc["timestamp"]
 
     # Get previous AQI values for lag features
-    lag_1_doc = collection.find_one({"event_timestamp": ts - timedelta(hours=1)})
-    lag_3_doc = collection.find_one({"event_timestamp": ts - timedelta(hours=3)})
-    lag_24_doc = collection.find_one({"event_timestamp": ts - timedelta(hours=24)})
+    if history is None:
+        history = load_lag_history(city, ts)
 
-    aqi_lag_1 = lag_1_doc["features"]["aqi"] if lag_1_doc else None
-    aqi_lag_3 = lag_3_doc["features"]["aqi"] if lag_3_doc else None
-    aqi_lag_24 = lag_24_doc["features"]["aqi"] if lag_24_doc else None
+    aqi_lag_1, aqi_lag_3, aqi_lag_24 = (
+        history.get(ts - timedelta(hours=lag)) for lag in LAG_HOURS
+    )
 
     # Trend feature
     aqi_change_rate = ((aqi_doc["aqi"] - aqi_lag_1)/aqi_lag_1) if aqi_lag_1 else None
@@ -92,8 +251,14 @@ def compute_features(aqi_doc):
         "month": ts.month
     }
 
-    # Merge weather
-    weather = fetch_weather(CITY)
+    # Pollutant sub-indices reported with the AQI
+    features.update(aqi_doc.get("pollutants") or {})
+
+    # Rolling windows: one O(1) update of the city's persisted state
+    if rolling_state is not None:
+        features.update(rolling_state.update(ts, features))
+
+    # Merge weather (fetched once per run by the caller)
     if weather:
         features.update(weather)
 
@@ -102,9 +267,9 @@ def compute_features(aqi_doc):
 # ------------------------------
 # Insert features into MongoDB
 # ------------------------------
-def store_features(ts, features):
+def store_features(ts, features, city: str = CITY):
     doc = {
-        "entity": {"city": CITY},
+        "entity": {"city": city},
         "event_timestamp": ts,
         "features": features,
         "feature_version": FEATURE_VERSION,
@@ -112,29 +277,212 @@ def store_features(ts, features):
         "created_at": datetime.utcnow()
     }
 
+    store = array_store()
+    if store is not None:
+        store.write_frame(city, pd.DataFrame([{"event_timestamp": ts, **features}]), variables=list(features))
+
+    if STORAGE_MODE == "timeseries":
+        replace_timeseries_records(feature_collection(), [doc], FEATURE_LAYOUT)
+        logger.info(f"Stored features for {ts}")
+        return
+
     # Idempotent insert: update if timestamp already exists
-    collection.update_one(
-        {"entity.city": CITY, "event_timestamp": ts},
+    feature_collection().update_one(
+        {"entity.city": city, "event_timestamp": ts},
         {"$set": doc},
         upsert=True
     )
     logger.info(f"Stored features for {ts}")
 
+# ------------------------------
+# Historical batch mode
+# ------------------------------
+def load_raw_series(city: str, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Raw hourly AQI + weather for [start, end] in a single query. Historical
+    hours come from ingestion.backfill.run_backfill, with the US AQI
+    computed from Open-Meteo concentrations as `aqi`.
+    """
+    cursor = raw_collection().find(
+        {"entity.city": city, "event_timestamp": {"$gte": start, "$lte": end}},
+        {"_id": 0, "event_timestamp": 1, "aqi": 1, **{name: 1 for name in POLLUTANT_FEATURES + WEATHER_FEATURES}}
+    ).sort("event_timestamp", 1)
+
+    raw = pd.DataFrame(list(cursor), columns=["event_timestamp", "aqi", *POLLUTANT_FEATURES, *WEATHER_FEATURES])
+    raw["event_timestamp"] = pd.to_datetime(raw["event_timestamp"])
+    return raw.drop_duplicates("event_timestamp", keep="last").reset_index(drop=True)
+
+def compute_features_frame(raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized equivalent of compute_features over an hourly series.
+    """
+    # The live path never stores hours without AQI, so they are neither
+    # feature rows nor lag sources here either
+    frame = raw[raw["aqi"].notna()]
+    frame = add_lag_features(frame, "aqi", LAG_HOURS)
+    frame = add_change_rate(frame, "aqi")
+    frame = add_time_features(frame)
+    # Same kernels as RollingWindowState, run over the whole series
+    frame = add_rolling_features(frame)
+    # Pollutants missing from the raw series come out as empty columns
+    return frame.reindex(columns=["event_timestamp", *FEATURE_COLUMNS])
+
+def store_features_batch(frame: pd.DataFrame, city: str = CITY) -> int:
+    """
+    Bulk upsert of a feature frame (one document per hour).
+    """
+    created_at = datetime.utcnow()
+    feature_cols = [c for c in frame.columns if c != "event_timestamp"]
+    values = frame[feature_cols].astype(object).where(frame[feature_cols].notna(), None)
+
+    docs = [
+        {
+            "entity": {"city": city},
+            "event_timestamp": ts.to_pydatetime(),
+            "features": row,
+            "feature_version": FEATURE_VERSION,
+            "source": "aqicn",
+            "created_at": created_at
+        }
+        for ts, row in zip(frame["event_timestamp"], values.to_dict("records"))
+    ]
+
+    store = array_store()
+    if store is not None:
+        store.write_frame(city, frame, variables=feature_cols)
+
+    collection = feature_collection()
+    if STORAGE_MODE == "timeseries":
+        for offset in range(0, len(docs), BATCH_WRITE_SIZE):
+            replace_timeseries_records(collection, docs[offset:offset + BATCH_WRITE_SIZE], FEATURE_LAYOUT)
+        logger.info(f"Stored {len(docs)} feature rows for {city}")
+        return len(docs)
+
+    result = bulk_upsert(collection, docs, FEATURE_KEY_FIELDS, batch_size=BATCH_WRITE_SIZE)
+    if result.errors:
+        logger.error(f"{len(result.errors)} feature rows failed to store for {city}")
+
+    logger.info(f"Stored {len(docs) - len(result.errors)} feature rows for {city}")
+    return len(docs) - len(result.errors)
+
+def materialize_chunk(
+    city: str,
+    start: datetime,
+    end: datetime,
+    manifest: FeatureManifest,
+    force: bool = False,
+    carried_dirty: Optional[pd.Timestamp] = None
+):
+    """
+    Incremental rebuild of [start, end]: hours whose raw input hash differs
+    from the manifest (for FEATURE_VERSION) are dirty, rows within the
+    dependency horizon of a dirty hour are recomputed, and only rows whose
+    features changed are rewritten. Returns (rows written, latest dirty
+    hour) so the next chunk can continue the horizon.
+    """
+    raw = load_raw_series(city, start - timedelta(hours=max(max(LAG_HOURS), ROLLING_WARMUP_HOURS)), end)
+    rows = raw[(raw["event_timestamp"] >= start) & (raw["event_timestamp"] <= end)].reset_index(drop=True)
+    if rows.empty:
+        logger.warning(f"No raw data for {city} between {start} and {end}")
+        return 0, carried_dirty
+
+    stored = {} if force else manifest.load(city, start, end, FEATURE_VERSION)
+    input_hashes = frame_hashes(rows, INPUT_COLUMNS)
+    dirty = np.array([stored.get(ts, {}).get("input_hash") != h for ts, h in zip(rows["event_timestamp"], input_hashes)])
+    affected = affected_mask(rows["event_timestamp"], dirty, carried_dirty=carried_dirty)
+    if dirty.any():
+        carried_dirty = rows["event_timestamp"][dirty].max()
+    if not affected.any():
+        logger.info(f"Features for {city} {start} -> {end} are up to date ({FEATURE_VERSION})")
+        return 0, carried_dirty
+
+    frame = compute_features_frame(raw)
+    frame = frame[frame["event_timestamp"].isin(rows["event_timestamp"][affected])]
+    features_hashes = frame_hashes(frame, FEATURE_COLUMNS)
+    changed = np.array([
+        stored.get(ts, {}).get("features_hash") != h for ts, h in zip(frame["event_timestamp"], features_hashes)
+    ], dtype=bool)
+    written = store_features_batch(frame[changed], city) if changed.any() else 0
+
+    # Hours without AQI have no feature row but are recorded as seen
+    by_hour = dict(zip(frame["event_timestamp"], features_hashes))
+    manifest.record(city, FEATURE_VERSION, [
+        (ts, input_hash, by_hour.get(ts))
+        for ts, input_hash, hit in zip(rows["event_timestamp"], input_hashes, affected) if hit
+    ])
+    logger.info(
+        f"{city} {start} -> {end}: {int(dirty.sum())} changed input hours, "
+        f"{int(affected.sum())} rows recomputed, {written} rewritten"
+    )
+    return written, carried_dirty
+
+def run_batch(start: datetime, end: datetime, city: str = CITY, force: bool = False) -> int:
+    """
+    Rebuild features for [start, end] from the raw hourly series in
+    BATCH_CHUNK_DAYS chunks, recomputing only what changed. A bumped
+    FEATURE_VERSION has no manifest entries yet, so the whole range is
+    recomputed; force=True does the same for the current version.
+    """
+    manifest = feature_manifest()
+    written, carried_dirty = 0, None
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=BATCH_CHUNK_DAYS) - timedelta(microseconds=1), end)
+        count, carried_dirty = materialize_chunk(city, chunk_start, chunk_end, manifest, force, carried_dirty)
+        written += count
+        chunk_start = chunk_end + timedelta(microseconds=1)
+    return written
+
 # ------------------------------
 # Main pipeline
 # ------------------------------
-def run_pipeline():
-    aqi_data = fetch_aqi(CITY)
+def run_pipeline(city: str = CITY, aqi_query: Optional[str] = None):
+    """
+    One live feature row for `city`. aqi_query is the AQICN feed to read
+    (a station such as "@8762"); it defaults to the city name. Skipped
+    when the inputs for this hour were already materialized unchanged.
+    """
+    aqi_data = fetch_aqi(aqi_query or city)
     if not aqi_data or aqi_data["aqi"] is None:
-        logger.warning("No AQI data, skipping pipeline run.")
-        return
+        logger.warning(f"No AQI data for {city}, skipping pipeline run.")
+        return None
+
+    weather = fetch_weather(city)
+    ts = aqi_data["timestamp"]
+    inputs = {"aqi": aqi_data["aqi"], **(aqi_data.get("pollutants") or {}), **(weather or {})}
+    input_hash = content_hash(inputs, INPUT_COLUMNS)
+    manifest = feature_manifest()
+    if manifest.input_hash(city, ts, FEATURE_VERSION) == input_hash:
+        logger.info(f"Inputs for {city} at {ts} unchanged, features already stored.")
+        return None
 
-    features = compute_features(aqi_data)
-    store_features(aqi_data["timestamp"], features)
-    logger.info("Feature pipeline run completed successfully.")
+    rolling_state = load_rolling_state(city, ts)
+    features = compute_features(aqi_data, weather=weather, city=city, rolling_state=rolling_state)
+    store_features(ts, features, city=city)
+    rolling_state_store().save(city, rolling_state)
+    manifest.record(city, FEATURE_VERSION, [(ts, input_hash, content_hash(features, FEATURE_COLUMNS))])
+    logger.info(f"Feature pipeline run completed successfully for {city}.")
+    return features
 
 # ------------------------------
 # Execute
 # ------------------------------
 if __name__ == "__main__":
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="AQI feature pipeline")
+    parser.add_argument("--from", dest="from_date", type=datetime.fromisoformat,
+                        help="Rebuild features from this UTC timestamp (batch mode)")
+    parser.add_argument("--to", dest="to_date", type=datetime.fromisoformat,
+                        help="Rebuild features up to this UTC timestamp (batch mode)")
+    parser.add_argument("--city", default=CITY)
+    parser.add_argument("--force", action="store_true",
+                        help="Batch mode: recompute every row, not only rows whose inputs changed")
+    args = parser.parse_args()
+
+    prepare_collections(get_db())
+
+    if args.from_date or args.to_date:
+        if not (args.from_date and args.to_date):
+            parser.error("--from and --to must be given together")
+        run_batch(args.from_date, args.to_date, city=args.city, force=args.force)
+    else:
+        run_pipeline(args.city)
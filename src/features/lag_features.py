@@ -0,0 +1,44 @@
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+LAG_HOURS = (1, 3, 24)
+
+
+def add_lag_features(
+    df: pd.DataFrame,
+    column: str = "aqi",
+    lags: Sequence[int] = LAG_HOURS,
+    time_col: str = "event_timestamp"
+) -> pd.DataFrame:
+    """
+    Add `{column}_lag_{k}` = value exactly k hours earlier, NaN when that
+    hour is missing.
+
+    Lags are looked up by timestamp rather than by row offset, so gaps in
+    the hourly series never shift values onto the wrong hour. Expects one
+    row per timestamp (a single entity).
+    """
+    df = df.copy()
+    series = pd.Series(df[column].to_numpy(), index=pd.DatetimeIndex(df[time_col]))
+    series = series[~series.index.duplicated(keep="last")]
+
+    for lag in lags:
+        lagged_index = pd.DatetimeIndex(df[time_col]) - pd.Timedelta(hours=lag)
+        df[f"{column}_lag_{lag}"] = series.reindex(lagged_index).to_numpy()
+
+    return df
+
+
+def add_change_rate(df: pd.DataFrame, column: str = "aqi") -> pd.DataFrame:
+    """
+    One-step relative change against `{column}_lag_1`; NaN when the lag is
+    missing or zero (mirrors the live path).
+    """
+    df = df.copy()
+    current = df[column].astype("float64")
+    previous = df[f"{column}_lag_1"].astype("float64")
+    valid = previous.notna() & (previous != 0)
+    df[f"{column}_change_rate"] = np.where(valid, (current - previous) / previous.where(valid, 1.0), np.nan)
+    return df
@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+import hashlib
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from src.features.rolling_features import ROLLING_WARMUP_HOURS
+from src.storage.mongo import bulk_upsert
+
+MANIFEST_COLLECTION = "feature_materializations"
+MANIFEST_KEY_FIELDS = ("city", "feature_version", "event_timestamp")
+# How far a changed input hour reaches into later feature rows: lags and
+# windows stop at 72h, the EWMAs at the rolling warm-up horizon
+DEPENDENCY_HOURS = ROLLING_WARMUP_HOURS
+# Feature values are compared at this precision, so recomputed rows whose
+# features only moved by float noise are not rewritten
+HASH_DECIMALS = 9
+
+
+# ------------------------------
+# Content hashes
+# ------------------------------
+def _canonical(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    # int 100 and float 100.0 hash alike; NaN and None both mean missing
+    return None if math.isnan(number) else round(number, HASH_DECIMALS)
+
+
+def content_hash(values: Mapping, columns: Optional[Sequence[str]] = None) -> str:
+    """
+    Stable short hash of a record's values (over `columns`, default all
+    keys). Independent of key order and of int/float/NaN representation.
+    """
+    keys = sorted(columns if columns is not None else values)
+    payload = json.dumps([[k, _canonical(values.get(k))] for k in keys], separators=(",", ":"))
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def frame_hashes(df: pd.DataFrame, columns: Sequence[str]) -> List[str]:
+    """content_hash of every row of `df` over `columns` (absent -> missing)."""
+    present = df.reindex(columns=list(columns))
+    return [content_hash(row, columns) for row in present.to_dict("records")]
+
+
+# ------------------------------
+# Planning
+# ------------------------------
+def affected_mask(
+    timestamps: pd.Series,
+    dirty: np.ndarray,
+    horizon_hours: int = DEPENDENCY_HOURS,
+    carried_dirty: Optional[pd.Timestamp] = None
+) -> np.ndarray:
+    """
+    Rows at or within `horizon_hours` after a dirty row (timestamps sorted
+    ascending). `carried_dirty` is a dirty hour before the first row, e.g.
+    from the previous chunk of a job.
+    """
+    ts = pd.to_datetime(pd.Series(timestamps)).reset_index(drop=True)
+    last_dirty = ts.where(pd.Series(dirty)).ffill()
+    if carried_dirty is not None:
+        last_dirty = last_dirty.fillna(carried_dirty)
+    age = (ts - last_dirty) / pd.Timedelta(hours=1)
+    return (age.notna() & (age <= horizon_hours)).to_numpy()
+
+
+class FeatureManifest:
+    """
+    Per (city, event_timestamp, feature_version) record of the input hash
+    a stored feature row was computed from and the hash of its features,
+    persisted in MongoDB.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def load(self, city: str, start: datetime, end: datetime, feature_version: str) -> Dict[pd.Timestamp, dict]:
+        """{event_timestamp: {"input_hash", "features_hash"}} for [start, end], one range query."""
+        cursor = self.collection.find(
+            {
+                "city": city.lower(),
+                "feature_version": feature_version,
+                "event_timestamp": {"$gte": start, "$lte": end}
+            },
+            {"_id": 0, "event_timestamp": 1, "input_hash": 1, "features_hash": 1}
+        )
+        return {pd.Timestamp(doc["event_timestamp"]): doc for doc in cursor}
+
+    def input_hash(self, city: str, event_timestamp: datetime, feature_version: str) -> Optional[str]:
+        doc = self.collection.find_one(
+            {"city": city.lower(), "feature_version": feature_version, "event_timestamp": event_timestamp},
+            {"_id": 0, "input_hash": 1}
+        )
+        return doc.get("input_hash") if doc else None
+
+    def record(
+        self,
+        city: str,
+        feature_version: str,
+        entries: Iterable[Tuple[datetime, str, Optional[str]]]
+    ) -> int:
+        """Upsert (event_timestamp, input_hash, features_hash) entries."""
+        updated_at = datetime.now(timezone.utc)
+        docs = [
+            {
+                "city": city.lower(),
+                "feature_version": feature_version,
+                "event_timestamp": pd.Timestamp(ts).to_pydatetime(),
+                "input_hash": input_hash,
+                "features_hash": features_hash,
+                "updated_at": updated_at
+            }
+            for ts, input_hash, features_hash in entries
+        ]
+        if not docs:
+            return 0
+        result = bulk_upsert(self.collection, docs, MANIFEST_KEY_FIELDS)
+        return len(docs) - len(result.errors)
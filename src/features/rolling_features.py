@@ -0,0 +1,302 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Mapping, Optional, Sequence
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.ingestion.openmeteo_historical_client import POLLUTANT_FIELDS
+
+ROLLING_WINDOWS = (3, 6, 24, 72)
+ROLLING_COLUMNS = ("aqi", *POLLUTANT_FIELDS)
+ROLLING_STATE_COLLECTION = "rolling_feature_state"
+WINDOW_STATS = ("mean", "max", "std")
+# History needed to rebuild a state: beyond 30 days the 72h EWMA weight of
+# older hours is below 1e-8, so warm-started and long-running states agree
+ROLLING_WARMUP_HOURS = 720
+# Hours of history the batch path processes per block (bounds memory)
+_BLOCK_HOURS = 4096
+
+
+def feature_names(columns: Sequence[str] = ROLLING_COLUMNS, windows: Sequence[int] = ROLLING_WINDOWS) -> List[str]:
+    names = []
+    for column in columns:
+        for window in windows:
+            names += [f"{column}_roll_{stat}_{window}h" for stat in WINDOW_STATS]
+            names.append(f"{column}_ewma_{window}h")
+    return names
+
+
+def ewma_alphas(windows: Sequence[int]) -> np.ndarray:
+    # Span convention: alpha = 2 / (span + 1)
+    return 2.0 / (np.asarray(windows, dtype="float64") + 1.0)
+
+
+# ------------------------------
+# Kernels shared by the live and batch paths
+# ------------------------------
+def window_stats(history: np.ndarray, windows: Sequence[int]) -> Dict[str, np.ndarray]:
+    """
+    Rolling mean/max/std over the last w hours of `history`, shape
+    (..., columns, max(windows)) ordered oldest -> newest with NaN for
+    missing hours. Missing hours are skipped; std is the sample std and
+    needs two values. Returns arrays of shape (..., columns) keyed
+    "{stat}_{w}".
+    """
+    history = np.ascontiguousarray(history, dtype="float64")
+    stats = {}
+    with warnings.catch_warnings():
+        # All-missing windows are expected and yield NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for window in windows:
+            recent = np.ascontiguousarray(history[..., -window:])
+            count = np.sum(~np.isnan(recent), axis=-1)
+            stats[f"mean_{window}"] = np.nanmean(recent, axis=-1)
+            stats[f"max_{window}"] = np.nanmax(recent, axis=-1)
+            std = np.nanstd(recent, axis=-1, ddof=1)
+            stats[f"std_{window}"] = np.where(count >= 2, std, np.nan)
+    return stats
+
+
+def ewma_step(ewma: np.ndarray, values: np.ndarray, alphas: np.ndarray) -> np.ndarray:
+    """
+    Advance EWMAs of shape (columns, windows) by one hour. A missing value
+    leaves the average unchanged; the first value seeds it.
+    """
+    current = values[:, np.newaxis]
+    updated = ewma + alphas * (current - ewma)
+    updated = np.where(np.isnan(ewma), current, updated)
+    return np.where(np.isnan(current), ewma, updated)
+
+
+def _stats_to_features(
+    stats: Dict[str, np.ndarray],
+    ewma: np.ndarray,
+    columns: Sequence[str],
+    windows: Sequence[int]
+) -> Dict[str, np.ndarray]:
+    features = {}
+    for c, column in enumerate(columns):
+        for w, window in enumerate(windows):
+            for stat in WINDOW_STATS:
+                features[f"{column}_roll_{stat}_{window}h"] = stats[f"{stat}_{window}"][..., c]
+            features[f"{column}_ewma_{window}h"] = ewma[..., c, w]
+    return features
+
+
+# ------------------------------
+# Live path: O(1) state per new hour
+# ------------------------------
+def to_hour(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return ts.floor("h")
+
+
+class RollingWindowState:
+    """
+    Per-city rolling state: a ring buffer of the last max(windows) hourly
+    values per column plus the running EWMAs. Each new hour costs a
+    constant amount of work regardless of how much history exists.
+
+    Hours skipped between updates count as missing. Re-sending the most
+    recent hour replaces its value.
+    """
+
+    def __init__(self, columns: Sequence[str] = ROLLING_COLUMNS, windows: Sequence[int] = ROLLING_WINDOWS):
+        self.columns = tuple(columns)
+        self.windows = tuple(windows)
+        self.capacity = max(self.windows)
+        self.alphas = ewma_alphas(self.windows)
+
+        self.buffer = np.full((len(self.columns), self.capacity), np.nan)
+        self.head = 0  # slot the next hour is written to
+        self.last_timestamp: Optional[pd.Timestamp] = None
+        self.ewma = np.full((len(self.columns), len(self.windows)), np.nan)
+        # EWMAs before the latest hour, so that hour can be rewritten
+        self.ewma_before_last = self.ewma.copy()
+
+    def _values(self, values: Mapping[str, Optional[float]]) -> np.ndarray:
+        return np.array(
+            [np.nan if values.get(c) is None else float(values[c]) for c in self.columns],
+            dtype="float64"
+        )
+
+    def _push(self, current: np.ndarray):
+        self.buffer[:, self.head] = current
+        self.head = (self.head + 1) % self.capacity
+        self.ewma_before_last = self.ewma
+        self.ewma = ewma_step(self.ewma, current, self.alphas)
+
+    def history(self) -> np.ndarray:
+        """Buffer ordered oldest -> newest, shape (columns, capacity)."""
+        return np.concatenate((self.buffer[:, self.head:], self.buffer[:, :self.head]), axis=1)
+
+    def update(self, ts, values: Mapping[str, Optional[float]]) -> Dict[str, Optional[float]]:
+        """
+        Add the hour `ts` and return the rolling features as of that hour.
+        """
+        self.advance(ts, values)
+        return self.features()
+
+    def advance(self, ts, values: Mapping[str, Optional[float]]):
+        """Add the hour `ts` without computing features."""
+        hour = to_hour(ts)
+        current = self._values(values)
+
+        if self.last_timestamp is not None and hour < self.last_timestamp:
+            raise ValueError(f"Out-of-order hour {hour} (state is at {self.last_timestamp})")
+
+        if self.last_timestamp is not None and hour == self.last_timestamp:
+            self.buffer[:, (self.head - 1) % self.capacity] = current
+            self.ewma = ewma_step(self.ewma_before_last, current, self.alphas)
+        else:
+            if self.last_timestamp is not None:
+                # Missing hours blank the window but never move the EWMAs
+                missing = int((hour - self.last_timestamp) / pd.Timedelta(hours=1)) - 1
+                for _ in range(min(missing, self.capacity)):
+                    self._push(np.full(len(self.columns), np.nan))
+            self._push(current)
+            self.last_timestamp = hour
+
+    @classmethod
+    def from_history(
+        cls,
+        history: pd.DataFrame,
+        columns: Sequence[str] = ROLLING_COLUMNS,
+        windows: Sequence[int] = ROLLING_WINDOWS,
+        time_col: str = "event_timestamp"
+    ) -> "RollingWindowState":
+        """Cold start: replay stored hourly rows into a new state."""
+        state = cls(columns, windows)
+        state.replay(history, time_col)
+        return state
+
+    def replay(self, history: pd.DataFrame, time_col: str = "event_timestamp") -> int:
+        """
+        Advance through stored hourly rows (any order), skipping rows
+        before the state's latest hour. Returns the number replayed.
+        """
+        replayed = 0
+        for row in history.sort_values(time_col).to_dict("records"):
+            if self.last_timestamp is not None and to_hour(row[time_col]) < self.last_timestamp:
+                continue
+            values = {c: (None if pd.isna(row.get(c)) else row.get(c)) for c in self.columns}
+            self.advance(row[time_col], values)
+            replayed += 1
+        return replayed
+
+    def features(self) -> Dict[str, Optional[float]]:
+        stats = window_stats(self.history()[np.newaxis], self.windows)
+        features = _stats_to_features(stats, self.ewma[np.newaxis], self.columns, self.windows)
+        return {name: (None if np.isnan(v[0]) else float(v[0])) for name, v in features.items()}
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    def to_document(self) -> dict:
+        return {
+            "columns": list(self.columns),
+            "windows": list(self.windows),
+            "head": self.head,
+            "last_timestamp": self.last_timestamp.to_pydatetime() if self.last_timestamp is not None else None,
+            "buffer": self.buffer.astype("float64").tobytes(),
+            "ewma": self.ewma.astype("float64").tobytes(),
+            "ewma_before_last": self.ewma_before_last.astype("float64").tobytes(),
+        }
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "RollingWindowState":
+        state = cls(doc["columns"], doc["windows"])
+        state.head = doc["head"]
+        state.last_timestamp = to_hour(doc["last_timestamp"]) if doc.get("last_timestamp") else None
+        state.buffer = np.frombuffer(doc["buffer"], dtype="float64").reshape(state.buffer.shape).copy()
+        state.ewma = np.frombuffer(doc["ewma"], dtype="float64").reshape(state.ewma.shape).copy()
+        state.ewma_before_last = np.frombuffer(
+            doc["ewma_before_last"], dtype="float64"
+        ).reshape(state.ewma.shape).copy()
+        return state
+
+
+class RollingStateStore:
+    """
+    Rolling states persisted in MongoDB, one small document per city.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def load(
+        self,
+        city: str,
+        columns: Sequence[str] = ROLLING_COLUMNS,
+        windows: Sequence[int] = ROLLING_WINDOWS
+    ) -> Optional[RollingWindowState]:
+        """The stored state, or None if missing or built for other columns/windows."""
+        doc = self.collection.find_one({"_id": city.lower()})
+        if not doc or doc["columns"] != list(columns) or doc["windows"] != list(windows):
+            return None
+        return RollingWindowState.from_document(doc)
+
+    def save(self, city: str, state: RollingWindowState):
+        self.collection.update_one(
+            {"_id": city.lower()},
+            {"$set": {**state.to_document(), "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+
+# ------------------------------
+# Batch path: the same kernels over a whole series
+# ------------------------------
+def add_rolling_features(
+    df: pd.DataFrame,
+    columns: Sequence[str] = ROLLING_COLUMNS,
+    windows: Sequence[int] = ROLLING_WINDOWS,
+    time_col: str = "event_timestamp"
+) -> pd.DataFrame:
+    """
+    Vectorized rolling features for one entity's hourly rows. Rows are
+    placed on a gap-free hourly grid (absent hours are missing values),
+    so results equal feeding the rows one by one to RollingWindowState.
+    Columns absent from `df` are treated as all-missing.
+    """
+    if df.empty:
+        df = df.copy()
+        for name in feature_names(columns, windows):
+            df[name] = pd.Series(dtype="float64")
+        return df
+
+    hours = pd.DatetimeIndex([to_hour(ts) for ts in df[time_col]])
+    grid = pd.date_range(hours.min(), hours.max(), freq="h")
+    values = np.full((len(grid), len(columns)), np.nan)
+    positions = grid.get_indexer(hours)
+    for c, column in enumerate(columns):
+        if column in df.columns:
+            # Last row wins for duplicate hours, as with repeated live updates
+            values[positions, c] = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64")
+
+    capacity = max(windows)
+    alphas = ewma_alphas(windows)
+
+    ewma = np.full((len(columns), len(windows)), np.nan)
+    ewmas = np.empty((len(grid), len(columns), len(windows)))
+    for t in range(len(grid)):
+        ewma = ewma_step(ewma, values[t], alphas)
+        ewmas[t] = ewma
+
+    padded = np.vstack([np.full((capacity - 1, len(columns)), np.nan), values])
+    # (hours, columns, capacity), oldest -> newest
+    windows_view = sliding_window_view(padded, capacity, axis=0)
+
+    outputs = {name: np.empty(len(grid)) for name in feature_names(columns, windows)}
+    for start in range(0, len(grid), _BLOCK_HOURS):
+        stop = min(start + _BLOCK_HOURS, len(grid))
+        stats = window_stats(windows_view[start:stop], windows)
+        block = _stats_to_features(stats, ewmas[start:stop], columns, windows)
+        for name, array in block.items():
+            outputs[name][start:stop] = array
+
+    rolled = pd.DataFrame({name: array[positions] for name, array in outputs.items()}, index=df.index)
+    return pd.concat([df.drop(columns=rolled.columns, errors="ignore"), rolled], axis=1)
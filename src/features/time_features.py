@@ -0,0 +1,13 @@
+import pandas as pd
+
+
+def add_time_features(df: pd.DataFrame, time_col: str = "event_timestamp") -> pd.DataFrame:
+    """
+    Calendar features (hour, day, month) from the event timestamp.
+    """
+    df = df.copy()
+    timestamps = pd.to_datetime(df[time_col])
+    df["hour"] = timestamps.dt.hour
+    df["day"] = timestamps.dt.day
+    df["month"] = timestamps.dt.month
+    return df
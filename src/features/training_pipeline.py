@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class AsOfSource:
+    """
+    One input to the training-set builder.
+
+    Each spine row receives the latest source row at or before its
+    timestamp (never after), within `tolerance`. Value columns are
+    suffixed with `_{name}`, and the matched source time is kept as
+    `{name}_event_timestamp` so lineage can be audited.
+    """
+
+    name: str
+    frame: pd.DataFrame
+    tolerance: Optional[pd.Timedelta] = None
+    columns: Optional[List[str]] = None
+    time_col: str = "event_timestamp"
+    # None for sources that are not per-entity (e.g. a global signal)
+    entity_col: Optional[str] = "city"
+    # False to only use values strictly before the spine timestamp
+    allow_exact_matches: bool = True
+
+
+def hourly_spine(
+    entities: Sequence[str],
+    start,
+    end,
+    entity_col: str = "city",
+    time_col: str = "event_timestamp"
+) -> pd.DataFrame:
+    """
+    Entity x hour grid covering [start, end].
+    """
+    hours = pd.date_range(_utc(start).floor("h"), _utc(end).floor("h"), freq="h")
+    index = pd.MultiIndex.from_product([list(entities), hours], names=[entity_col, time_col])
+    return index.to_frame(index=False)
+
+
+def build_training_set(
+    spine: pd.DataFrame,
+    sources: Sequence[AsOfSource],
+    entity_col: str = "city",
+    time_col: str = "event_timestamp"
+) -> pd.DataFrame:
+    """
+    Point-in-time correct join of every source onto an entity/timestamp
+    spine.
+
+    The spine is sorted once and each source is attached with a single
+    vectorized backward as-of join (grouped by entity), so rows missing
+    from one source no longer drop the whole hour and no value from the
+    future can leak into a row. Output rows follow the spine's order.
+    """
+    left = spine.copy()
+    left[time_col] = _utc_ns(left[time_col])
+    left["_spine_row"] = range(len(left))
+    left = left.sort_values(time_col, kind="stable")
+
+    for source in sources:
+        right = _prepare_source(source, entity_col, time_col)
+        left = pd.merge_asof(
+            left,
+            right,
+            on=time_col,
+            by=entity_col if source.entity_col else None,
+            direction="backward",
+            tolerance=source.tolerance,
+            allow_exact_matches=source.allow_exact_matches
+        )
+        logger.info(
+            f"As-of joined source '{source.name}'",
+            extra={"matched": int(left[f"{source.name}_event_timestamp"].notna().sum())}
+        )
+
+    result = left.sort_values("_spine_row").drop(columns="_spine_row")
+    result.index = spine.index
+    logger.info(f"Training set shape: {result.shape}")
+    return result
+
+
+def _prepare_source(source: AsOfSource, entity_col: str, time_col: str) -> pd.DataFrame:
+    frame = source.frame
+    keys = [source.entity_col] if source.entity_col else []
+    value_cols = source.columns or [
+        c for c in frame.columns if c not in keys + [source.time_col]
+    ]
+
+    right = frame[keys + [source.time_col] + value_cols].copy()
+    right = right.rename(columns={c: f"{c}_{source.name}" for c in value_cols})
+    if source.entity_col:
+        right = right.rename(columns={source.entity_col: entity_col})
+
+    right[source.time_col] = _utc_ns(right[source.time_col])
+    right = right.rename(columns={source.time_col: time_col})
+    right[f"{source.name}_event_timestamp"] = right[time_col]
+
+    # Last write wins for duplicate (entity, hour) rows
+    dedupe_keys = ([entity_col] if source.entity_col else []) + [time_col]
+    right = right.drop_duplicates(subset=dedupe_keys, keep="last")
+    return right.sort_values(time_col, kind="stable")
+
+
+def _utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _utc_ns(values: pd.Series) -> pd.Series:
+    return pd.to_datetime(values, utc=True).astype("datetime64[ns, UTC]")
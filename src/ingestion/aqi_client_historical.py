@@ -1,11 +1,13 @@
 # src/ingestion/aqi_client_historical.py
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-import requests
 import time
 import logging
 
+from src.ingestion.http_transport import HttpTransport, NO_RETRY, get_transport
+from src.ingestion.rate_limit import TokenBucket, backoff_delay
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -17,18 +19,30 @@ class AQICNHistoricalClient:
 
     BASE_URL = "https://api.waqi.info/feed"
 
-    def __init__(self, token: str, city: str):
+    def __init__(
+        self,
+        token: str,
+        city: str,
+        rate_limiter: Optional[TokenBucket] = None,
+        transport: Optional[HttpTransport] = None
+    ):
         self.token = token
         self.city = city.lower()
+        self.rate_limiter = rate_limiter
+        self.transport = transport or get_transport()
 
     def fetch_range(
         self, 
         start_date: datetime, 
         end_date: datetime, 
-        max_retries: int = 3
+        max_retries: int = 3,
+        max_workers: int = 1
     ) -> List[Dict[str, Any]]:
         """
-        Fetch hourly historical AQI from start_date to end_date
+        Fetch hourly historical AQI from start_date to end_date.
+
+        With max_workers > 1 days are fetched concurrently; results are
+        always returned in day order.
         """
 
         logger.info(
@@ -36,47 +50,63 @@ class AQICNHistoricalClient:
             extra={"city": self.city, "start_date": start_date, "end_date": end_date}
         )
 
-        results = []
-        current_date = start_date
-
         # AQICN may limit data per request; fetch day by day to be safe
-        while current_date <= end_date:
-            success = False
-            for attempt in range(1, max_retries + 1):
-                try:
-                    url = f"{self.BASE_URL}/{self.city}/history/"
-                    params = {
-                        "token": self.token,
-                        "date": current_date.strftime("%Y-%m-%d")
-                    }
+        days = [
+            start_date + timedelta(days=offset)
+            for offset in range((end_date - start_date).days + 1)
+        ]
+
+        if max_workers <= 1:
+            day_results = [self._fetch_day(day, max_retries) for day in days]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                day_results = list(pool.map(lambda day: self._fetch_day(day, max_retries), days))
+
+        results = [record for day_records in day_results for record in day_records]
+
+        logger.info("Finished historical AQI fetch", extra={"total_records": len(results)})
+        return results
+
+    def _fetch_day(self, day: datetime, max_retries: int) -> List[Dict[str, Any]]:
+        """
+        Fetch and normalize a single day, retrying with jittered backoff.
+        """
+        day_str = day.strftime("%Y-%m-%d")
 
-                    logger.info(f"Fetching historical AQI", extra={"date": current_date.strftime("%Y-%m-%d")})
+        for attempt in range(1, max_retries + 1):
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
 
-                    response = requests.get(url, params=params, timeout=15)
-                    response.raise_for_status()
-                    payload = response.json()
+                logger.info(f"Fetching historical AQI", extra={"date": day_str})
 
-                    if payload.get("status") != "ok":
-                        logger.warning("Non-ok response from AQICN", extra={"payload": payload})
-                        raise ValueError("Invalid AQICN response")
+                payload = self._get_payload(day_str)
 
-                    day_records = self._normalize(payload.get("data", {}))
-                    results.extend(day_records)
+                if payload.get("status") != "ok":
+                    logger.warning("Non-ok response from AQICN", extra={"payload": payload})
+                    raise ValueError("Invalid AQICN response")
 
-                    success = True
-                    break
+                return self._normalize(payload.get("data", {}))
 
-                except Exception as e:
-                    logger.error(f"Failed to fetch data for {current_date.strftime('%Y-%m-%d')} on attempt {attempt}", exc_info=True)
-                    time.sleep(2)  # backoff before retry
+            except Exception:
+                logger.error(f"Failed to fetch data for {day_str} on attempt {attempt}", exc_info=True)
+                if attempt < max_retries:
+                    time.sleep(backoff_delay(attempt))
 
-            if not success:
-                logger.error(f"Skipping {current_date.strftime('%Y-%m-%d')} after {max_retries} attempts")
+        logger.error(f"Skipping {day_str} after {max_retries} attempts")
+        return []
 
-            current_date += timedelta(days=1)
+    def _get_payload(self, day_str: str) -> Dict[str, Any]:
+        url = f"{self.BASE_URL}/{self.city}/history/"
+        params = {
+            "token": self.token,
+            "date": day_str
+        }
 
-        logger.info("Finished historical AQI fetch", extra={"total_records": len(results)})
-        return results
+        # _fetch_day owns the retry loop, so the transport must not retry too
+        response = self.transport.get(url, params=params, timeout=15, retry=NO_RETRY)
+        response.raise_for_status()
+        return response.json()
 
     def _normalize(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -1,7 +1,8 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime, timezone
 import requests
 
+from src.ingestion.http_transport import HttpTransport, get_transport
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -14,9 +15,10 @@ class AQICNLiveClient:
 
     BASE_URL = "https://api.waqi.info/feed"
 
-    def __init__(self, token: str, city: str):
+    def __init__(self, token: str, city: str, transport: Optional[HttpTransport] = None):
         self.token = token
         self.city = city.lower()
+        self.transport = transport or get_transport()
 
     def fetch(self) -> Dict[str, Any]:
         """
@@ -28,7 +30,7 @@ class AQICNLiveClient:
         logger.info("Fetching live AQI data", extra={"city": self.city})
 
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.transport.get(url, params=params, timeout=10)
             response.raise_for_status()
             payload = response.json()
 
@@ -1,7 +1,7 @@
-from typing import List, Dict, Any
-import requests
+from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 
+from src.ingestion.http_transport import HttpTransport, get_transport
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -14,9 +14,10 @@ class AQICNStationHistoricalClient:
 
     BASE_URL = "https://api.waqi.info/api/feed/@{station_id}/history/"
 
-    def __init__(self, token: str, station_id: int):
+    def __init__(self, token: str, station_id: int, transport: Optional[HttpTransport] = None):
         self.token = token
         self.station_id = station_id
+        self.transport = transport or get_transport()
 
     def fetch(self) -> List[Dict[str, Any]]:
         """
@@ -30,7 +31,7 @@ class AQICNStationHistoricalClient:
             extra={"station_id": self.station_id}
         )
 
-        response = requests.get(url, params=params, timeout=15)
+        response = self.transport.get(url, params=params, timeout=15)
         response.raise_for_status()
         payload = response.json()
 
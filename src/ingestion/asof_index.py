@@ -0,0 +1,95 @@
+from typing import Optional, Union
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DIRECTIONS = ("backward", "nearest")
+
+TimestampLike = Union[datetime, pd.Timestamp, str]
+
+
+class AsOfIndex:
+    """
+    Time-sorted, read-only view of an hourly frame for as-of lookups.
+
+    The frame is copied, its timestamps parsed to UTC and sorted once;
+    every lookup is then a binary search over an int64 array. The caller's
+    frame is never modified.
+    """
+
+    def __init__(self, df: pd.DataFrame, time_col: str = "event_timestamp"):
+        times = pd.to_datetime(df[time_col], utc=True)
+        order = np.argsort(pd.DatetimeIndex(times).asi8, kind="stable")
+
+        self.time_col = time_col
+        self.frame = df.iloc[order].reset_index(drop=True)
+        self.frame[time_col] = times.iloc[order].reset_index(drop=True)
+        self._times = pd.DatetimeIndex(self.frame[time_col]).asi8
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def locate(
+        self,
+        timestamps,
+        direction: str = "nearest",
+        tolerance: Optional[pd.Timedelta] = None
+    ) -> np.ndarray:
+        """
+        Row positions matching each timestamp, -1 where nothing qualifies.
+
+        backward: last row at or before the timestamp.
+        nearest: closest row either side; ties resolve to the earlier row.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}")
+
+        query = pd.to_datetime(pd.Index(np.atleast_1d(timestamps)), utc=True).asi8
+        if len(self._times) == 0:
+            return np.full(len(query), -1)
+
+        after = np.searchsorted(self._times, query, side="right")
+        before = after - 1
+        positions = before.copy()
+
+        if direction == "nearest":
+            last = len(self._times) - 1
+            never = np.iinfo("int64").max
+            next_pos = np.minimum(after, last)
+            dist_before = np.where(before >= 0, query - self._times[np.maximum(before, 0)], never)
+            dist_next = np.where(after <= last, self._times[next_pos] - query, never)
+            positions = np.where(dist_next < dist_before, next_pos, before)
+
+        matched = positions >= 0
+        if tolerance is not None:
+            distance = np.abs(query - self._times[np.maximum(positions, 0)])
+            matched &= distance <= pd.Timedelta(tolerance).value
+
+        return np.where(matched, positions, -1)
+
+    def lookup(
+        self,
+        timestamp: TimestampLike,
+        direction: str = "nearest",
+        tolerance: Optional[pd.Timedelta] = None
+    ) -> Optional[pd.Series]:
+        """
+        Single as-of lookup; None when no row qualifies.
+        """
+        position = self.locate(timestamp, direction, tolerance)[0]
+        return None if position < 0 else self.frame.iloc[position]
+
+    def lookup_many(
+        self,
+        timestamps,
+        direction: str = "nearest",
+        tolerance: Optional[pd.Timedelta] = None
+    ) -> pd.DataFrame:
+        """
+        Batch lookup: one row per input timestamp, in input order, all-NaN
+        where nothing qualifies.
+        """
+        positions = self.locate(timestamps, direction, tolerance)
+        matched = self.frame.reindex(np.where(positions >= 0, positions, -1))
+        return matched.reset_index(drop=True)
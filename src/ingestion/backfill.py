@@ -1,7 +1,19 @@
-from datetime import datetime, timedelta
-from mongo import MongoHandler
-from hourly_weather_client import fetch_weather_hourly
-from ingestion.aqi_client_live import fetch_aqi
+from datetime import datetime, time, timedelta
+from typing import Dict, Optional
+import pandas as pd
+from src.storage.mongo import MongoHandler
+from src.ingestion.backfill_engine import BackfillChunk, BackfillEngine, plan_chunks
+from src.ingestion.merge_data import (
+    US_AQI_LOOKBACK_HOURS,
+    _append_history,
+    _fetch_merged_window,
+    resolve_station_geo,
+)
+from src.ingestion.openmeteo_historical_client import POLLUTANT_FIELDS, OpenMeteoHistoricalAQIClient
+from src.ingestion.openmeteo_weather_historical_client import OpenMeteoWeatherHistoricalClient
+from src.ingestion.response_cache import ResponseCache
+from src.utils.mongo_client import get_database
+from src.utils.us_aqi import us_aqi_frame
 import os
 from dotenv import load_dotenv
 from time import sleep
@@ -13,47 +25,154 @@ STATE = os.getenv("STATE", "Sindh")
 COUNTRY = os.getenv("COUNTRY", "Pakistan")
 LATITUDE = float(os.getenv("LATITUDE", 24.8607))
 LONGITUDE = float(os.getenv("LONGITUDE", 67.0011))
+AQICN_TOKEN = os.getenv("AQICN_TOKEN")
+BACKFILL_JOB = "backfill_merged"
+# Days of hourly data requested from the Open-Meteo archive per call
+MAX_HOURLY_REQUEST_DAYS = 92
 
-mongo = MongoHandler()
 
+def fetch_weather_hourly(lat: float, lon: float, start_date: str, end_date: str):
+    """Hourly Open-Meteo weather records for [start_date, end_date] (YYYY-MM-DD)"""
+    client = OpenMeteoWeatherHistoricalClient(city=CITY.lower(), latitude=lat, longitude=lon)
+    records = client.fetch(
+        start_date=datetime.strptime(start_date, "%Y-%m-%d"),
+        end_date=datetime.strptime(end_date, "%Y-%m-%d")
+    )
+    return [
+        {"timestamp": record["event_timestamp"], "weather": record["weather"]}
+        for record in records
+    ]
 
-def run_hourly_backfill(start_date: str, end_date: str):
+
+def _utc_hour(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def fetch_pollutants_hourly(lat: float, lon: float, start_date: str, end_date: str) -> Dict[pd.Timestamp, dict]:
+    """
+    Hourly Open-Meteo pollutants for [start_date, end_date] (YYYY-MM-DD)
+    with the US AQI computed from them, keyed by UTC hour. The day before
+    start_date is fetched too so the 24h/8h averages are complete.
     """
-    Fetch hourly weather + AQI data and upsert into MongoDB
+    lookback_start = datetime.strptime(start_date, "%Y-%m-%d") - timedelta(hours=US_AQI_LOOKBACK_HOURS)
+    client = OpenMeteoHistoricalAQIClient(
+        latitude=lat,
+        longitude=lon,
+        start_date=lookback_start.date().isoformat(),
+        end_date=end_date,
+        city=CITY
+    )
+    frame = client.fetch_frame()
+    frame[["us_aqi", "dominant_pollutant"]] = us_aqi_frame(frame)[["us_aqi", "dominant_pollutant"]]
+
+    pollutants = {}
+    for row in frame.to_dict("records"):
+        values = {name: (None if pd.isna(row[name]) else float(row[name])) for name in POLLUTANT_FIELDS}
+        pollutants[_utc_hour(row["event_timestamp"])] = {
+            "aqi": {
+                "us_aqi": None if pd.isna(row["us_aqi"]) else float(row["us_aqi"]),
+                "dominant_pollutant": row["dominant_pollutant"]
+            },
+            "pollutants": values
+        }
+    return pollutants
+
+
+def run_hourly_backfill(start_date: str, end_date: str, batch_size_days: Optional[int] = None):
     """
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    current = start
+    Fetch hourly weather + pollutants and upsert into MongoDB
+
+    Both come from the Open-Meteo archives, with the US AQI computed from
+    the pollutant concentrations, so every hour carries the values of that
+    hour. Hours without pollutant data are stored with aqi.us_aqi None.
 
-    while current <= end:
-        day_str = current.strftime("%Y-%m-%d")
-        print(f"[Backfill] Fetching {CITY} hourly data for {day_str}")
+    Data is requested batch_size_days at a time (default: as much as one
+    archive request allows) and split into days locally, so a month costs
+    one request instead of thirty.
+    """
+    mongo = MongoHandler()
+    chunks = plan_chunks(start_date, end_date, batch_size_days or MAX_HOURLY_REQUEST_DAYS)
 
-        # 1️⃣ Fetch hourly weather
-        weather_data = fetch_weather_hourly(LATITUDE, LONGITUDE, start_date=day_str, end_date=day_str)
+    for chunk in chunks:
+        print(f"[Backfill] Fetching {CITY} hourly data for {chunk.start} → {chunk.end}")
 
-        # 2️⃣ Merge AQI from IQAir for the day
-        aqi_data = fetch_aqi(CITY, STATE, COUNTRY)
+        # 1️⃣ Fetch hourly weather and pollutants for the whole chunk
+        weather_data = fetch_weather_hourly(
+            LATITUDE, LONGITUDE, start_date=chunk.start.isoformat(), end_date=chunk.end.isoformat()
+        )
+        pollutant_data = fetch_pollutants_hourly(
+            LATITUDE, LONGITUDE, start_date=chunk.start.isoformat(), end_date=chunk.end.isoformat()
+        )
 
-        # 3️⃣ Combine weather + AQI
-        records_to_upsert = []
+        # 2️⃣ Split into days and combine weather + pollutants of the same hour
+        created_at = datetime.utcnow().isoformat()
+        records_by_day = {}
+        missing_aqi = {"aqi": {"us_aqi": None, "dominant_pollutant": None}, "pollutants": {}}
         for hour_record in weather_data:
             record = {
                 "city": CITY,
                 **hour_record,
-                **aqi_data,
-                "source_aqi": "IQAir",
+                **pollutant_data.get(_utc_hour(hour_record["timestamp"]), missing_aqi),
+                "source_aqi": "Open-Meteo",
                 "source_weather": "Open-Meteo",
-                "created_at": datetime.utcnow().isoformat()
+                "created_at": created_at
             }
-            records_to_upsert.append(record)
+            records_by_day.setdefault(hour_record["timestamp"].date(), []).append(record)
+
+        for day, day_records in sorted(records_by_day.items()):
+            if len(day_records) != 24:
+                print(f"[Backfill] {day}: {len(day_records)}/24 hours returned")
+        missing_days = chunk.days - len(records_by_day)
+        if missing_days:
+            print(f"[Backfill] {missing_days} days without data in {chunk.start} → {chunk.end}")
+
+        # 3️⃣ Bulk upsert the chunk
+        records_to_upsert = [r for day in sorted(records_by_day) for r in records_by_day[day]]
+        if records_to_upsert:
+            result = mongo.upsert_records(records_to_upsert)
+            print(f"[Backfill] Stored {len(records_to_upsert) - len(result.errors)} hourly rows")
+
+        # Pause between requests to respect API limits
+        if chunk is not chunks[-1]:
+            sleep(1)
+
+
+def run_backfill(
+    start_date: str,
+    end_date: str,
+    batch_size_days: int = 10,
+    city: str = CITY,
+    token: str = AQICN_TOKEN,
+    max_workers: int = 1,
+    use_cache: bool = True,
+    db=None
+):
+    """
+    Checkpointed backfill of merged pollutants + weather into
+    MERGED_COLLECTION, one Open-Meteo window per batch_size_days chunk.
+    The same hours go to RAW_COLLECTION with the computed US AQI as `aqi`,
+    the target the feature pipeline's batch mode (--from/--to) trains on.
+    Completion is checkpointed per day, so a rerun (with any batch size)
+    only fetches days not yet written.
+    """
+    city = city.lower()
+    if db is None:
+        db = get_database()
+    cache = ResponseCache() if use_cache else None
+    geo = resolve_station_geo(city, token)
 
-        # 4️⃣ Upsert batch
-        mongo.upsert_records(records_to_upsert)
+    def process_chunk(chunk: BackfillChunk) -> int:
+        start = datetime.combine(chunk.start, time.min)
+        end = datetime.combine(chunk.end, time(23))
+        merged = _fetch_merged_window(city, token, start, end, cache, geo=geo)
+        if merged.empty:
+            return 0
+        _append_history(db, city, merged)
+        return len(merged)
 
-        # Sleep between days to respect API limits
-        sleep(1)
-        current += timedelta(days=1)
+    engine = BackfillEngine(f"{BACKFILL_JOB}:{city}", process_chunk, max_workers=max_workers)
+    return engine.run(start_date, end_date, batch_size_days)
 
 
 if __name__ == "__main__":
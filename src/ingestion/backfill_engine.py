@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Union
+import json
+import os
+import threading
+
+from src.ingestion.rate_limit import TokenBucket
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_CHECKPOINT_DIR = os.getenv(
+    "AQI_BACKFILL_CHECKPOINT_DIR", os.path.join(PROJECT_ROOT, ".cache", "backfill")
+)
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class BackfillChunk:
+    """Inclusive range of whole days processed as one unit."""
+
+    start: date
+    end: date
+
+    @property
+    def key(self) -> str:
+        return f"{self.start.isoformat()}_{self.end.isoformat()}"
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days + 1
+
+    def dates(self) -> List[date]:
+        return [self.start + timedelta(days=offset) for offset in range(self.days)]
+
+
+def _as_date(value: Union[str, date, datetime]) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def plan_chunks(start_date, end_date, batch_size_days: int) -> List[BackfillChunk]:
+    """
+    Split [start_date, end_date] (inclusive) into consecutive chunks of
+    batch_size_days; the last one may be shorter.
+    """
+    start, end = _as_date(start_date), _as_date(end_date)
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=batch_size_days - 1), end)
+        chunks.append(BackfillChunk(start, chunk_end))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+class BackfillCheckpoint:
+    """
+    Per-day completion state for one job, persisted as JSON.
+
+    Days rather than chunks are recorded, so a rerun with a different
+    batch_size_days still skips everything already written. Every update
+    rewrites the file atomically (write + rename), so a crash leaves
+    either the previous or the new state, never a partial file.
+    """
+
+    def __init__(self, job: str, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.job = job
+        self.path = os.path.join(directory, f"{job.replace(':', '_').replace('/', '_')}.json")
+        self._lock = threading.Lock()
+        self._days: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            state = json.load(f)
+
+        days = state.get("days", {})
+        # Checkpoints written per chunk ("<start>_<end>" keys)
+        for key, entry in state.get("chunks", {}).items():
+            start, end = (_as_date(part) for part in key.split("_"))
+            for day in BackfillChunk(start, end).dates():
+                days.setdefault(day.isoformat(), entry)
+        return days
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"job": self.job, "days": self._days}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def is_day_done(self, day: date) -> bool:
+        return self._days.get(day.isoformat(), {}).get("status") == STATUS_DONE
+
+    def is_done(self, chunk: BackfillChunk) -> bool:
+        return all(self.is_day_done(day) for day in chunk.dates())
+
+    def pending(self, chunk: BackfillChunk) -> List[BackfillChunk]:
+        """Runs of consecutive days of `chunk` not yet done."""
+        runs: List[BackfillChunk] = []
+        for day in chunk.dates():
+            if self.is_day_done(day):
+                continue
+            if runs and runs[-1].end == day - timedelta(days=1):
+                runs[-1] = BackfillChunk(runs[-1].start, day)
+            else:
+                runs.append(BackfillChunk(day, day))
+        return runs
+
+    def mark(self, chunk: BackfillChunk, status: str, **details):
+        with self._lock:
+            entry = {
+                "status": status,
+                "chunk": chunk.key,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                **details,
+            }
+            for day in chunk.dates():
+                self._days[day.isoformat()] = entry
+            self._save()
+
+    def reset(self):
+        with self._lock:
+            self._days = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class BackfillEngine:
+    """
+    Runs `process_chunk(chunk) -> rows written` over a date range in
+    checkpointed chunks.
+
+    Days already marked done are skipped, so a rerun after a crash (with
+    any batch size) resumes where the previous one stopped: a partly done
+    chunk only runs its pending days. Pending chunks run on up to
+    `max_workers` threads; each start takes a token from `rate_limiter`
+    when one is given. A failing chunk is recorded and retried on the
+    next run instead of aborting the others.
+    """
+
+    def __init__(
+        self,
+        job: str,
+        process_chunk: Callable[[BackfillChunk], int],
+        checkpoint: Optional[BackfillCheckpoint] = None,
+        max_workers: int = 1,
+        rate_limiter: Optional[TokenBucket] = None
+    ):
+        self.job = job
+        self.process_chunk = process_chunk
+        self.checkpoint = checkpoint or BackfillCheckpoint(job)
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter
+
+    def run(self, start_date, end_date, batch_size_days: int) -> Dict[str, int]:
+        chunks = plan_chunks(start_date, end_date, batch_size_days)
+        pending = [run for chunk in chunks for run in self.checkpoint.pending(chunk)]
+        skipped = sum(self.checkpoint.is_done(chunk) for chunk in chunks)
+        summary = {"chunks": len(chunks), "skipped": skipped, "done": 0, "failed": 0, "rows": 0}
+
+        logger.info(
+            f"Backfill {self.job}: {sum(run.days for run in pending)} days pending in {len(pending)} chunks",
+            extra={"checkpoint": self.checkpoint.path}
+        )
+
+        if self.max_workers <= 1:
+            for chunk in pending:
+                self._count(summary, self._run_chunk(chunk))
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [pool.submit(self._run_chunk, chunk) for chunk in pending]
+                for future in as_completed(futures):
+                    self._count(summary, future.result())
+
+        logger.info(f"Backfill {self.job} finished: {summary}")
+        return summary
+
+    @staticmethod
+    def _count(summary: Dict[str, int], rows: Optional[int]):
+        if rows is None:
+            summary["failed"] += 1
+        else:
+            summary["done"] += 1
+            summary["rows"] += rows
+
+    def _run_chunk(self, chunk: BackfillChunk) -> Optional[int]:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        try:
+            rows = int(self.process_chunk(chunk) or 0)
+        except Exception as e:
+            logger.error(f"Backfill chunk {chunk.key} failed: {e}", exc_info=True)
+            self.checkpoint.mark(chunk, STATUS_FAILED, error=str(e))
+            return None
+
+        self.checkpoint.mark(chunk, STATUS_DONE, rows=rows)
+        logger.info(f"Backfill chunk {chunk.key} done ({rows} rows)")
+        return rows
@@ -0,0 +1,181 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from src.ingestion.merge_data import (
+    MERGED_COLLECTION,
+    _append_merged,
+    _fetch_merged_window,
+    resolve_station_geo,
+)
+from src.ingestion.openmeteo_historical_client import OpenMeteoHistoricalAQIClient
+from src.ingestion.openmeteo_weather_historical_client import OpenMeteoWeatherHistoricalClient
+from src.ingestion.response_cache import ResponseCache
+from src.storage.coverage import MissingRange, coverage_report, missing_ranges
+from src.utils.logger import get_logger
+from src.utils.mongo_client import get_database
+
+logger = get_logger(__name__)
+
+# Longest date range a single request may cover, per endpoint
+ENDPOINT_MAX_DAYS: Dict[str, int] = {
+    OpenMeteoHistoricalAQIClient.BASE_URL: 92,
+    OpenMeteoWeatherHistoricalClient.BASE_URL: 366,
+}
+# Gaps this close together are fetched in one request (the hours in
+# between are already stored and simply re-fetched)
+DEFAULT_BRIDGE_HOURS = 48
+
+
+@dataclass(frozen=True)
+class RepairRequest:
+    """One windowed fetch covering one or more gaps of a city."""
+
+    city: str
+    start: datetime
+    # Exclusive
+    end: datetime
+    gaps: List[MissingRange]
+
+    @property
+    def days(self) -> int:
+        return (_last_hour(self.end).date() - self.start.date()).days + 1
+
+    @property
+    def missing_hours(self) -> int:
+        return sum(gap.hours for gap in self.gaps)
+
+
+def _last_hour(end: datetime) -> datetime:
+    return end - timedelta(hours=1)
+
+
+def plan_repair_requests(
+    gaps: Iterable[MissingRange],
+    max_days: Optional[int] = None,
+    bridge_hours: int = DEFAULT_BRIDGE_HOURS
+) -> List[RepairRequest]:
+    """
+    Merge gaps into the fewest windowed requests.
+
+    Consecutive gaps of a city are folded into one request while the
+    stored hours between them are at most `bridge_hours` and the window
+    spans at most `max_days` calendar days (the endpoints take whole
+    dates). Gaps longer than that are split.
+    """
+    max_days = max_days or min(ENDPOINT_MAX_DAYS.values())
+    max_span = timedelta(days=max_days)
+
+    requests: List[RepairRequest] = []
+    for gap in sorted(_split(gaps, max_span), key=lambda g: (g.city, g.start)):
+        current = requests[-1] if requests else None
+        if (
+            current is not None
+            and current.city == gap.city
+            and gap.start - current.end <= timedelta(hours=bridge_hours)
+            and (_last_hour(gap.end).date() - current.start.date()).days < max_days
+        ):
+            requests[-1] = RepairRequest(gap.city, current.start, gap.end, current.gaps + [gap])
+        else:
+            requests.append(RepairRequest(gap.city, gap.start, gap.end, [gap]))
+    return requests
+
+
+def _split(gaps: Iterable[MissingRange], max_span: timedelta) -> List[MissingRange]:
+    pieces = []
+    for gap in gaps:
+        start = gap.start
+        while start < gap.end:
+            # Stay within max_span calendar days of the first one
+            limit = datetime.combine(start.date(), datetime.min.time()) + max_span
+            end = min(gap.end, limit)
+            pieces.append(MissingRange(gap.city, start, end))
+            start = end
+    return pieces
+
+
+def find_gaps(
+    db,
+    start: datetime,
+    end: datetime,
+    cities: Optional[Iterable[str]] = None,
+    collection_name: str = MERGED_COLLECTION
+) -> List[MissingRange]:
+    """
+    Missing hours in [start, end) per city, computed server-side.
+    """
+    cities = list(cities) if cities is not None else None
+    days = coverage_report(db[collection_name], start=start, end=end, cities=cities)
+    gaps = missing_ranges(days, start=start, end=end)
+
+    # Cities with no stored hour at all in the window are missing entirely
+    covered = {day.city for day in days}
+    gaps += [MissingRange(city, start, end) for city in cities or [] if city not in covered]
+    return gaps
+
+
+def repair_gaps(
+    token: str,
+    start: datetime,
+    end: datetime,
+    cities: Iterable[str],
+    db=None,
+    use_cache: bool = False,
+    max_days: Optional[int] = None,
+    bridge_hours: int = DEFAULT_BRIDGE_HOURS,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Re-fetch only the missing hours of MERGED_COLLECTION in [start, end)
+    and bulk-upsert them. Returns counts of gaps, requests and repaired
+    hours. The cache is off by default because archived responses are
+    what left the holes in the first place.
+    """
+    if db is None:
+        db = get_database()
+    cities = [city.lower() for city in cities]
+    cache = ResponseCache() if use_cache else None
+
+    gaps = find_gaps(db, start, end, cities)
+    requests = plan_repair_requests(gaps, max_days, bridge_hours)
+    summary = {
+        "gaps": len(gaps),
+        "missing_hours": sum(gap.hours for gap in gaps),
+        "requests": len(requests),
+        "repaired_hours": 0,
+    }
+    logger.info(f"{summary['gaps']} gaps ({summary['missing_hours']} hours) -> {len(requests)} requests")
+    if dry_run:
+        return summary
+
+    geo_by_city = {}
+    for request in requests:
+        if request.city not in geo_by_city:
+            geo_by_city[request.city] = resolve_station_geo(request.city, token)
+
+        merged = _fetch_merged_window(
+            request.city, token, request.start, _last_hour(request.end), cache, geo=geo_by_city[request.city]
+        )
+        rows = _rows_in_gaps(merged, request.gaps)
+        if rows.empty:
+            logger.warning(f"No data returned for {request.city} {request.start} -> {request.end}")
+            continue
+
+        _append_merged(db[MERGED_COLLECTION], request.city, rows)
+        summary["repaired_hours"] += len(rows)
+        logger.info(f"Repaired {len(rows)}/{request.missing_hours} hours for {request.city} from {request.start}")
+
+    return summary
+
+
+def _rows_in_gaps(merged: pd.DataFrame, gaps: List[MissingRange]) -> pd.DataFrame:
+    """Keep only fetched hours that fall inside a gap; stored hours stay untouched."""
+    if merged.empty:
+        return merged
+    times = pd.to_datetime(merged["event_timestamp"], utc=True)
+    mask = pd.Series(False, index=merged.index)
+    for gap in gaps:
+        mask |= (times >= pd.Timestamp(gap.start, tz="UTC")) & (times < pd.Timestamp(gap.end, tz="UTC"))
+    return merged[mask].reset_index(drop=True)
@@ -0,0 +1,191 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.ingestion.rate_limit import TokenBucket, backoff_delay
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Retry/backoff rules applied by HttpTransport to every request.
+    """
+
+    max_attempts: int = 3
+    backoff_base: float = 1.0
+    backoff_cap: float = 30.0
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+
+# For callers that run their own retry loop around the transport
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+# Requests per second (and burst) per host, shared by every thread and
+# city in the process. Open-Meteo's free tier allows 600 calls/minute
+# per client across its hosts.
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "api.waqi.info": (5.0, 5.0),
+    "air-quality-api.open-meteo.com": (4.0, 4.0),
+    "archive-api.open-meteo.com": (4.0, 4.0),
+    "api.openweathermap.org": (1.0, 5.0),
+}
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class HttpTransport:
+    """
+    Shared HTTP layer for the ingestion clients.
+
+    Wraps a keep-alive requests.Session (one connection pool per host),
+    applies a retry/backoff policy, caps concurrent requests and request
+    rate per host and keeps per-host timing counters.
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 16,
+        max_per_host: int = 8,
+        retry: RetryPolicy = RetryPolicy(),
+        default_timeout: float = 15,
+        rate_limits: Optional[Dict[str, Tuple[float, float]]] = None
+    ):
+        self.retry = retry
+        self.max_per_host = max_per_host
+        self.default_timeout = default_timeout
+        self._rate_limits: Dict[str, TokenBucket] = {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._stats: Dict[str, HostStats] = {}
+        self._lock = threading.Lock()
+
+        for host, (rate, capacity) in (rate_limits or {}).items():
+            self.set_rate_limit(host, rate, capacity)
+
+    def get(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None
+    ) -> requests.Response:
+        """
+        GET with pooling, retries and per-host limits.
+
+        Retryable statuses are retried according to the policy; the last
+        response is returned as-is so callers keep using raise_for_status().
+        Connection errors are re-raised once the attempts are exhausted.
+        """
+        policy = retry or self.retry
+        host = urlsplit(url).netloc
+        slot = self._host_slot(host)
+        bucket = self._rate_limits.get(host)
+
+        for attempt in range(1, policy.max_attempts + 1):
+            if bucket is not None:
+                bucket.acquire()
+            started = time.perf_counter()
+            try:
+                with slot:
+                    response = self.session.get(
+                        url,
+                        params=params,
+                        timeout=timeout or self.default_timeout
+                    )
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(host, time.perf_counter() - started, error=True, retried=attempt > 1)
+                if attempt == policy.max_attempts:
+                    raise
+                logger.warning(
+                    f"Request to {host} failed on attempt {attempt}, retrying",
+                    exc_info=True
+                )
+                time.sleep(backoff_delay(attempt, policy.backoff_base, policy.backoff_cap))
+                continue
+
+            retryable = response.status_code in policy.retry_statuses
+            self._record(host, time.perf_counter() - started, error=retryable, retried=attempt > 1)
+
+            if not retryable or attempt == policy.max_attempts:
+                return response
+
+            logger.warning(
+                f"{host} returned {response.status_code} on attempt {attempt}, retrying"
+            )
+            time.sleep(self._retry_after(response, attempt, policy))
+
+        return response
+
+    def set_rate_limit(self, host: str, rate: float, capacity: Optional[float] = None):
+        """
+        Cap requests to `host` at `rate` per second (bursts up to capacity).
+        """
+        with self._lock:
+            self._rate_limits[host] = TokenBucket(rate, capacity)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-host request counters and latency totals.
+        """
+        with self._lock:
+            return {host: asdict(stats) for host, stats in self._stats.items()}
+
+    def close(self):
+        self.session.close()
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def _record(self, host: str, seconds: float, error: bool, retried: bool):
+        with self._lock:
+            stats = self._stats.setdefault(host, HostStats())
+            stats.requests += 1
+            stats.errors += int(error)
+            stats.retries += int(retried)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    @staticmethod
+    def _retry_after(response: requests.Response, attempt: int, policy: RetryPolicy) -> float:
+        header = response.headers.get("Retry-After")
+        if header and header.isdigit():
+            return min(float(header), policy.backoff_cap)
+        return backoff_delay(attempt, policy.backoff_base, policy.backoff_cap)
+
+
+_shared_transport: Optional[HttpTransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """
+    Process-wide transport used by default by every ingestion client.
+    """
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = HttpTransport(rate_limits=DEFAULT_RATE_LIMITS)
+        return _shared_transport
@@ -9,36 +9,88 @@ sys.path.insert(0, PROJECT_ROOT)
 print("Project root added to sys.path:", PROJECT_ROOT)
 import pandas as pd
 from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Union
 from src.ingestion.aqi_client_live import AQICNLiveClient
-from src.ingestion.openmeteo_historical_client import OpenMeteoHistoricalAQIClient
-from src.ingestion.openmeteo_weather_historical_client import OpenMeteoWeatherHistoricalClient
+from src.ingestion.asof_index import AsOfIndex
+from src.ingestion.openmeteo_historical_client import POLLUTANT_FIELDS, OpenMeteoHistoricalAQIClient
+from src.ingestion.openmeteo_weather_historical_client import WEATHER_FIELDS, OpenMeteoWeatherHistoricalClient
+from src.ingestion.response_cache import ARCHIVE_AFTER_DAYS, ResponseCache
 from src.ingestion.station_resolver import AQICNStationResolver
+from src.ingestion.watermark import WATERMARK_COLLECTION, WatermarkStore
+from src.storage.mongo import bulk_upsert
+from src.utils.data_contract import validate_merged_record
 from src.utils.logger import get_logger
+from src.utils.mongo_client import get_database
+from src.utils.us_aqi import AVERAGING_HOURS, POLLUTANTS, us_aqi_frame
 
 logger = get_logger(__name__)
 
-def flatten_dataframe(df: pd.DataFrame, column_to_flatten: str, suffix: str) -> pd.DataFrame:
-    """Flatten a nested dict column and suffix new columns"""
-    if column_to_flatten in df.columns:
-        flat_cols = df[column_to_flatten].apply(pd.Series)
+MERGED_COLLECTION = "merged_aqi_weather_hourly"
+# Raw hourly series the feature pipeline builds features from
+# (feature_pipeline.RAW_COLLECTION_NAME)
+RAW_COLLECTION = "raw_aqi_weather"
+MERGE_JOB = "merge_historical"
+HISTORY_DAYS = 120
+INCREMENTAL_OVERLAP_HOURS = 6
+# A watermark held back by an hour older than this is logged as stalled
+WATERMARK_STALL_HOURS = 24
+# Extra pollutant history fetched before a window so the US-AQI averages
+# (24h PM, 8h O3/CO) are complete from its first hour
+US_AQI_LOOKBACK_HOURS = max(AVERAGING_HOURS.values())
+
+def flatten_dataframe(
+    df: pd.DataFrame,
+    column_to_flatten: str,
+    suffix: Optional[str],
+    keys: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """Flatten a nested dict column and suffix new columns.
+
+    Built in one pass with DataFrame.from_records instead of a Series per
+    row. Non-dict cells (None/NaN) flatten to all-missing. With keys the
+    output columns are fixed to that schema: missing keys become NaN
+    columns and unknown keys are dropped.
+    """
+    if column_to_flatten not in df.columns:
+        return df
+
+    values = [v if isinstance(v, dict) else {} for v in df[column_to_flatten].tolist()]
+    flat_cols = pd.DataFrame.from_records(
+        values,
+        index=df.index,
+        columns=list(keys) if keys is not None else None
+    )
+    if suffix:
         flat_cols = flat_cols.add_suffix(f"_{suffix}")
-        df = pd.concat([df.drop(columns=[column_to_flatten]), flat_cols], axis=1)
-    return df
+    return pd.concat([df.drop(columns=[column_to_flatten]), flat_cols], axis=1)
 
-def merge_historical_data(city: str, token: str):
-    """Fetch and merge historical pollutants + weather into a single dataframe"""
-    logger.info(f"Fetching and merging historical data for {city}")
+def resolve_station_geo(city: str, token: str) -> Sequence[float]:
+    """(lat, lon) of the city's AQICN station"""
+    resolver = AQICNStationResolver(token=token, city=city)
+    return resolver.resolve()["geo"]
 
+def _fetch_merged_window(
+    city: str,
+    token: str,
+    start_date_dt: datetime,
+    end_date_dt: datetime,
+    cache: Optional[ResponseCache],
+    geo: Optional[Sequence[float]] = None
+) -> pd.DataFrame:
+    """Fetch pollutants + weather for [start, end] and inner-join on timestamp
+
+    geo (lat, lon) skips the station lookup when the caller already has it.
+    Rows carry `us_aqi` (EPA index from the Open-Meteo concentrations), the
+    per-pollutant sub-indices `aqi_<pollutant>` and the `dominant_pollutant`,
+    so historical targets match the AQICN scale.
+    """
     # --- Resolve AQI station ---
-    resolver = AQICNStationResolver(token=token, city=city)
-    station = resolver.resolve()
-    lat, lon = station["geo"]
+    if geo is None:
+        geo = resolve_station_geo(city, token)
+    lat, lon = geo
 
-    # --- Date range for last 120 days ---
-    end_date_dt = datetime.utcnow()
-    start_date_dt = end_date_dt - timedelta(days=120)
     # AQI client expects YYYY-MM-DD strings
-    start_date_str = start_date_dt.date().isoformat()
+    start_date_str = (start_date_dt - timedelta(hours=US_AQI_LOOKBACK_HOURS)).date().isoformat()
     end_date_str = end_date_dt.date().isoformat()
 
     # --- Historical pollutants (AQI) ---
@@ -46,31 +98,213 @@ def merge_historical_data(city: str, token: str):
         latitude=lat,
         longitude=lon,
         start_date=start_date_str,
-        end_date=end_date_str
+        end_date=end_date_str,
+        cache=cache,
+        city=city
+    )
+    pollutants_df = pollutants_client.fetch_frame().rename(
+        columns={name: f"{name}_pollutants" for name in POLLUTANT_FIELDS}
     )
-    pollutants_df = pd.DataFrame(pollutants_client.fetch())
-    pollutants_df = flatten_dataframe(pollutants_df, "pollutants", "pollutants")
+    us_aqi = us_aqi_frame(pollutants_df, columns={name: f"{name}_pollutants" for name in POLLUTANT_FIELDS})
+    pollutants_df[list(us_aqi.columns)] = us_aqi
 
     # --- Historical weather ---
     weather_client = OpenMeteoWeatherHistoricalClient(
         latitude=lat,
         longitude=lon,
-        city=city
+        city=city,
+        cache=cache
+    )
+    weather_df = weather_client.fetch_frame(start_date=start_date_dt, end_date=end_date_dt).rename(
+        columns={name: f"{name}_weather" for name in WEATHER_FIELDS}
+    )
+
+    # Both frames carry city/source/ingested_at; keep one of each so the
+    # join adds no _x/_y columns
+    pollutants_df = pollutants_df.rename(columns={"source": "pollutants_source"})
+    weather_df = weather_df.rename(columns={"source": "weather_source"}).drop(
+        columns=["city", "ingested_at"], errors="ignore"
     )
-    weather_df = pd.DataFrame(weather_client.fetch(start_date=start_date_dt, end_date=end_date_dt))
-    weather_df = flatten_dataframe(weather_df, "weather", "weather")
 
-    # --- Ensure UTC timestamps ---
-    pollutants_df["event_timestamp"] = pd.to_datetime(pollutants_df["event_timestamp"], utc=True)
-    weather_df["event_timestamp"] = pd.to_datetime(weather_df["event_timestamp"], utc=True)
+    # --- Merge on timestamp (drops the look-back hours) ---
+    return pd.merge(pollutants_df, weather_df, on="event_timestamp", how="inner", validate="one_to_one")
+
+def merge_historical_data(
+    city: str,
+    token: str,
+    use_cache: bool = True,
+    incremental: bool = False,
+    db=None,
+    overlap_hours: int = INCREMENTAL_OVERLAP_HOURS
+):
+    """Fetch and merge historical pollutants + weather into a single dataframe.
+
+    With use_cache, archived days are served from the local response cache
+    and only the most recent days hit the network.
+
+    With incremental, only the hours after the city's stored watermark
+    (minus overlap_hours, to pick up late corrections) are fetched; the
+    merged delta is upserted into MERGED_COLLECTION and returned.
+    """
+    logger.info(f"Fetching and merging historical data for {city}")
+    cache = ResponseCache() if use_cache else None
+
+    if incremental:
+        return _merge_historical_incremental(city, token, cache, db, overlap_hours)
+
+    # --- Date range for last 120 days ---
+    end_date_dt = datetime.utcnow()
+    start_date_dt = end_date_dt - timedelta(days=HISTORY_DAYS)
 
-    # --- Merge on timestamp ---
-    merged_df = pd.merge(pollutants_df, weather_df, on="event_timestamp", how="inner")
+    merged_df = _fetch_merged_window(city, token, start_date_dt, end_date_dt, cache)
     logger.info(f"Merged historical data shape: {merged_df.shape}")
     return merged_df
 
-def merge_live_data(city: str, token: str, weather_df: pd.DataFrame):
-    """Fetch live AQI and merge with closest weather record"""
+def _merge_historical_incremental(
+    city: str,
+    token: str,
+    cache: Optional[ResponseCache],
+    db,
+    overlap_hours: int
+) -> pd.DataFrame:
+    if db is None:
+        db = get_database()
+
+    watermarks = WatermarkStore(db[WATERMARK_COLLECTION])
+    mark = watermarks.get(MERGE_JOB, city)
+
+    now = pd.Timestamp.now(tz="UTC").floor("h")
+    if mark is None:
+        since = now - pd.Timedelta(days=HISTORY_DAYS)
+    else:
+        since = pd.Timestamp(mark) - pd.Timedelta(hours=overlap_hours)
+
+    logger.info(f"Incremental merge for {city} from {since} (watermark {mark})")
+
+    merged_df = _fetch_merged_window(
+        city, token, since.to_pydatetime(), now.to_pydatetime(), cache
+    )
+    delta = merged_df[
+        (merged_df["event_timestamp"] >= since) & (merged_df["event_timestamp"] <= now)
+    ].reset_index(drop=True)
+
+    if delta.empty:
+        logger.info(f"No new hours for {city}")
+        return delta
+
+    _append_merged(db[MERGED_COLLECTION], city, delta)
+
+    # Only advance through the leading run of hours where both sources are
+    # complete, so the first partially null (or absent) hour and everything
+    # after it get re-fetched on the next run. Holes older than the archive
+    # delay are final and no longer hold the watermark back.
+    final_before = now - pd.Timedelta(days=ARCHIVE_AFTER_DAYS)
+    complete_through = _leading_complete_hour(delta, final_before)
+    if complete_through is not None:
+        watermarks.set(MERGE_JOB, city, complete_through.to_pydatetime())
+
+    advanced = complete_through is not None and (mark is None or complete_through > pd.Timestamp(mark))
+    if not advanced:
+        pending = delta["event_timestamp"]
+        if complete_through is not None:
+            pending = pending[pending > complete_through]
+        blocked = pending.min() if not pending.empty else None
+        # The newest hours routinely lag a few hours behind; a block older
+        # than that is a hole the archives have not filled
+        if blocked is not None and blocked < now - pd.Timedelta(hours=WATERMARK_STALL_HOURS):
+            logger.warning(f"Merge watermark for {city} stalled at {mark}: {blocked} is still incomplete")
+
+    logger.info(f"Incremental merge appended {len(delta)} rows for {city}")
+    return delta
+
+def _leading_complete_hour(
+    delta: pd.DataFrame,
+    final_before: Optional[pd.Timestamp] = None
+) -> Optional[pd.Timestamp]:
+    """Last hour of the gap-free run of complete rows at the start of delta
+
+    Hours before final_before count as complete (and missing ones as
+    present): the archives will not fill them in any more.
+    """
+    value_cols = [c for c in delta.columns if c.endswith(("_pollutants", "_weather"))]
+    ordered = delta.sort_values("event_timestamp")
+    times = ordered["event_timestamp"].reset_index(drop=True)
+    complete = ordered[value_cols].notna().all(axis=1).to_numpy()
+    # A skipped hour ends the run as well
+    contiguous = (times.diff() == pd.Timedelta(hours=1)).to_numpy()
+    contiguous[:1] = True
+    if final_before is not None:
+        complete |= (times < final_before).to_numpy()
+        # The hours skipped before this one are all final
+        contiguous |= (times - pd.Timedelta(hours=1) < final_before).to_numpy()
+
+    broken = ~(complete & contiguous)
+    run_length = int(broken.argmax()) if broken.any() else len(times)
+    return times.iloc[run_length - 1] if run_length else None
+
+def _append_merged(collection, city: str, delta: pd.DataFrame):
+    """Upsert merged rows keyed by (city, event_timestamp)"""
+    records = delta.astype(object).where(delta.notna(), None).to_dict("records")
+    for record in records:
+        record["event_timestamp"] = record["event_timestamp"].to_pydatetime()
+        record["city"] = city.lower()
+        validate_merged_record(record)
+
+    result = bulk_upsert(collection, records, ("city", "event_timestamp"))
+    if result.errors:
+        raise RuntimeError(f"{len(result.errors)} merged rows failed to store for {city}")
+
+def to_raw_documents(city: str, merged: pd.DataFrame) -> List[dict]:
+    """Merged rows in the raw hourly shape the feature pipeline reads
+
+    `aqi` is the US AQI computed from the Open-Meteo concentrations and
+    each pollutant is its sub-index, the same scale as AQICN's `aqi` and
+    `iaqi` values on the live path.
+    """
+    columns = {
+        "us_aqi": "aqi",
+        **{f"aqi_{name}": name for name in POLLUTANTS},
+        **{f"{name}_weather": name for name in WEATHER_FIELDS},
+    }
+    values = merged.reindex(columns=list(columns)).rename(columns=columns)
+    values = values.astype(object).where(values.notna(), None)
+    created_at = datetime.utcnow()
+
+    return [
+        {
+            "entity": {"city": city.lower()},
+            "event_timestamp": pd.Timestamp(ts).to_pydatetime(),
+            **row,
+            "source": "open-meteo",
+            "created_at": created_at
+        }
+        for ts, row in zip(merged["event_timestamp"], values.to_dict("records"))
+    ]
+
+def _append_raw(collection, city: str, merged: pd.DataFrame):
+    """Upsert merged rows as raw hourly rows keyed by (entity.city, event_timestamp)"""
+    result = bulk_upsert(collection, to_raw_documents(city, merged), ("entity.city", "event_timestamp"))
+    if result.errors:
+        raise RuntimeError(f"{len(result.errors)} raw rows failed to store for {city}")
+
+def _append_history(db, city: str, merged: pd.DataFrame):
+    """Store backfilled hours in MERGED_COLLECTION and, as raw hourly rows,
+    in RAW_COLLECTION for the feature pipeline"""
+    _append_merged(db[MERGED_COLLECTION], city, merged)
+    _append_raw(db[RAW_COLLECTION], city, merged)
+
+def merge_live_data(
+    city: str,
+    token: str,
+    weather_df: Union[pd.DataFrame, AsOfIndex],
+    tolerance: Optional[pd.Timedelta] = None
+):
+    """Fetch live AQI and merge with closest weather record.
+
+    weather_df may be a prebuilt AsOfIndex so repeated live merges reuse
+    the sorted history instead of re-parsing it; a plain frame is indexed
+    on the fly and left untouched.
+    """
     logger.info(f"Fetching live AQI for {city}")
     live_client = AQICNLiveClient(city=city, token=token)
 
@@ -86,16 +320,19 @@ def merge_live_data(city: str, token: str, weather_df: pd.DataFrame):
 
     live_df = pd.DataFrame([live_data])
     live_df = flatten_dataframe(live_df, "pollutants", "pollutants")
+    live_df["event_timestamp"] = pd.to_datetime(live_df["event_timestamp"], utc=True)
 
     # --- Align closest weather timestamp ---
-    weather_df["event_timestamp"] = pd.to_datetime(weather_df["event_timestamp"], utc=True)
-    live_ts = pd.to_datetime(live_df["event_timestamp"].iloc[0], utc=True)
-    closest_weather = weather_df.iloc[(weather_df["event_timestamp"] - live_ts).abs().argsort()[:1]]
+    weather_index = weather_df if isinstance(weather_df, AsOfIndex) else AsOfIndex(weather_df)
+    closest_weather = weather_index.lookup_many(
+        live_df["event_timestamp"], direction="nearest", tolerance=tolerance
+    ).rename(columns={weather_index.time_col: "weather_event_timestamp"})
 
     live_merged_df = pd.merge(
         live_df,
         closest_weather,
-        on="event_timestamp",
+        left_index=True,
+        right_index=True,
         how="left",
         suffixes=('_pollutants', '_weather')
     )
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.ingestion.backfill_engine import plan_chunks
+from src.ingestion.http_transport import HttpTransport, get_transport
+from src.ingestion.merge_data import (
+    _append_history,
+    _fetch_merged_window,
+    resolve_station_geo,
+)
+from src.ingestion.response_cache import ResponseCache
+from src.utils.config import CITIES_CONFIG_PATH, load_cities_config
+from src.utils.logger import get_logger
+from src.utils.mongo_client import get_database
+
+logger = get_logger(__name__)
+
+# Longest window fetched per Open-Meteo request pair
+HISTORICAL_WINDOW_DAYS = 92
+
+
+@dataclass(frozen=True)
+class CityConfig:
+    """
+    One city of the multi-city run. Coordinates skip the AQICN station
+    lookup; station pins the AQICN feed (e.g. "@8762").
+    """
+
+    name: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    station: Optional[str] = None
+
+    @property
+    def geo(self) -> Optional[Tuple[float, float]]:
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+    @property
+    def aqicn_query(self) -> str:
+        return self.station or self.name
+
+
+def load_cities(path: str = CITIES_CONFIG_PATH) -> List[CityConfig]:
+    config = load_cities_config(path)
+    return [
+        CityConfig(
+            name=entry["name"].lower(),
+            latitude=entry.get("latitude"),
+            longitude=entry.get("longitude"),
+            station=entry.get("station"),
+        )
+        for entry in config["cities"]
+    ]
+
+
+def configure_rate_limits(limits: Dict[str, Sequence[float]], transport: Optional[HttpTransport] = None):
+    """Apply per-host [rate, burst] limits to the shared transport."""
+    transport = transport or get_transport()
+    for host, (rate, capacity) in limits.items():
+        transport.set_rate_limit(host, rate, capacity)
+
+
+def _fan_out(cities: Iterable[CityConfig], work: Callable[[CityConfig], Any], max_workers: int) -> Dict[str, Any]:
+    """
+    Run `work` for every city concurrently. A failing city is logged and
+    reported as None without stopping the others.
+    """
+    def guarded(city: CityConfig):
+        try:
+            return work(city)
+        except Exception as e:
+            logger.error(f"{city.name} failed: {e}", exc_info=True)
+            return None
+
+    cities = list(cities)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = list(pool.map(guarded, cities))
+    return {city.name: result for city, result in zip(cities, results)}
+
+
+def ingest_historical(
+    cities: Iterable[CityConfig],
+    token: str,
+    start: datetime,
+    end: datetime,
+    db=None,
+    max_workers: int = 4,
+    use_cache: bool = True,
+    window_days: int = HISTORICAL_WINDOW_DAYS
+) -> Dict[str, Optional[int]]:
+    """
+    Merged pollutants + weather for every city over [start, end], cities
+    in parallel. Each city is fetched in windows of window_days and every
+    window is written like run_backfill does: one bulk upsert into the
+    merged collection and one into the raw hourly collection. Returns rows
+    per city (None on failure).
+    """
+    if db is None:
+        db = get_database()
+    cache = ResponseCache() if use_cache else None
+
+    def ingest_city(city: CityConfig) -> int:
+        geo = city.geo or resolve_station_geo(city.aqicn_query, token)
+        rows = 0
+        for chunk in plan_chunks(start, end, window_days):
+            merged = _fetch_merged_window(
+                city.name, token,
+                datetime.combine(chunk.start, time.min), datetime.combine(chunk.end, time(23)),
+                cache, geo=geo
+            )
+            if not merged.empty:
+                _append_history(db, city.name, merged)
+                rows += len(merged)
+        logger.info(f"Historical ingestion stored {rows} rows for {city.name}")
+        return rows
+
+    return _fan_out(cities, ingest_city, max_workers)
+
+
+def ingest_live(cities: Iterable[CityConfig], max_workers: int = 4) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    One live feature row per city (AQICN + OpenWeather), cities in
+    parallel. Returns the stored features per city.
+    """
+    # Imported here so historical-only runs do not need the live API keys
+    from src.features.feature_pipeline import run_pipeline
+
+    return _fan_out(cities, lambda city: run_pipeline(city.name, aqi_query=city.aqicn_query), max_workers)
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from datetime import timedelta
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Multi-city AQI ingestion")
+    parser.add_argument("mode", choices=["live", "historical"])
+    parser.add_argument("--config", default=CITIES_CONFIG_PATH, help="Cities YAML")
+    parser.add_argument("--days", type=int, default=7, help="Historical: days back from today")
+    parser.add_argument("--city", action="append", dest="only", help="Restrict to these cities")
+    args = parser.parse_args()
+
+    load_dotenv()
+    config = load_cities_config(args.config)
+    configure_rate_limits(config["rate_limits"])
+    selected = [c for c in load_cities(args.config) if not args.only or c.name in {o.lower() for o in args.only}]
+
+    if args.mode == "live":
+        results = ingest_live(selected, max_workers=config["max_workers"])
+    else:
+        end = datetime.utcnow()
+        results = ingest_historical(
+            selected, os.getenv("AQICN_TOKEN"), end - timedelta(days=args.days), end,
+            max_workers=config["max_workers"]
+        )
+    for name, result in results.items():
+        print(f"{name}: {result}")
@@ -1,11 +1,25 @@
-from typing import List, Dict, Any
-from datetime import datetime, timezone
-import requests
+from typing import List, Dict, Any, Optional
+from datetime import date, datetime, timezone
 
+import numpy as np
+import pandas as pd
+
+from src.ingestion.http_transport import HttpTransport, get_transport
+from src.ingestion.response_cache import ResponseCache
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Canonical pollutant name -> Open-Meteo hourly variable
+POLLUTANT_FIELDS = {
+    "pm25": "pm2_5",
+    "pm10": "pm10",
+    "no2": "nitrogen_dioxide",
+    "so2": "sulphur_dioxide",
+    "o3": "ozone",
+    "co": "carbon_monoxide",
+}
+
 
 class OpenMeteoHistoricalAQIClient:
     """
@@ -19,14 +33,30 @@ class OpenMeteoHistoricalAQIClient:
         latitude: float,
         longitude: float,
         start_date: str,
-        end_date: str
+        end_date: str,
+        transport: Optional[HttpTransport] = None,
+        cache: Optional[ResponseCache] = None,
+        city: str = "karachi"
     ):
+        self.city = city.lower()
         self.latitude = latitude
         self.longitude = longitude
         self.start_date = start_date
         self.end_date = end_date
+        self.transport = transport or get_transport()
+        self.cache = cache
 
     def fetch(self) -> List[Dict[str, Any]]:
+        return self._normalize(self._get_payload())
+
+    def fetch_frame(self) -> pd.DataFrame:
+        """
+        Columnar variant of fetch(): one typed column per pollutant, built
+        straight from the response arrays without per-hour dicts.
+        """
+        return self._to_frame(self._get_payload())
+
+    def _get_payload(self) -> Dict[str, Any]:
         logger.info(
             "Fetching historical AQI from Open-Meteo",
             extra={
@@ -40,47 +70,46 @@ class OpenMeteoHistoricalAQIClient:
         params = {
             "latitude": self.latitude,
             "longitude": self.longitude,
-            "start_date": self.start_date,
-            "end_date": self.end_date,
-            "hourly": [
-                "pm2_5",
-                "pm10",
-                "nitrogen_dioxide",
-                "sulphur_dioxide",
-                "ozone",
-                "carbon_monoxide"
-            ],
+            "hourly": list(POLLUTANT_FIELDS.values()),
             "timezone": "UTC"
         }
 
-        response = requests.get(self.BASE_URL, params=params, timeout=20)
+        if self.cache is not None:
+            return self.cache.fetch_hourly(
+                self.transport,
+                self.BASE_URL,
+                params,
+                start_date=date.fromisoformat(self.start_date),
+                end_date=date.fromisoformat(self.end_date),
+                timeout=20
+            )
+
+        params["start_date"] = self.start_date
+        params["end_date"] = self.end_date
+        response = self.transport.get(self.BASE_URL, params=params, timeout=20)
         response.raise_for_status()
-        payload = response.json()
-
-        return self._normalize(payload)
+        return response.json()
 
     def _normalize(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
         hourly = payload.get("hourly", {})
         timestamps = hourly.get("time", [])
+        columns = {
+            name: hourly.get(field) or [None] * len(timestamps)
+            for name, field in POLLUTANT_FIELDS.items()
+        }
+        ingested_at = datetime.now(timezone.utc)
 
         records = []
 
         for i, ts in enumerate(timestamps):
             record = {
-                "city": "karachi",
+                "city": self.city,
                 "event_timestamp": datetime.fromisoformat(ts).replace(
                     tzinfo=timezone.utc
                 ),
-                "pollutants": {
-                    "pm25": hourly.get("pm2_5", [None])[i],
-                    "pm10": hourly.get("pm10", [None])[i],
-                    "no2": hourly.get("nitrogen_dioxide", [None])[i],
-                    "so2": hourly.get("sulphur_dioxide", [None])[i],
-                    "o3": hourly.get("ozone", [None])[i],
-                    "co": hourly.get("carbon_monoxide", [None])[i],
-                },
+                "pollutants": {name: values[i] for name, values in columns.items()},
                 "source": "open-meteo",
-                "ingested_at": datetime.now(timezone.utc)
+                "ingested_at": ingested_at
             }
 
             records.append(record)
@@ -91,3 +120,42 @@ class OpenMeteoHistoricalAQIClient:
         )
 
         return records
+
+    def _to_frame(self, payload: Dict[str, Any]) -> pd.DataFrame:
+        hourly = payload.get("hourly", {})
+        timestamps = hourly.get("time", [])
+
+        frame = pd.DataFrame({
+            "city": self.city,
+            "event_timestamp": parse_hourly_times(timestamps),
+            "source": "open-meteo",
+            "ingested_at": pd.Timestamp.now(tz="UTC"),
+        }, index=pd.RangeIndex(len(timestamps)))
+
+        for name, field in POLLUTANT_FIELDS.items():
+            frame[name] = hourly_column(hourly, field, len(timestamps))
+
+        logger.info(
+            "Historical AQI normalized",
+            extra={"records": len(frame)}
+        )
+
+        return frame
+
+
+def parse_hourly_times(timestamps: List[str]) -> pd.DatetimeIndex:
+    """
+    Vectorized parse of Open-Meteo `hourly.time` (ISO8601, UTC, no offset).
+    """
+    return pd.to_datetime(timestamps, format="%Y-%m-%dT%H:%M", utc=True)
+
+
+def hourly_column(hourly: Dict[str, Any], field: str, length: int) -> np.ndarray:
+    """
+    Open-Meteo `hourly` array as float64, with nulls (or a missing
+    variable) as NaN.
+    """
+    values = hourly.get(field)
+    if values is None:
+        return np.full(length, np.nan)
+    return np.asarray(values, dtype="float64")
@@ -1,11 +1,25 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
-import requests
 
+import pandas as pd
+
+from src.ingestion.http_transport import HttpTransport, get_transport
+from src.ingestion.openmeteo_historical_client import hourly_column, parse_hourly_times
+from src.ingestion.response_cache import ResponseCache
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Canonical weather name -> Open-Meteo hourly variable
+WEATHER_FIELDS = {
+    "temperature": "temperature_2m",
+    "humidity": "relative_humidity_2m",
+    "wind_speed": "wind_speed_10m",
+    "wind_direction": "wind_direction_10m",
+    "pressure": "surface_pressure",
+    "precipitation": "precipitation",
+}
+
 
 class OpenMeteoWeatherHistoricalClient:
     """
@@ -14,10 +28,19 @@ class OpenMeteoWeatherHistoricalClient:
 
     BASE_URL = "https://archive-api.open-meteo.com/v1/archive"
 
-    def __init__(self, city: str, latitude: float, longitude: float):
+    def __init__(
+        self,
+        city: str,
+        latitude: float,
+        longitude: float,
+        transport: Optional[HttpTransport] = None,
+        cache: Optional[ResponseCache] = None
+    ):
         self.city = city
         self.latitude = latitude
         self.longitude = longitude
+        self.transport = transport or get_transport()
+        self.cache = cache
 
     def fetch(
         self,
@@ -27,34 +50,12 @@ class OpenMeteoWeatherHistoricalClient:
         """
         Fetch hourly historical weather data.
         """
-
-        logger.info(
-            "Fetching historical weather from Open-Meteo",
-            extra={"city": self.city}
-        )
-
-        params = {
-            "latitude": self.latitude,
-            "longitude": self.longitude,
-            "start_date": start_date.date().isoformat(),
-            "end_date": end_date.date().isoformat(),
-            "hourly": ",".join([
-                "temperature_2m",
-                "relative_humidity_2m",
-                "wind_speed_10m",
-                "wind_direction_10m",
-                "surface_pressure",
-                "precipitation"
-            ]),
-            "timezone": "UTC"
-        }
-
-        response = requests.get(self.BASE_URL, params=params, timeout=20)
-        response.raise_for_status()
-        payload = response.json()
+        payload = self._get_payload(start_date, end_date)
 
         hourly = payload.get("hourly", {})
         timestamps = hourly.get("time", [])
+        columns = {name: hourly[field] for name, field in WEATHER_FIELDS.items()}
+        ingested_at = datetime.now(timezone.utc)
 
         records = []
 
@@ -62,16 +63,9 @@ class OpenMeteoWeatherHistoricalClient:
             record = {
                 "city": self.city,
                 "event_timestamp": datetime.fromisoformat(ts).replace(tzinfo=timezone.utc),
-                "weather": {
-                    "temperature": hourly["temperature_2m"][idx],
-                    "humidity": hourly["relative_humidity_2m"][idx],
-                    "wind_speed": hourly["wind_speed_10m"][idx],
-                    "wind_direction": hourly["wind_direction_10m"][idx],
-                    "pressure": hourly["surface_pressure"][idx],
-                    "precipitation": hourly["precipitation"][idx],
-                },
+                "weather": {name: values[idx] for name, values in columns.items()},
                 "source": "open-meteo-weather",
-                "ingested_at": datetime.now(timezone.utc)
+                "ingested_at": ingested_at
             }
             records.append(record)
 
@@ -81,3 +75,63 @@ class OpenMeteoWeatherHistoricalClient:
         )
 
         return records
+
+    def fetch_frame(
+        self,
+        start_date: datetime,
+        end_date: datetime
+    ) -> pd.DataFrame:
+        """
+        Columnar variant of fetch(): one float64 column per weather
+        variable, built straight from the response arrays.
+        """
+        payload = self._get_payload(start_date, end_date)
+
+        hourly = payload.get("hourly", {})
+        timestamps = hourly.get("time", [])
+
+        frame = pd.DataFrame({
+            "city": self.city,
+            "event_timestamp": parse_hourly_times(timestamps),
+            "source": "open-meteo-weather",
+            "ingested_at": pd.Timestamp.now(tz="UTC"),
+        }, index=pd.RangeIndex(len(timestamps)))
+
+        for name, field in WEATHER_FIELDS.items():
+            frame[name] = hourly_column(hourly, field, len(timestamps))
+
+        logger.info(
+            "Historical weather normalized",
+            extra={"records": len(frame)}
+        )
+
+        return frame
+
+    def _get_payload(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        logger.info(
+            "Fetching historical weather from Open-Meteo",
+            extra={"city": self.city}
+        )
+
+        params = {
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "hourly": ",".join(WEATHER_FIELDS.values()),
+            "timezone": "UTC"
+        }
+
+        if self.cache is not None:
+            return self.cache.fetch_hourly(
+                self.transport,
+                self.BASE_URL,
+                params,
+                start_date=start_date.date(),
+                end_date=end_date.date(),
+                timeout=20
+            )
+
+        params["start_date"] = start_date.date().isoformat()
+        params["end_date"] = end_date.date().isoformat()
+        response = self.transport.get(self.BASE_URL, params=params, timeout=20)
+        response.raise_for_status()
+        return response.json()
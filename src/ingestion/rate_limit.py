@@ -0,0 +1,50 @@
+import random
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by concurrent API workers.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Block until `tokens` are available. Returns the time spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+
+                wait = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """
+    Exponential backoff with full jitter for the given 1-based attempt.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -0,0 +1,302 @@
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from src.ingestion.http_transport import HttpTransport
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_CACHE_DIR = os.getenv("AQI_HTTP_CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache", "http"))
+
+# Credentials never take part in the key and are never written to disk
+IGNORED_PARAMS = ("token", "appid", "apikey")
+
+# Days after which Open-Meteo archive data is final
+ARCHIVE_AFTER_DAYS = 7
+
+# Writes between full rescans of the cache directory; the running byte
+# total drifts when other processes share the directory
+RESCAN_EVERY_WRITES = 256
+
+_EPOCH = date(1970, 1, 1)
+
+
+class ResponseCache:
+    """
+    Content-addressed, gzip-compressed on-disk cache for historical API
+    responses.
+
+    Entries are keyed by endpoint + normalized params. Responses whose
+    date range ends more than `archive_after_days` ago are immutable and
+    kept forever; anything more recent expires after `recent_ttl_seconds`.
+    The cache is bounded by `max_bytes` with least-recently-used eviction.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = 512 * 1024 * 1024,
+        archive_after_days: int = ARCHIVE_AFTER_DAYS,
+        recent_ttl_seconds: float = 3600
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.archive_after_days = archive_after_days
+        self.recent_ttl_seconds = recent_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Bytes on disk as of the last scan plus our writes since; None
+        # until the first scan
+        self._total_bytes: Optional[int] = None
+        self._writes_since_scan = 0
+
+    # ------------------------------
+    # Keying
+    # ------------------------------
+    @staticmethod
+    def normalize_params(params: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        normalized = {}
+        for name, value in sorted((params or {}).items()):
+            if name.lower() in IGNORED_PARAMS or value is None:
+                continue
+            if isinstance(value, (list, tuple)):
+                value = ",".join(str(v) for v in value)
+            normalized[name] = str(value)
+        return normalized
+
+    def key(self, url: str, params: Optional[Dict[str, Any]]) -> str:
+        canonical = json.dumps(
+            {"url": url, "params": self.normalize_params(params)},
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    # ------------------------------
+    # Read / write
+    # ------------------------------
+    def get(self, url: str, params: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        path = self._path(self.key(url, params))
+
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at < time.time():
+            self._count(hit=False)
+            return None
+
+        # Touch for LRU ordering
+        os.utime(path, None)
+        self._count(hit=True)
+        return entry["payload"]
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, url: str, params: Optional[Dict[str, Any]], payload: Dict[str, Any]):
+        normalized = self.normalize_params(params)
+        ttl = self.ttl_for(normalized)
+        entry = {
+            "url": url,
+            "params": normalized,
+            "stored_at": time.time(),
+            "expires_at": None if ttl is None else time.time() + ttl,
+            "payload": payload
+        }
+
+        path = self._path(self.key(url, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(entry, f, separators=(",", ":"))
+        size = os.path.getsize(tmp_path)
+
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+
+            # Only walk the directory when over budget, or now and then to
+            # pick up other processes' writes
+            self._writes_since_scan += 1
+            if self._total_bytes is not None:
+                self._total_bytes += size - replaced
+            if (
+                self._total_bytes is None
+                or self._total_bytes > self.max_bytes
+                or self._writes_since_scan >= RESCAN_EVERY_WRITES
+            ):
+                self._evict_locked()
+
+    def ttl_for(self, params: Dict[str, str]) -> Optional[float]:
+        """
+        None (permanent) when the requested range is old enough to be
+        archived, otherwise the recent-data TTL.
+        """
+        last_day = params.get("end_date") or params.get("date")
+        if last_day:
+            try:
+                last = date.fromisoformat(last_day[:10])
+            except ValueError:
+                return self.recent_ttl_seconds
+            if last < self.archive_cutoff():
+                return None
+        return self.recent_ttl_seconds
+
+    def archive_cutoff(self) -> date:
+        """First day that is still recent (not yet archived)."""
+        return datetime.now(timezone.utc).date() - timedelta(days=self.archive_after_days)
+
+    def evict(self):
+        """
+        Drop least-recently-used entries until the cache fits max_bytes.
+        """
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+
+        self._total_bytes = total
+        self._writes_since_scan = 0
+
+    # ------------------------------
+    # Fetch-through helpers
+    # ------------------------------
+    def get_json(
+        self,
+        transport: HttpTransport,
+        url: str,
+        params: Dict[str, Any],
+        timeout: float = 20
+    ) -> Dict[str, Any]:
+        payload = self.get(url, params)
+        if payload is not None:
+            return payload
+
+        response = transport.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        payload = response.json()
+        self.put(url, params, payload)
+        return payload
+
+    def fetch_hourly(
+        self,
+        transport: HttpTransport,
+        url: str,
+        params: Dict[str, Any],
+        start_date: date,
+        end_date: date,
+        chunk_days: int = 30,
+        timeout: float = 20
+    ) -> Dict[str, Any]:
+        """
+        Fetch an Open-Meteo style `hourly` payload for [start_date, end_date]
+        in fixed, epoch-aligned chunks so that old chunks keep the same
+        cache key from run to run and become permanent hits.
+
+        Archived chunks are always requested whole, even past end_date, and
+        trimmed locally; only a chunk reaching into the recent days is
+        clipped to end_date.
+        """
+        merged: Dict[str, Any] = {}
+        hourly: Dict[str, List[Any]] = {}
+
+        chunks = aligned_chunks(start_date, end_date, chunk_days, clip_from=self.archive_cutoff())
+        for chunk_start, chunk_end in chunks:
+            chunk_params = dict(params)
+            chunk_params["start_date"] = chunk_start.isoformat()
+            chunk_params["end_date"] = chunk_end.isoformat()
+
+            payload = self.get_json(transport, url, chunk_params, timeout=timeout)
+
+            if not merged:
+                merged = {k: v for k, v in payload.items() if k != "hourly"}
+            for name, values in payload.get("hourly", {}).items():
+                hourly.setdefault(name, []).extend(values)
+
+        # Aligned chunks may start before and end after the requested range
+        first_day, last_day = start_date.isoformat(), end_date.isoformat()
+        times = hourly.get("time", [])
+        offset = next((i for i, ts in enumerate(times) if ts[:10] >= first_day), len(times))
+        stop = next((i for i, ts in enumerate(times) if ts[:10] > last_day), len(times))
+        merged["hourly"] = {name: values[offset:stop] for name, values in hourly.items()}
+
+        logger.info(
+            "Hourly payload served",
+            extra={"cache_hits": self.hits, "cache_misses": self.misses}
+        )
+        return merged
+
+
+def aligned_chunks(
+    start_date: date,
+    end_date: date,
+    chunk_days: int,
+    clip_from: Optional[date] = None
+) -> List[Tuple[date, date]]:
+    """
+    Split [start_date, end_date] into chunk_days windows aligned to the
+    epoch. The last window is clipped to end_date, unless clip_from is
+    given: then only a window ending on or after clip_from is clipped and
+    windows before it stay whole.
+    """
+    chunks = []
+    index = (start_date - _EPOCH).days // chunk_days
+
+    while True:
+        chunk_start = _EPOCH + timedelta(days=index * chunk_days)
+        if chunk_start > end_date:
+            break
+        chunk_end = chunk_start + timedelta(days=chunk_days - 1)
+        if clip_from is None or chunk_end >= clip_from:
+            chunk_end = min(chunk_end, end_date)
+        chunks.append((chunk_start, chunk_end))
+        index += 1
+
+    return chunks
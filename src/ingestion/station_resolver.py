@@ -1,6 +1,6 @@
-from typing import Dict, Any
-import requests
+from typing import Dict, Any, Optional
 
+from src.ingestion.http_transport import HttpTransport, get_transport
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -13,9 +13,10 @@ class AQICNStationResolver:
 
     BASE_URL = "https://api.waqi.info/feed"
 
-    def __init__(self, token: str, city: str):
+    def __init__(self, token: str, city: str, transport: Optional[HttpTransport] = None):
         self.token = token
         self.city = city.lower()
+        self.transport = transport or get_transport()
 
     def resolve(self) -> Dict[str, Any]:
         """
@@ -26,7 +27,7 @@ class AQICNStationResolver:
 
         logger.info("Resolving AQICN station", extra={"city": self.city})
 
-        response = requests.get(url, params=params, timeout=10)
+        response = self.transport.get(url, params=params, timeout=10)
         response.raise_for_status()
         payload = response.json()
 
@@ -0,0 +1,47 @@
+from typing import Optional
+from datetime import datetime, timezone
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+WATERMARK_COLLECTION = "ingestion_watermarks"
+
+
+class WatermarkStore:
+    """
+    Per-job, per-city high-water marks (last processed event_timestamp)
+    persisted in MongoDB.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def _id(job: str, city: str) -> str:
+        return f"{job}:{city.lower()}"
+
+    def get(self, job: str, city: str) -> Optional[datetime]:
+        doc = self.collection.find_one({"_id": self._id(job, city)})
+        if not doc:
+            return None
+
+        mark = doc["event_timestamp"]
+        # MongoDB returns naive UTC datetimes
+        return mark if mark.tzinfo else mark.replace(tzinfo=timezone.utc)
+
+    def set(self, job: str, city: str, event_timestamp: datetime):
+        self.collection.update_one(
+            {"_id": self._id(job, city)},
+            {"$set": {
+                "job": job,
+                "city": city.lower(),
+                "event_timestamp": event_timestamp,
+                "updated_at": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+        logger.info(
+            "Watermark advanced",
+            extra={"job": job, "city": city, "event_timestamp": event_timestamp.isoformat()}
+        )
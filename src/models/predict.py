@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.storage.hourly_array_store import HourlyArrayStore, hour_index, index_to_timestamp
+
+
+def load_feature_matrix(
+    city: str,
+    feature_names: Sequence[str],
+    start: datetime,
+    end: datetime,
+    store: Optional[HourlyArrayStore] = None
+) -> pd.DataFrame:
+    """
+    Hourly feature rows for [start, end] straight from the memmap array
+    store (no database access). Missing hours are NaN.
+    """
+    store = store or HourlyArrayStore()
+    return store.read_frame(city, feature_names, start, end)
+
+
+def latest_feature_vector(
+    city: str,
+    feature_names: Sequence[str],
+    at: Optional[datetime] = None,
+    store: Optional[HourlyArrayStore] = None,
+    max_age_hours: int = 3
+):
+    """
+    (timestamp, 1 x n feature array) for the most recent hour at or before
+    `at` (default: now) whose AQI is present, searching back at most
+    `max_age_hours`. Returns (None, None) when nothing recent is stored.
+    """
+    store = store or HourlyArrayStore()
+    at = at or datetime.utcnow()
+
+    aqi = store.window(city, "aqi", at, max_age_hours + 1)
+    present = np.flatnonzero(~np.isnan(aqi))
+    if len(present) == 0:
+        return None, None
+
+    hour = index_to_timestamp(hour_index(at) - (len(aqi) - 1 - int(present[-1])))
+    row = np.array([[store.window(city, name, hour, 1)[0] for name in feature_names]])
+    return hour, row
+
+
+def predict_aqi(
+    model,
+    city: str,
+    feature_names: Sequence[str],
+    at: Optional[datetime] = None,
+    store: Optional[HourlyArrayStore] = None
+) -> Optional[dict]:
+    """
+    Run a fitted model (anything with .predict) on the latest stored
+    feature row for `city`.
+    """
+    ts, features = latest_feature_vector(city, feature_names, at, store)
+    if features is None:
+        return None
+    return {"city": city, "event_timestamp": ts, "prediction": float(model.predict(features)[0])}
@@ -0,0 +1,194 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from .indexes import COLLECTION_INDEXES
+from .timeseries import LAYOUTS, TIMESERIES_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_DAY = 24
+FULL_DAY = (1 << HOURS_PER_DAY) - 1
+
+
+@dataclass(frozen=True)
+class DayCoverage:
+    """
+    Hours present for one city on one UTC day: bit h of `bitmap` is set
+    when hour h has at least one document. `documents` > hours present
+    means duplicates.
+    """
+
+    city: str
+    day: datetime
+    bitmap: int
+    documents: int
+
+    @property
+    def hours_present(self) -> int:
+        return bin(self.bitmap).count("1")
+
+    @property
+    def missing_hours(self) -> List[int]:
+        return [h for h in range(HOURS_PER_DAY) if not self.bitmap >> h & 1]
+
+    def render(self) -> str:
+        """'#' for present hours, '.' for missing ones, hour 0 first."""
+        return "".join("#" if self.bitmap >> h & 1 else "." for h in range(HOURS_PER_DAY))
+
+
+@dataclass(frozen=True)
+class MissingRange:
+    city: str
+    start: datetime
+    # Exclusive
+    end: datetime
+
+    @property
+    def hours(self) -> int:
+        return int((self.end - self.start) / timedelta(hours=1))
+
+
+def coverage_fields(collection_name: str) -> Tuple[str, str]:
+    """
+    (city field, time field) of a collection, from its declared unique
+    index or, for *_ts collections, its time-series layout.
+    """
+    if collection_name.endswith(TIMESERIES_SUFFIX):
+        layout = LAYOUTS[collection_name[:-len(TIMESERIES_SUFFIX)]]
+        return layout.city_field, layout.time_field
+
+    (city_field, _), (time_field, _) = COLLECTION_INDEXES[collection_name][0].keys[:2]
+    return city_field, time_field
+
+
+def coverage_pipeline(
+    city_field: str,
+    time_field: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cities: Optional[Iterable[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Aggregation returning one small document per (city, UTC day) with the
+    hour bitmap and document count. Requires MongoDB 5.0+ ($dateTrunc).
+    """
+    match: Dict[str, Any] = {}
+    if cities is not None:
+        match[city_field] = {"$in": list(cities)}
+    if start is not None or end is not None:
+        match[time_field] = {
+            **({"$gte": start} if start is not None else {}),
+            **({"$lt": end} if end is not None else {}),
+        }
+
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "city": f"${city_field}",
+                "day": {"$dateTrunc": {"date": f"${time_field}", "unit": "day"}},
+            },
+            "hours": {"$addToSet": {"$hour": f"${time_field}"}},
+            "documents": {"$sum": 1},
+        }},
+        # Hours are distinct, so summing 2^h sets one bit per hour
+        {"$project": {
+            "_id": 0,
+            "city": "$_id.city",
+            "day": "$_id.day",
+            "documents": 1,
+            "bitmap": {"$reduce": {
+                "input": "$hours",
+                "initialValue": 0,
+                "in": {"$add": ["$$value", {"$toLong": {"$pow": [2, "$$this"]}}]},
+            }},
+        }},
+        {"$sort": {"city": 1, "day": 1}},
+    ]
+
+
+def coverage_report(
+    collection,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cities: Optional[Iterable[str]] = None
+) -> List[DayCoverage]:
+    """
+    Per-city, per-day hour coverage computed server-side: only one
+    document per city-day crosses the wire.
+    """
+    city_field, time_field = coverage_fields(collection.name)
+    pipeline = coverage_pipeline(city_field, time_field, start, end, cities)
+    days = [
+        DayCoverage(city=row["city"], day=row["day"], bitmap=int(row["bitmap"]), documents=row["documents"])
+        for row in collection.aggregate(pipeline, allowDiskUse=True)
+    ]
+    logger.info(f"Coverage for {collection.name}: {len(days)} city-days")
+    return days
+
+
+def missing_ranges(
+    days: List[DayCoverage],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[MissingRange]:
+    """
+    Coalesce missing hours into [start, end) ranges per city.
+
+    Without bounds, each city is checked between its first and last
+    covered hour; with bounds, hours outside the data count as missing.
+    Days absent from `days` are missing entirely. Times are naive UTC,
+    as stored by MongoDB.
+    """
+    by_city: Dict[str, Dict[datetime, int]] = {}
+    for day in days:
+        city_days = by_city.setdefault(day.city, {})
+        city_days[day.day] = city_days.get(day.day, 0) | day.bitmap
+
+    ranges = []
+    for city, bitmaps in sorted(by_city.items()):
+        first_day, last_day = min(bitmaps), max(bitmaps)
+        lo = _floor_hour(start) if start is not None else first_day + timedelta(hours=_lowest_bit(bitmaps[first_day]))
+        hi = _ceil_hour(end) if end is not None else last_day + timedelta(hours=_highest_bit(bitmaps[last_day]) + 1)
+
+        gap_start = None
+        hour = lo
+        while hour < hi:
+            day = hour.replace(hour=0)
+            bitmap = bitmaps.get(day, 0)
+            if bitmap == FULL_DAY and hour == day and gap_start is None and day + timedelta(days=1) <= hi:
+                # Skip complete days in one step
+                hour = day + timedelta(days=1)
+                continue
+
+            present = bitmap >> hour.hour & 1
+            if not present and gap_start is None:
+                gap_start = hour
+            elif present and gap_start is not None:
+                ranges.append(MissingRange(city, gap_start, hour))
+                gap_start = None
+            hour += timedelta(hours=1)
+
+        if gap_start is not None:
+            ranges.append(MissingRange(city, gap_start, hi))
+
+    return ranges
+
+
+def _floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(ts: datetime) -> datetime:
+    floored = _floor_hour(ts)
+    return floored if floored == ts else floored + timedelta(hours=1)
+
+
+def _lowest_bit(bitmap: int) -> int:
+    return (bitmap & -bitmap).bit_length() - 1
+
+
+def _highest_bit(bitmap: int) -> int:
+    return bitmap.bit_length() - 1
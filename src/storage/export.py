@@ -0,0 +1,207 @@
+from typing import Any, Dict, Iterator, List, Optional
+import logging
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10_000
+_CONVERSION_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError)
+
+
+def iter_document_chunks(
+    collection,
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    sort: Optional[List] = None
+) -> Iterator[List[dict]]:
+    """
+    Stream a MongoDB cursor as lists of at most `chunk_size` documents,
+    so only one chunk is held in memory at a time.
+    """
+    cursor = collection.find(query or {}, projection).batch_size(chunk_size)
+    if sort:
+        cursor = cursor.sort(sort)
+
+    chunk: List[dict] = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def flatten_document(doc: Dict[str, Any], sep: str = "_", prefix: str = "") -> Dict[str, Any]:
+    """
+    {"aqi": {"pm2_5": 1}} -> {"aqi_pm2_5": 1}
+    """
+    flat = {}
+    for key, value in doc.items():
+        name = f"{prefix}{sep}{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten_document(value, sep, name))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _column_array(name: str, values: List[Any], type_: Optional[pa.DataType]) -> pa.Array:
+    try:
+        return pa.array(values, type=type_)
+    except _CONVERSION_ERRORS:
+        pass
+
+    if type_ is None or pa.types.is_string(type_):
+        # Mixed Python types in one column (e.g. datetimes and ISO strings)
+        logger.warning(f"Column {name} has mixed types, exporting as string")
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+    converted, dropped = [], 0
+    for value in values:
+        try:
+            converted.append(pa.scalar(value, type=type_).as_py())
+        except _CONVERSION_ERRORS:
+            converted.append(None)
+            dropped += 1
+    logger.warning(f"Column {name}: {dropped} values not convertible to {type_}, exported as null")
+    return pa.array(converted, type=type_)
+
+
+def _inferred_arrays(rows: List[Dict[str, Any]]):
+    names = list(dict.fromkeys(key for row in rows for key in row))
+    return names, [_column_array(name, [row.get(name) for row in rows], None) for name in names]
+
+
+def merge_types(current: Optional[pa.DataType], new: pa.DataType) -> pa.DataType:
+    """
+    Common type of a column seen as `current` and then as `new`: null
+    yields to anything, numbers widen (int64 + double -> double) and
+    incompatible types fall back to string.
+    """
+    if current is None or pa.types.is_null(current):
+        return new
+    if pa.types.is_null(new) or current == new:
+        return current
+    try:
+        unified = pa.unify_schemas(
+            [pa.schema([("f", current)]), pa.schema([("f", new)])], promote_options="permissive"
+        )
+        return unified.field("f").type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+
+
+def documents_to_batch(docs: List[dict], schema: Optional[pa.Schema] = None) -> pa.RecordBatch:
+    """
+    Flatten documents into one Arrow record batch. With a schema, columns
+    are conformed to it (missing -> null, extra -> dropped); otherwise
+    types are inferred and all-null columns default to float64.
+    """
+    rows = [flatten_document(doc) for doc in docs]
+
+    if schema is None:
+        names, arrays = _inferred_arrays(rows)
+        arrays = [a.cast(pa.float64()) if pa.types.is_null(a.type) else a for a in arrays]
+        return pa.RecordBatch.from_arrays(arrays, names=names)
+
+    arrays = [
+        _column_array(f.name, [row.get(f.name) for row in rows], f.type)
+        for f in schema
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def infer_schema(
+    collection,
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> pa.Schema:
+    """
+    Union schema of every document matching `query`, in one streamed pass
+    (only the types are kept, one chunk at a time). Columns are ordered
+    by first appearance; columns that are null everywhere are float64.
+    """
+    types: Dict[str, Optional[pa.DataType]] = {}
+    for chunk in iter_document_chunks(collection, query, projection, chunk_size):
+        names, arrays = _inferred_arrays([flatten_document(doc) for doc in chunk])
+        for name, array in zip(names, arrays):
+            types[name] = merge_types(types.get(name), array.type)
+
+    return pa.schema([
+        (name, pa.float64() if pa.types.is_null(type_) else type_) for name, type_ in types.items()
+    ])
+
+
+def iter_arrow_batches(
+    collection,
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    schema: Optional[pa.Schema] = None,
+    sort: Optional[List] = None
+) -> Iterator[pa.RecordBatch]:
+    """
+    Typed Arrow batches of a collection, one per cursor chunk, all with
+    the same schema.
+
+    `_id` is excluded unless the projection asks for it. Without an
+    explicit schema, a first pass builds the union schema of all matching
+    documents (infer_schema) and every batch is cast to it, so columns
+    that only appear in later chunks are kept.
+    """
+    projection = {"_id": 0, **(projection or {})}
+    if schema is None:
+        schema = infer_schema(collection, query, projection, chunk_size)
+
+    for chunk in iter_document_chunks(collection, query, projection, chunk_size, sort):
+        yield documents_to_batch(chunk, schema)
+
+
+def export_parquet(
+    collection,
+    path: str,
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    schema: Optional[pa.Schema] = None,
+    compression: str = "zstd"
+) -> int:
+    """
+    Stream a collection into a single Parquet file, one row group per
+    chunk. Returns the number of rows written.
+    """
+    writer = None
+    rows = 0
+    try:
+        for batch in iter_arrow_batches(collection, query, projection, chunk_size, schema):
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema, compression=compression)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info(f"Exported {rows} rows from {collection.name} to {path}")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from src.utils.mongo_client import get_database
+
+    parser = argparse.ArgumentParser(description="Export a MongoDB collection to Parquet")
+    parser.add_argument("collection")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongo_db = get_database()
+    print(f"{export_parquet(mongo_db[args.collection], args.path, chunk_size=args.chunk_size)} rows written")
@@ -0,0 +1,250 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_ARRAY_DIR = os.getenv("AQI_HOURLY_ARRAY_DIR", os.path.join(PROJECT_ROOT, "data", "hourly"))
+
+# First hour every array covers; slot i holds hour_index(DEFAULT_ORIGIN) + i
+DEFAULT_ORIGIN = datetime(2020, 1, 1)
+DTYPE = np.dtype("<f8")
+META_FILE = "store.json"
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+Timestamps = Union[datetime, pd.Timestamp, Sequence, pd.Series, pd.DatetimeIndex]
+
+
+def hour_index(ts: Timestamps) -> Union[int, np.ndarray]:
+    """
+    Hours since the Unix epoch (UTC; naive timestamps are taken as UTC).
+    Returns an int for one timestamp and an int64 array otherwise.
+    """
+    scalar = isinstance(ts, (datetime, pd.Timestamp, np.datetime64, str))
+    index = pd.DatetimeIndex(pd.to_datetime([ts] if scalar else list(ts), utc=True))
+    hours = index.tz_convert(None).values.astype("datetime64[h]").astype("int64")
+    return int(hours[0]) if scalar else hours
+
+
+def index_to_timestamp(index: Union[int, np.ndarray]) -> Union[datetime, pd.DatetimeIndex]:
+    """Inverse of hour_index (naive UTC)."""
+    if np.ndim(index) == 0:
+        return pd.Timestamp(np.datetime64(int(index), "h")).to_pydatetime()
+    return pd.DatetimeIndex(np.asarray(index, dtype="int64").astype("datetime64[h]"))
+
+
+class HourlyArrayStore:
+    """
+    Local hourly time series, one fixed-stride float64 file per city and
+    variable, memory-mapped for reads. Slot i of every file is the hour
+    `origin + i`, missing hours are NaN, so a lag or window is a direct
+    array slice with no parsing and no database round trip.
+
+    Layout: <root>/store.json (origin) and <root>/<city>/<variable>.f8.
+    Files grow (NaN-filled) as later hours are written. One writer per
+    city/variable at a time.
+    """
+
+    def __init__(self, root: str = DEFAULT_ARRAY_DIR, origin: datetime = DEFAULT_ORIGIN):
+        self.root = root
+        self.origin = self._load_origin(origin)
+        self._arrays: Dict[str, np.memmap] = {}
+
+    def _load_origin(self, origin: datetime) -> int:
+        meta_path = os.path.join(self.root, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                # An existing store keeps its origin, whatever was passed
+                return int(json.load(f)["origin_hour"])
+
+        os.makedirs(self.root, exist_ok=True)
+        origin_hour = hour_index(origin)
+        with open(meta_path, "w") as f:
+            json.dump({"origin_hour": origin_hour, "dtype": DTYPE.str}, f)
+        return origin_hour
+
+    def path(self, city: str, variable: str) -> str:
+        city = city.lower()
+        for name in (city, variable):
+            if not _NAME_PATTERN.match(name):
+                raise ValueError(f"Invalid city/variable name: {name!r}")
+        return os.path.join(self.root, city, f"{variable}.f8")
+
+    def cities(self) -> List[str]:
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def variables(self, city: str) -> List[str]:
+        directory = os.path.join(self.root, city.lower())
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-3] for name in os.listdir(directory) if name.endswith(".f8"))
+
+    # ------------------------------
+    # Reads
+    # ------------------------------
+    def _array(self, city: str, variable: str, needed: int = 0) -> Optional[np.memmap]:
+        """
+        Read-only memmap of a variable, reopened only when the file has
+        grown past the cached length (another writer appended).
+        """
+        path = self.path(city, variable)
+        array = self._arrays.get(path)
+        if array is not None and len(array) >= needed:
+            return array
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+
+        array = np.memmap(path, dtype=DTYPE, mode="r")
+        self._arrays[path] = array
+        return array
+
+    def read_range(self, city: str, variable: str, start_index: int, stop_index: int) -> np.ndarray:
+        """
+        Values for hour indices [start_index, stop_index); hours outside
+        the stored range are NaN.
+        """
+        out = np.full(max(stop_index - start_index, 0), np.nan)
+        lo, hi = start_index - self.origin, stop_index - self.origin
+        array = self._array(city, variable, hi)
+        if array is None or hi <= 0:
+            return out
+
+        src_lo, src_hi = max(lo, 0), min(hi, len(array))
+        if src_hi > src_lo:
+            out[src_lo - lo:src_hi - lo] = array[src_lo:src_hi]
+        return out
+
+    def read(self, city: str, variable: str, start: Timestamps, end: Timestamps) -> pd.Series:
+        """Hourly series for [start, end], one entry per hour."""
+        first, last = hour_index(start), hour_index(end)
+        values = self.read_range(city, variable, first, last + 1)
+        return pd.Series(values, index=index_to_timestamp(np.arange(first, last + 1)), name=variable)
+
+    def read_frame(
+        self,
+        city: str,
+        variables: Sequence[str],
+        start: Timestamps,
+        end: Timestamps,
+        time_col: str = "event_timestamp"
+    ) -> pd.DataFrame:
+        """Several variables on one hourly grid for [start, end]."""
+        first, last = hour_index(start), hour_index(end)
+        frame = pd.DataFrame(
+            {v: self.read_range(city, v, first, last + 1) for v in variables},
+            columns=list(variables)
+        )
+        frame.insert(0, time_col, index_to_timestamp(np.arange(first, last + 1)))
+        return frame
+
+    def window(self, city: str, variable: str, ts: Timestamps, hours: int) -> np.ndarray:
+        """The `hours` values ending at (and including) the hour of `ts`, oldest first."""
+        end = hour_index(ts) + 1
+        return self.read_range(city, variable, end - hours, end)
+
+    def lags(self, city: str, variable: str, ts: Timestamps, lags: Iterable[int]) -> Dict[int, Optional[float]]:
+        """{k: value k hours before ts}; None for missing hours."""
+        lags = list(lags)
+        window = self.window(city, variable, ts, max(lags) + 1)
+        return {k: (None if np.isnan(window[-1 - k]) else float(window[-1 - k])) for k in lags}
+
+    # ------------------------------
+    # Writes
+    # ------------------------------
+    def write(self, city: str, variable: str, timestamps: Timestamps, values) -> int:
+        """
+        Scatter values into their hour slots (later duplicates win); None
+        and NaN mark an hour as missing. Returns the number of slots written.
+        """
+        slots = hour_index(timestamps) - self.origin
+        values = pd.to_numeric(pd.Series(list(values), dtype="object"), errors="coerce").to_numpy(dtype="float64")
+        if len(slots) == 0:
+            return 0
+        if slots.min() < 0:
+            raise ValueError(f"Timestamps before the store origin {index_to_timestamp(self.origin)}")
+
+        path = self.path(city, variable)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        length = os.path.getsize(path) // DTYPE.itemsize if os.path.exists(path) else 0
+        needed = int(slots.max()) + 1
+        if needed > length:
+            with open(path, "ab") as f:
+                f.write(np.full(needed - length, np.nan, dtype=DTYPE).tobytes())
+
+        array = np.memmap(path, dtype=DTYPE, mode="r+")
+        array[slots] = values
+        array.flush()
+        del array
+        # Cached read-only views of this file may be shorter now
+        self._arrays.pop(path, None)
+        return len(slots)
+
+    def write_frame(
+        self,
+        city: str,
+        df: pd.DataFrame,
+        variables: Optional[Sequence[str]] = None,
+        time_col: str = "event_timestamp"
+    ) -> int:
+        """Write the numeric columns (or `variables`) of one city's rows."""
+        if df.empty:
+            return 0
+        if variables is None:
+            variables = [
+                c for c in df.columns
+                if c != time_col and pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])
+            ]
+        for variable in variables:
+            self.write(city, variable, df[time_col], df[variable])
+        return len(df)
+
+
+def materialize_from_mongo(
+    store: HourlyArrayStore,
+    db,
+    dataset: str = "features",
+    start: Optional[datetime] = None,
+    chunk_size: int = 10_000
+) -> int:
+    """
+    Copy a MongoDB collection (see offline_store.MATERIALIZATIONS) into
+    the array store, chunk by chunk, one write per city and chunk.
+    """
+    # pyarrow is only needed for this bulk copy, not for array reads
+    from .export import iter_document_chunks
+    from .offline_store import MATERIALIZATIONS, TIME_COL, flatten_documents
+
+    spec = MATERIALIZATIONS[dataset]
+    query = {spec.time_path: {"$gte": start}} if start else {}
+
+    written = 0
+    for chunk in iter_document_chunks(db[spec.collection], query, chunk_size=chunk_size):
+        frame = flatten_documents(chunk, spec)
+        frame[TIME_COL] = pd.to_datetime(frame[TIME_COL], utc=True)
+        for city, rows in frame.groupby("city"):
+            written += store.write_frame(city, rows.drop(columns=["city"]), time_col=TIME_COL)
+
+    logger.info(f"Materialized {written} rows from {spec.collection} into {store.root}")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from src.utils.mongo_client import get_database
+
+    parser = argparse.ArgumentParser(description="Copy MongoDB hourly data into the memmap array store")
+    parser.add_argument("dataset", nargs="?", default="features")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongo_db = get_database()
+    print(f"{materialize_from_mongo(HourlyArrayStore(), mongo_db, args.dataset, args.start)} rows written")
@@ -0,0 +1,177 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+import threading
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+    name: Optional[str] = None
+
+    @property
+    def index_name(self) -> str:
+        # Same default naming as MongoDB, so existing indexes are recognised
+        return self.name or "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+# Indexes every collection needs, keyed by collection name
+COLLECTION_INDEXES: Dict[str, List[IndexSpec]] = {
+    "raw_aqi_weather_hourly": [
+        IndexSpec((("city", ASCENDING), ("timestamp", ASCENDING)), unique=True),
+    ],
+    "raw_aqi_weather": [
+        IndexSpec((("entity.city", ASCENDING), ("event_timestamp", ASCENDING)), unique=True),
+    ],
+    "features_aqi_v1": [
+        IndexSpec((("entity.city", ASCENDING), ("event_timestamp", ASCENDING)), unique=True),
+    ],
+    "merged_aqi_weather_hourly": [
+        IndexSpec((("city", ASCENDING), ("event_timestamp", ASCENDING)), unique=True),
+    ],
+    "feature_materializations": [
+        IndexSpec(
+            (("city", ASCENDING), ("feature_version", ASCENDING), ("event_timestamp", ASCENDING)),
+            unique=True
+        ),
+    ],
+}
+
+# Representative shapes of the queries the pipelines run most
+_SAMPLE_TS = datetime(2024, 1, 1)
+HOT_QUERIES: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {
+    "raw_aqi_weather_hourly": [
+        ("hourly record upsert", {"city": "karachi", "timestamp": _SAMPLE_TS}),
+    ],
+    "raw_aqi_weather": [
+        ("batch feature load", {"entity.city": "karachi", "event_timestamp": {"$gte": _SAMPLE_TS}}),
+    ],
+    "features_aqi_v1": [
+        ("lag history range", {"entity.city": "karachi", "event_timestamp": {"$gte": _SAMPLE_TS, "$lt": _SAMPLE_TS}}),
+        ("feature upsert", {"entity.city": "karachi", "event_timestamp": _SAMPLE_TS}),
+    ],
+    "merged_aqi_weather_hourly": [
+        ("merged delta upsert", {"city": "karachi", "event_timestamp": _SAMPLE_TS}),
+    ],
+    "feature_materializations": [
+        ("manifest range", {
+            "city": "karachi", "feature_version": "v2", "event_timestamp": {"$gte": _SAMPLE_TS, "$lte": _SAMPLE_TS}
+        }),
+    ],
+}
+
+
+def ensure_indexes(db, collections: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """
+    Create the declared indexes (idempotent: existing ones are no-ops).
+    Returns index names per collection.
+    """
+    created = {}
+    for name in collections or COLLECTION_INDEXES:
+        created[name] = [
+            db[name].create_index(list(spec.keys), unique=spec.unique, name=spec.index_name)
+            for spec in COLLECTION_INDEXES.get(name, [])
+        ]
+    return created
+
+
+_ensured = set()
+_ensured_lock = threading.Lock()
+
+
+def ensure_indexes_once(db, collections: Optional[Iterable[str]] = None):
+    """
+    ensure_indexes at most once per process for each collection, so
+    constructing handlers or running pipelines repeatedly costs no
+    create_index round trips after the first.
+    """
+    with _ensured_lock:
+        pending = [
+            name for name in (collections or COLLECTION_INDEXES)
+            if (db.name, name) not in _ensured
+        ]
+        if pending:
+            ensure_indexes(db, pending)
+            _ensured.update((db.name, name) for name in pending)
+
+
+def index_report(db, collections: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compare declared and existing indexes per collection.
+
+    missing: declared but not built. undeclared: built but not declared.
+    unused: built but never used since the server started ($indexStats;
+    empty when the user lacks the privilege).
+    """
+    report = {}
+    for name in collections or COLLECTION_INDEXES:
+        collection = db[name]
+        existing = set(collection.index_information()) - {"_id_"}
+        declared = {spec.index_name for spec in COLLECTION_INDEXES.get(name, [])}
+
+        try:
+            stats = list(collection.aggregate([{"$indexStats": {}}]))
+            unused = sorted(
+                s["name"] for s in stats
+                if s["name"] != "_id_" and s.get("accesses", {}).get("ops", 0) == 0
+            )
+        except OperationFailure:
+            logger.warning(f"$indexStats unavailable for {name}")
+            unused = []
+
+        report[name] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared),
+            "unused": unused,
+        }
+    return report
+
+
+def verify_hot_queries(db, collections: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    explain() every hot query and report whether the winning plan is an
+    index scan (and which index) rather than a collection scan.
+    """
+    results = []
+    for name in collections or HOT_QUERIES:
+        for description, query in HOT_QUERIES.get(name, []):
+            plan = db[name].find(query).explain()["queryPlanner"]["winningPlan"]
+            stages = list(_plan_stages(plan))
+            index_names = [s.get("indexName") for s in stages if s.get("stage") == "IXSCAN"]
+            results.append({
+                "collection": name,
+                "query": description,
+                "uses_index": bool(index_names) and all(s.get("stage") != "COLLSCAN" for s in stages),
+                "index": index_names[0] if index_names else None,
+            })
+    return results
+
+
+def _plan_stages(plan: Dict[str, Any]):
+    yield plan
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            yield from _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from src.utils.mongo_client import get_database
+
+    load_dotenv()
+    db = get_database()
+    print("Ensured:", ensure_indexes(db))
+    for collection, entry in index_report(db).items():
+        print(collection, entry)
+    for result in verify_hot_queries(db):
+        status = "OK " if result["uses_index"] else "SCAN"
+        print(f"[{status}] {result['collection']}: {result['query']} -> {result['index']}")
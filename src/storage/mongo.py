@@ -1,26 +1,137 @@
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import logging
 import os
 from dotenv import load_dotenv
 
+from .indexes import ensure_indexes_once
+from .timeseries import (
+    LAYOUTS,
+    create_timeseries_collection,
+    from_timeseries_document,
+    replace_timeseries_records,
+    timeseries_name,
+)
+
+from src.utils.mongo_client import get_database, get_mongo_client
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "aqi_feature_store"
 HOURLY_COLLECTION = "raw_aqi_weather_hourly"
+HOURLY_KEY_FIELDS = ("city", "timestamp")
+DEFAULT_BATCH_SIZE = 1000
+# "document" (one upserted doc per hour) or "timeseries" (MongoDB 5.0+ bucketed)
+STORAGE_MODE = os.getenv("MONGO_STORAGE_MODE", "document")
+
+
+@dataclass
+class BulkUpsertResult:
+    """
+    Aggregated outcome of a bulk_upsert call across all batches.
+    """
+
+    batches: int = 0
+    matched: int = 0
+    modified: int = 0
+    upserted: int = 0
+    # writeErrors from every failed batch, with `index` relative to the input
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _key_value(record: dict, path: str):
+    value = record
+    for part in path.split("."):
+        value = value[part]
+    return value
+
+
+def bulk_upsert(
+    collection,
+    records: Iterable[dict],
+    key_fields: Sequence[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    write_concern: Optional[WriteConcern] = None,
+    ordered: bool = False
+) -> BulkUpsertResult:
+    """
+    Upsert records in bulk_write batches of UpdateOne(upsert=True),
+    matching on key_fields (dotted paths allowed, e.g. "entity.city").
+
+    Batches are unordered by default so one bad document does not stop
+    the rest; per-batch write errors are collected instead of raised.
+    """
+    if write_concern is not None:
+        collection = collection.with_options(write_concern=write_concern)
+
+    result = BulkUpsertResult()
+    batch: List[UpdateOne] = []
+    offset = 0
+
+    def flush():
+        nonlocal batch, offset
+        try:
+            outcome = collection.bulk_write(batch, ordered=ordered)
+            details = outcome.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for error in details.get("writeErrors", []):
+                result.errors.append({**error, "index": offset + error["index"]})
+
+        result.batches += 1
+        result.matched += details.get("nMatched", 0)
+        result.modified += details.get("nModified", 0)
+        result.upserted += details.get("nUpserted", 0)
+        offset += len(batch)
+        batch = []
+
+    for record in records:
+        batch.append(UpdateOne(
+            {key: _key_value(record, key) for key in key_fields},
+            {"$set": record},
+            upsert=True
+        ))
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    return result
 
 
 class MongoHandler:
-    def __init__(self, uri: str = MONGO_URI):
-        self.client = MongoClient(uri)
-        self.db = self.client[DB_NAME]
-        self.collection = self.db[HOURLY_COLLECTION]
-
-        # Ensure unique constraint (industry best practice)
-        self.collection.create_index(
-            [("city", ASCENDING), ("timestamp", ASCENDING)],
-            unique=True
-        )
+    def __init__(self, uri: Optional[str] = None, storage_mode: str = STORAGE_MODE):
+        """
+        Uses the shared process-wide client unless a different uri is given.
+        """
+        if storage_mode not in ("document", "timeseries"):
+            raise ValueError(f"Unknown storage mode: {storage_mode}")
+
+        self.client = MongoClient(uri) if uri and uri != MONGO_URI else get_mongo_client()
+        self.db = get_database(client=self.client)
+        self.storage_mode = storage_mode
+        self.layout = LAYOUTS[HOURLY_COLLECTION]
+
+        if storage_mode == "timeseries":
+            self.collection = create_timeseries_collection(
+                self.db, timeseries_name(HOURLY_COLLECTION), self.layout
+            )
+        else:
+            self.collection = self.db[HOURLY_COLLECTION]
+
+            # Ensure unique constraint (industry best practice), once per process
+            ensure_indexes_once(self.db, [HOURLY_COLLECTION])
 
     def upsert_hourly_record(self, record: dict):
         """
@@ -33,6 +144,13 @@ class MongoHandler:
             if field not in record:
                 raise ValueError(f"Missing required field: {field}")
 
+        # Write time, so the offline store picks up late and corrected rows
+        record = {**record, "updated_at": datetime.utcnow()}
+
+        if self.storage_mode == "timeseries":
+            replace_timeseries_records(self.collection, [record], self.layout)
+            return
+
         self.collection.update_one(
             {
                 "city": record["city"],
@@ -42,7 +160,59 @@ class MongoHandler:
             upsert=True
         )
 
+    def upsert_records(
+        self,
+        records: Iterable[dict],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        write_concern: Optional[WriteConcern] = None
+    ) -> BulkUpsertResult:
+        """
+        Bulk upsert hourly records (unordered batches of batch_size).
+        Every record is validated like upsert_hourly_record before any
+        write is sent.
+        """
+        records = list(records)
+        required_fields = ["city", "timestamp", "aqi", "weather"]
+
+        for record in records:
+            for field_name in required_fields:
+                if field_name not in record:
+                    raise ValueError(f"Missing required field: {field_name}")
+
+        updated_at = datetime.utcnow()
+        records = [{**record, "updated_at": updated_at} for record in records]
+
+        if self.storage_mode == "timeseries":
+            collection = self.collection
+            if write_concern is not None:
+                collection = collection.with_options(write_concern=write_concern)
+            result = BulkUpsertResult()
+            for offset in range(0, len(records), batch_size):
+                batch = records[offset:offset + batch_size]
+                result.upserted += replace_timeseries_records(collection, batch, self.layout)
+                result.batches += 1
+            return result
+
+        result = bulk_upsert(
+            self.collection,
+            records,
+            HOURLY_KEY_FIELDS,
+            batch_size=batch_size,
+            write_concern=write_concern
+        )
+
+        if result.errors:
+            logger.error(f"{len(result.errors)} hourly records failed to upsert")
+
+        return result
+
     def get_hourly_record(self, city: str, timestamp: datetime):
+        if self.storage_mode == "timeseries":
+            doc = self.collection.find_one(
+                {self.layout.city_field: city, "timestamp": timestamp}
+            )
+            return from_timeseries_document(doc, self.layout) if doc else None
+
         return self.collection.find_one(
             {"city": city, "timestamp": timestamp}
         )
@@ -0,0 +1,297 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+import json
+import logging
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from .export import iter_document_chunks
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_OFFLINE_DIR = os.getenv("AQI_OFFLINE_STORE_DIR", os.path.join(PROJECT_ROOT, "data", "offline"))
+
+PARTITION_COLS = ["city", "year", "month"]
+PARTITION_SCHEMA = pa.schema([("city", pa.string()), ("year", pa.int32()), ("month", pa.int32())])
+TIME_COL = "event_timestamp"
+WATERMARK_FILE = "_materialized.json"
+
+# Writes this recent may still be landing out of order; the watermark
+# never moves past now - WRITE_SETTLE, so they are read again next run
+WRITE_SETTLE = pd.Timedelta(minutes=10)
+
+
+@dataclass(frozen=True)
+class MaterializationSpec:
+    """
+    How a MongoDB collection is flattened into an offline dataset.
+    """
+
+    collection: str
+    city_path: str
+    time_path: str
+    # Stamped on every insert and overwrite; the materialization watermark
+    updated_path: str
+    # Prefix removed from flattened column names (e.g. "features_aqi" -> "aqi")
+    strip_prefix: Optional[str] = None
+
+
+MATERIALIZATIONS: Dict[str, MaterializationSpec] = {
+    "raw_hourly": MaterializationSpec(
+        collection="raw_aqi_weather_hourly", city_path="city", time_path="timestamp",
+        updated_path="updated_at"
+    ),
+    "features": MaterializationSpec(
+        collection="features_aqi_v1", city_path="entity.city", time_path="event_timestamp",
+        updated_path="created_at", strip_prefix="features_"
+    ),
+}
+
+
+class ParquetOfflineStore:
+    """
+    Local Parquet store partitioned by city/year/month (hive layout).
+
+    Appends add new files and never rewrite old ones. Reads prune
+    partitions by city and month and push the time-range predicate down
+    to Parquet row-group statistics, reading only the requested columns.
+    """
+
+    def __init__(self, root: str = DEFAULT_OFFLINE_DIR):
+        self.root = root
+
+    def path(self, dataset: str) -> str:
+        return os.path.join(self.root, dataset)
+
+    def append(self, dataset: str, df: pd.DataFrame) -> int:
+        """
+        Append rows with `city` and `event_timestamp` columns. Numeric
+        columns are stored as float64 so appends of differently typed
+        chunks keep a single schema.
+        """
+        if df.empty:
+            return 0
+
+        frame = df.copy()
+        frame[TIME_COL] = pd.to_datetime(frame[TIME_COL], utc=True).astype("datetime64[ns, UTC]")
+        frame["city"] = frame["city"].astype(str).str.lower()
+        frame["year"] = frame[TIME_COL].dt.year.astype("int32")
+        frame["month"] = frame[TIME_COL].dt.month.astype("int32")
+
+        for col in frame.columns:
+            if col in PARTITION_COLS or col == TIME_COL:
+                continue
+            if pd.api.types.is_numeric_dtype(frame[col]) and not pd.api.types.is_bool_dtype(frame[col]):
+                frame[col] = frame[col].astype("float64")
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        ds.write_dataset(
+            table,
+            self.path(dataset),
+            format="parquet",
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore"
+        )
+        logger.info(f"Appended {len(frame)} rows to offline dataset {dataset}")
+        return len(frame)
+
+    def dataset(self, dataset: str) -> Optional[ds.Dataset]:
+        if not os.path.isdir(self.path(dataset)):
+            return None
+
+        partitioning = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+        data = ds.dataset(self.path(dataset), format="parquet", partitioning=partitioning)
+
+        # Files appended at different times may disagree on a column (e.g.
+        # all-null in one chunk); read them through one promoted schema
+        schema = pa.unify_schemas(
+            [fragment.physical_schema for fragment in data.get_fragments()] + [PARTITION_SCHEMA],
+            promote_options="permissive"
+        )
+        return ds.dataset(self.path(dataset), schema=schema, format="parquet", partitioning=partitioning)
+
+    def read(
+        self,
+        dataset: str,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        cities: Optional[Iterable[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Rows with start <= event_timestamp < end for the given cities,
+        projected to `columns` (city and event_timestamp always included).
+        """
+        data = self.dataset(dataset)
+        if data is None:
+            return pd.DataFrame(columns=["city", TIME_COL, *(columns or [])])
+
+        selected = None
+        if columns is not None:
+            selected = list(dict.fromkeys(["city", TIME_COL, *columns]))
+
+        # Corrected rows are appended, not rewritten: keep the latest write
+        updated_col = _updated_column(dataset)
+        dedupe = updated_col is not None and updated_col in data.schema.names
+        if dedupe and selected is not None and updated_col not in selected:
+            selected = selected + [updated_col]
+
+        table = data.to_table(columns=selected, filter=self._filter(start, end, cities))
+        frame = table.to_pandas()
+        if dedupe:
+            frame = frame.sort_values(updated_col, kind="stable", na_position="first")
+            frame = frame.drop_duplicates(["city", TIME_COL], keep="last")
+            if columns is not None and updated_col not in columns:
+                frame = frame.drop(columns=[updated_col])
+        return frame.sort_values(["city", TIME_COL], kind="stable").reset_index(drop=True)
+
+    def latest_timestamp(self, dataset: str, city: Optional[str] = None) -> Optional[pd.Timestamp]:
+        data = self.dataset(dataset)
+        if data is None:
+            return None
+
+        filter_ = ds.field("city") == city.lower() if city else None
+        times = data.to_table(columns=[TIME_COL], filter=filter_).column(TIME_COL)
+        if len(times) == 0:
+            return None
+        latest = pc.max(times).as_py()
+        return pd.Timestamp(latest) if latest is not None else None
+
+    def materialized_through(self, dataset: str) -> Optional[datetime]:
+        """
+        Write time up to which `dataset` has been copied from MongoDB
+        (naive UTC), or None before the first materialization.
+        """
+        path = os.path.join(self.path(dataset), WATERMARK_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return datetime.fromisoformat(json.load(f)["updated_through"])
+
+    def set_materialized_through(self, dataset: str, value: datetime) -> None:
+        os.makedirs(self.path(dataset), exist_ok=True)
+        path = os.path.join(self.path(dataset), WATERMARK_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"updated_through": value.isoformat()}, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _filter(start, end, cities) -> Optional[ds.Expression]:
+        conditions = []
+        if cities is not None:
+            conditions.append(ds.field("city").isin([c.lower() for c in cities]))
+        if start is not None:
+            start = _utc(start)
+            conditions.append(_month_at_or_after(start.year, start.month))
+            conditions.append(ds.field(TIME_COL) >= _time_scalar(start))
+        if end is not None:
+            end = _utc(end)
+            conditions.append(_month_at_or_before(end.year, end.month))
+            conditions.append(ds.field(TIME_COL) < _time_scalar(end))
+
+        if not conditions:
+            return None
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression = expression & condition
+        return expression
+
+
+def _utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _time_scalar(ts: pd.Timestamp) -> pa.Scalar:
+    return pa.scalar(ts.to_pydatetime(), pa.timestamp("ns", "UTC"))
+
+
+def _month_at_or_after(year: int, month: int) -> ds.Expression:
+    # Written on partition fields only, so whole directories are pruned
+    return (ds.field("year") > year) | ((ds.field("year") == year) & (ds.field("month") >= month))
+
+
+def _month_at_or_before(year: int, month: int) -> ds.Expression:
+    return (ds.field("year") < year) | ((ds.field("year") == year) & (ds.field("month") <= month))
+
+
+def _updated_column(dataset: str) -> Optional[str]:
+    spec = MATERIALIZATIONS.get(dataset)
+    return spec.updated_path.replace(".", "_") if spec else None
+
+
+def flatten_documents(docs: List[dict], spec: MaterializationSpec) -> pd.DataFrame:
+    """
+    Flatten MongoDB documents into offline-store rows.
+    """
+    frame = pd.json_normalize(docs, sep="_")
+    city_col = spec.city_path.replace(".", "_")
+    time_col = spec.time_path.replace(".", "_")
+
+    frame = frame.drop(columns=[c for c in ("_id",) if c in frame.columns])
+    frame = frame.rename(columns={city_col: "city", time_col: TIME_COL})
+    if spec.strip_prefix:
+        frame = frame.rename(columns={
+            c: c[len(spec.strip_prefix):] for c in frame.columns if c.startswith(spec.strip_prefix)
+        })
+    return frame
+
+
+def materialize_from_mongo(
+    store: ParquetOfflineStore,
+    db,
+    dataset: str,
+    chunk_size: int = 10_000
+) -> int:
+    """
+    Incrementally copy a MongoDB collection into the offline store.
+
+    The watermark is the write time (`spec.updated_path`), not the event
+    time, so a city that lags the others and backfilled or corrected
+    older rows are still picked up. Re-copied rows are appended and
+    `read` keeps the latest write per (city, event_timestamp).
+    """
+    spec = MATERIALIZATIONS[dataset]
+    mark = store.materialized_through(dataset)
+
+    # MongoDB stores naive UTC datetimes
+    settled = (pd.Timestamp.utcnow() - WRITE_SETTLE).tz_localize(None).to_pydatetime()
+    query = {spec.updated_path: {"$gt": mark}} if mark is not None else {}
+
+    written = 0
+    newest = mark
+    chunks = iter_document_chunks(db[spec.collection], query, chunk_size=chunk_size, sort=[(spec.updated_path, 1)])
+    for chunk in chunks:
+        written += store.append(dataset, flatten_documents(chunk, spec))
+
+        stamps = [
+            doc[spec.updated_path] for doc in chunk if isinstance(doc.get(spec.updated_path), datetime)
+        ]
+        if stamps:
+            through = min(max(stamps), settled)
+            newest = through if newest is None else max(newest, through)
+            store.set_materialized_through(dataset, newest)
+
+    logger.info(f"Materialized {written} new rows into {dataset} (written through {newest})")
+    return written
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    from src.utils.mongo_client import get_database
+
+    load_dotenv()
+    mongo_db = get_database()
+    offline = ParquetOfflineStore()
+    for name in sys.argv[1:] or list(MATERIALIZATIONS):
+        print(f"{name}: {materialize_from_mongo(offline, mongo_db, name)} new rows")
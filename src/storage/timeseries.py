@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from pymongo import ASCENDING
+
+logger = logging.getLogger(__name__)
+
+META_FIELD = "meta"
+TIMESERIES_SUFFIX = "_ts"
+
+
+@dataclass(frozen=True)
+class TimeSeriesLayout:
+    """
+    How a document collection maps onto a MongoDB time-series collection.
+
+    meta_fields (dotted source paths) are folded into a single `meta`
+    sub-document keyed by their last path segment, so MongoDB stores them
+    once per bucket instead of once per hour. drop_fields are per-row
+    metadata that is not worth keeping in the bucketed layout.
+    """
+
+    time_field: str
+    meta_fields: Tuple[str, ...]
+    drop_fields: Tuple[str, ...] = ()
+    granularity: str = "hours"
+
+    @property
+    def city_field(self) -> str:
+        return f"{META_FIELD}.city"
+
+
+LAYOUTS: Dict[str, TimeSeriesLayout] = {
+    "raw_aqi_weather_hourly": TimeSeriesLayout(
+        time_field="timestamp",
+        meta_fields=("city", "source"),
+        drop_fields=("ingested_at",),
+    ),
+    "features_aqi_v1": TimeSeriesLayout(
+        time_field="event_timestamp",
+        meta_fields=("entity.city", "source"),
+        drop_fields=("created_at",),
+    ),
+}
+
+
+def timeseries_name(collection_name: str) -> str:
+    return f"{collection_name}{TIMESERIES_SUFFIX}"
+
+
+def create_timeseries_collection(db, name: str, layout: TimeSeriesLayout):
+    """
+    Create `name` as a time-series collection (no-op if it exists) with a
+    (meta.city, time) secondary index for range scans. Requires MongoDB 5.0+.
+    """
+    if name not in db.list_collection_names():
+        db.command(
+            "create",
+            name,
+            timeseries={
+                "timeField": layout.time_field,
+                "metaField": META_FIELD,
+                "granularity": layout.granularity,
+            }
+        )
+        logger.info(f"Created time-series collection {name}")
+
+    db[name].create_index([(layout.city_field, ASCENDING), (layout.time_field, ASCENDING)])
+    return db[name]
+
+
+def _pop_path(doc: Dict[str, Any], path: str):
+    parts = path.split(".")
+    parent = doc
+    for part in parts[:-1]:
+        parent = parent.get(part)
+        if not isinstance(parent, dict):
+            return None
+    value = parent.pop(parts[-1], None)
+    # Drop containers emptied by the move (e.g. `entity`)
+    if len(parts) > 1 and not parent:
+        doc.pop(parts[0], None)
+    return value
+
+
+def to_timeseries_document(doc: Dict[str, Any], layout: TimeSeriesLayout) -> Dict[str, Any]:
+    converted = {k: v for k, v in doc.items() if k != "_id" and k not in layout.drop_fields}
+    converted = {k: (dict(v) if isinstance(v, dict) else v) for k, v in converted.items()}
+    converted[META_FIELD] = {
+        path.split(".")[-1]: _pop_path(converted, path) for path in layout.meta_fields
+    }
+    return converted
+
+
+def from_timeseries_document(doc: Dict[str, Any], layout: TimeSeriesLayout) -> Dict[str, Any]:
+    """
+    Inverse of to_timeseries_document, so readers see the document layout.
+    """
+    restored = {k: v for k, v in doc.items() if k not in ("_id", META_FIELD)}
+    meta = doc.get(META_FIELD, {})
+    for path in layout.meta_fields:
+        parts = path.split(".")
+        target = restored
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = meta.get(parts[-1])
+    return restored
+
+
+def replace_timeseries_records(collection, docs: Iterable[Dict[str, Any]], layout: TimeSeriesLayout) -> int:
+    """
+    Upsert equivalent for time-series collections: delete any existing
+    measurements for the same (city, hour) and insert the new ones.
+    Deleting on the time field needs MongoDB 7.0+.
+    """
+    converted = [to_timeseries_document(doc, layout) for doc in docs]
+    if not converted:
+        return 0
+
+    by_city: Dict[Any, List[Any]] = {}
+    for doc in converted:
+        by_city.setdefault(doc[META_FIELD].get("city"), []).append(doc[layout.time_field])
+
+    for city, times in by_city.items():
+        collection.delete_many({layout.city_field: city, layout.time_field: {"$in": times}})
+
+    collection.insert_many(converted, ordered=False)
+    return len(converted)
+
+
+def migrate_to_timeseries(
+    db,
+    source_name: str,
+    target_name: Optional[str] = None,
+    batch_size: int = 5000
+) -> int:
+    """
+    Copy a document collection into its time-series counterpart in time
+    order, one insert_many per batch. Resumable: copying restarts after
+    the newest measurement already present in the target.
+    """
+    layout = LAYOUTS[source_name]
+    target_name = target_name or timeseries_name(source_name)
+    target = create_timeseries_collection(db, target_name, layout)
+
+    query: Dict[str, Any] = {}
+    newest = target.find_one({}, sort=[(layout.time_field, -1)])
+    if newest:
+        # Finish the newest hour in case the previous run stopped mid-batch
+        last = newest[layout.time_field]
+        target.delete_many({layout.time_field: last})
+        query = {layout.time_field: {"$gte": last}}
+
+    cursor = db[source_name].find(query).sort(layout.time_field, ASCENDING).batch_size(batch_size)
+
+    copied = 0
+    batch = []
+    for doc in cursor:
+        batch.append(to_timeseries_document(doc, layout))
+        if len(batch) >= batch_size:
+            target.insert_many(batch, ordered=False)
+            copied += len(batch)
+            batch = []
+            logger.info(f"Migrated {copied} documents from {source_name}")
+
+    if batch:
+        target.insert_many(batch, ordered=False)
+        copied += len(batch)
+
+    logger.info(f"Migration {source_name} -> {target_name} complete: {copied} documents")
+    return copied
@@ -1,37 +1,50 @@
-from utils.mongo_client import get_mongo_client
+import os
+import sys
+
+# Project root on sys.path, so this also runs as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.utils.mongo_client import get_database
+from src.storage.coverage import coverage_report, missing_ranges
 import pandas as pd
 
-# 1️⃣ Connect to MongoDB
-client = get_mongo_client()
-db = client['aqi_feature_store']
+# 1️⃣ Connect to MongoDB (the database the feature pipeline writes to)
+db = get_database()
 collection = db['features_aqi_v1']
 
 # 2️⃣ Count total documents
 total_docs = collection.count_documents({})
 print(f"Total documents in features_aqi_v1: {total_docs}")
 
-# 3️⃣ Pull timestamps and features
-docs = list(collection.find({}, {"event_timestamp": 1, "features.aqi": 1}))
-df = pd.DataFrame(docs)
-df['event_timestamp'] = pd.to_datetime(df['event_timestamp'])
+# 3️⃣ Coverage per city/day, grouped server-side (one small row per day)
+days = coverage_report(collection)
+if not days:
+    print("No feature documents found.")
+    raise SystemExit(0)
+
+coverage = pd.DataFrame([
+    {"city": d.city, "date": d.day.date(), "records": d.documents,
+     "hours": d.hours_present, "coverage": d.render()}
+    for d in days
+])
 
 # 4️⃣ Date range
-start_date = df['event_timestamp'].min()
-end_date = df['event_timestamp'].max()
-print(f"Data range: {start_date} → {end_date}")
+print(f"Data range: {min(d.day for d in days).date()} → {max(d.day for d in days).date()}")
 
 # 5️⃣ Daily coverage
-df['date'] = df['event_timestamp'].dt.date
-daily_counts = df.groupby('date').size()
 print("Daily record counts:")
-print(daily_counts)
+print(coverage.set_index(["city", "date"])["records"])
 
 # 6️⃣ Hourly coverage check
-df['hour'] = df['event_timestamp'].dt.hour
-hourly_counts = df.groupby(['date', 'hour']).size().unstack(fill_value=0)
-print("Hourly coverage per day (0 means missing hour):")
-print(hourly_counts)
+print("Hourly coverage per day ('.' means missing hour, hour 0 first):")
+print(coverage.set_index(["city", "date"])[["hours", "coverage"]].to_string())
+
+# 7️⃣ Missing hour ranges
+gaps = missing_ranges(days)
+print(f"Missing ranges: {len(gaps)} ({sum(g.hours for g in gaps)} hours)")
+for gap in gaps:
+    print(f"{gap.city}: {gap.start} → {gap.end} ({gap.hours}h)")
 
-# 7️⃣ Sample data
+# 8️⃣ Sample data
 print("Sample feature row:")
-print(df.head(3))
+print(pd.DataFrame(list(collection.find({}, {"event_timestamp": 1, "features.aqi": 1}).limit(3))))
@@ -1,4 +1,10 @@
-from utils.mongo_client import get_mongo_client
+import os
+import sys
+
+# Project root on sys.path, so this also runs as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.utils.mongo_client import get_mongo_client
 
 # Connect to MongoDB
 client = get_mongo_client()
@@ -0,0 +1,52 @@
+from typing import Any, Dict
+import os
+
+import yaml
+
+CONFIG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "config"))
+INGESTION_CONFIG_PATH = os.path.join(CONFIG_DIR, "ingestion.yaml")
+CITIES_CONFIG_PATH = os.path.join(CONFIG_DIR, "cities.yaml")
+
+INGESTION_DEFAULTS = {
+    "batch_size_days": 10,
+    "max_workers": 1,
+}
+
+
+def load_yaml(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_ingestion_config(path: str = INGESTION_CONFIG_PATH) -> Dict[str, Any]:
+    """
+    src/config/ingestion.yaml with defaults filled in. date_range must
+    define start_date and end_date (YYYY-MM-DD).
+    """
+    config = {**INGESTION_DEFAULTS, **load_yaml(path)}
+
+    date_range = config.get("date_range") or {}
+    missing = [key for key in ("start_date", "end_date") if not date_range.get(key)]
+    if missing:
+        raise ValueError(f"{path}: date_range is missing {', '.join(missing)}")
+    if int(config["batch_size_days"]) < 1:
+        raise ValueError(f"{path}: batch_size_days must be at least 1")
+
+    return config
+
+
+def load_cities_config(path: str = CITIES_CONFIG_PATH) -> Dict[str, Any]:
+    """
+    src/config/cities.yaml: a non-empty `cities` list whose entries have
+    at least a name.
+    """
+    config = {"max_workers": 4, "rate_limits": {}, **load_yaml(path)}
+
+    cities = config.get("cities") or []
+    if not cities:
+        raise ValueError(f"{path}: no cities configured")
+    for entry in cities:
+        if not entry.get("name"):
+            raise ValueError(f"{path}: every city needs a name ({entry})")
+
+    return config
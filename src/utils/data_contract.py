@@ -24,3 +24,23 @@ def validate_hourly_record(record: dict):
             raise ValueError("Invalid AQI value")
 
     return True
+
+
+def validate_merged_record(record: dict):
+    """
+    Hard validation for merged hourly rows (pollutants + weather) before
+    they are stored. `us_aqi` is the historical target and must be
+    present, even if None for hours without enough pollutant data.
+    """
+
+    if not isinstance(record.get("event_timestamp"), datetime):
+        raise TypeError("event_timestamp must be datetime")
+
+    if "us_aqi" not in record:
+        raise ValueError("us_aqi missing")
+
+    if record["us_aqi"] is not None:
+        if record["us_aqi"] < 0:
+            raise ValueError("Invalid AQI value")
+
+    return True
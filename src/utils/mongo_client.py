@@ -1,15 +1,127 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import importlib.util
 import os
+import threading
+
 from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.errors import ConfigurationError
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_mongo_client():
-    uri = os.getenv("MONGO_URI")
-    if not uri:
-        raise ValueError("MONGO_URI not found in .env")
-    client = MongoClient(uri)
-    return client
+# Database used when MONGO_URI names none
+DEFAULT_DB_NAME = os.getenv("MONGO_DB_NAME", "aqi_feature_store")
+
+# Python package each wire compressor needs; zlib ships with Python
+_COMPRESSOR_PACKAGES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+
+@dataclass(frozen=True)
+class MongoClientSettings:
+    """
+    Connection settings for the process-wide client, read from the
+    environment by default (MONGO_URI, MONGO_MAX_POOL_SIZE, ...).
+    """
+
+    uri: Optional[str]
+    max_pool_size: int = 50
+    min_pool_size: int = 0
+    connect_timeout_ms: int = 5000
+    server_selection_timeout_ms: int = 10000
+    socket_timeout_ms: Optional[int] = None
+    compressors: Tuple[str, ...] = ("zstd", "snappy", "zlib")
+
+    @classmethod
+    def from_env(cls) -> "MongoClientSettings":
+        socket_timeout = os.getenv("MONGO_SOCKET_TIMEOUT_MS")
+        return cls(
+            uri=os.getenv("MONGO_URI"),
+            max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", cls.max_pool_size)),
+            min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", cls.min_pool_size)),
+            connect_timeout_ms=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", cls.connect_timeout_ms)),
+            server_selection_timeout_ms=int(
+                os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", cls.server_selection_timeout_ms)
+            ),
+            socket_timeout_ms=int(socket_timeout) if socket_timeout else None,
+            compressors=tuple(
+                c.strip() for c in os.getenv("MONGO_COMPRESSORS", ",".join(cls.compressors)).split(",") if c.strip()
+            ),
+        )
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+        }
+        compressors = available_compressors(self.compressors)
+        if compressors:
+            kwargs["compressors"] = ",".join(compressors)
+        return kwargs
+
+
+def available_compressors(requested) -> Tuple[str, ...]:
+    """
+    The requested compressors (in preference order) whose Python package
+    is installed; the server picks the first one it also supports.
+    """
+    usable = []
+    for name in requested:
+        if name not in _COMPRESSOR_PACKAGES:
+            raise ValueError(f"Unknown MongoDB compressor: {name}")
+        package = _COMPRESSOR_PACKAGES[name]
+        if package is None or importlib.util.find_spec(package) is not None:
+            usable.append(name)
+    return tuple(usable)
+
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+
+def get_mongo_client(settings: Optional[MongoClientSettings] = None) -> MongoClient:
+    """
+    Process-wide MongoClient, created on first use so importing pipeline
+    modules never touches the network. Every caller shares its connection
+    pool. `settings` only applies to the call that creates the client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            settings = settings or MongoClientSettings.from_env()
+            if not settings.uri:
+                raise ValueError("MONGO_URI not found in .env")
+            _client = MongoClient(settings.uri, **settings.client_kwargs())
+        return _client
+
+
+def get_database(name: Optional[str] = None, client: Optional[MongoClient] = None) -> Database:
+    """
+    Database `name` on `client` (default: the shared client); by default
+    the one named in the client's URI, else DEFAULT_DB_NAME. Every reader
+    and writer resolves the database this way.
+    """
+    client = client or get_mongo_client()
+    if name:
+        return client[name]
+    try:
+        return client.get_database()
+    except ConfigurationError:
+        return client[DEFAULT_DB_NAME]
+
+
+def close_mongo_client():
+    """Close the shared client; the next get_mongo_client() reconnects."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
 
 if __name__ == "__main__":
     client = get_mongo_client()
@@ -0,0 +1,195 @@
+"""
+US EPA Air Quality Index from pollutant concentrations, vectorized.
+
+Breakpoints follow the EPA AQI technical assistance document as revised
+in 2024 (PM2.5 annual-standard update). Inputs are Open-Meteo style
+concentrations in µg/m³ for every pollutant; gases are converted to
+ppb/ppm at 25 °C and 1 atm before applying the breakpoints.
+"""
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+POLLUTANTS = ("pm25", "pm10", "o3", "co", "so2", "no2")
+
+# Molar volume (L/mol) at 25 °C, 1 atm and molecular weights (g/mol)
+MOLAR_VOLUME = 24.45
+MOLECULAR_WEIGHT = {"o3": 48.00, "co": 28.01, "so2": 64.066, "no2": 46.0055}
+
+# Averaging period (hours) each pollutant's breakpoints are defined on
+AVERAGING_HOURS = {"pm25": 24, "pm10": 24, "o3": 8, "co": 8, "so2": 1, "no2": 1}
+# EPA completeness: an average needs 75% of its hours
+MIN_COVERAGE = 0.75
+
+# (C_low, C_high, I_low, I_high) per band, in the units below
+_INDEX_BANDS = ((0, 50), (51, 100), (101, 150), (151, 200), (201, 300), (301, 500))
+BREAKPOINTS: Dict[str, Tuple[Tuple[float, float, int, int], ...]] = {
+    # µg/m³, 24h, truncated to 0.1
+    "pm25": tuple(zip(
+        (0.0, 9.1, 35.5, 55.5, 125.5, 225.5), (9.0, 35.4, 55.4, 125.4, 225.4, 325.4), *zip(*_INDEX_BANDS)
+    )),
+    # µg/m³, 24h, truncated to 1
+    "pm10": tuple(zip(
+        (0, 55, 155, 255, 355, 425), (54, 154, 254, 354, 424, 604), *zip(*_INDEX_BANDS)
+    )),
+    # ppm, 8h, truncated to 0.001 (above 0.200 ppm the 1h table applies)
+    "o3": tuple(zip(
+        (0.000, 0.055, 0.071, 0.086, 0.106), (0.054, 0.070, 0.085, 0.105, 0.200), *zip(*_INDEX_BANDS[:5])
+    )),
+    # ppm, 8h, truncated to 0.1
+    "co": tuple(zip(
+        (0.0, 4.5, 9.5, 12.5, 15.5, 30.5), (4.4, 9.4, 12.4, 15.4, 30.4, 50.4), *zip(*_INDEX_BANDS)
+    )),
+    # ppb, 1h, truncated to 1 (AQI > 200 uses the 24h average, see below)
+    "so2": tuple(zip(
+        (0, 36, 76, 186, 305, 605), (35, 75, 185, 304, 604, 1004), *zip(*_INDEX_BANDS)
+    )),
+    # ppb, 1h, truncated to 1
+    "no2": tuple(zip(
+        (0, 54, 101, 361, 650, 1250), (53, 100, 360, 649, 1249, 2049), *zip(*_INDEX_BANDS)
+    )),
+}
+# 1h ozone (ppm), only reported at or above 0.125 ppm
+O3_1H_BREAKPOINTS = (
+    (0.125, 0.164, 101, 150),
+    (0.165, 0.204, 151, 200),
+    (0.205, 0.404, 201, 300),
+    (0.405, 0.604, 301, 500),
+)
+TRUNCATE_DECIMALS = {"pm25": 1, "pm10": 0, "o3": 3, "o3_1h": 3, "co": 1, "so2": 0, "no2": 0}
+MAX_INDEX = 500
+
+
+def ugm3_to_ppb(pollutant: str, values) -> np.ndarray:
+    """µg/m³ -> ppb for a gas at 25 °C, 1 atm."""
+    return np.asarray(values, dtype="float64") * MOLAR_VOLUME / MOLECULAR_WEIGHT[pollutant]
+
+
+def to_breakpoint_units(pollutant: str, values) -> np.ndarray:
+    """µg/m³ -> the unit the pollutant's breakpoints use."""
+    values = np.asarray(values, dtype="float64")
+    if pollutant in ("pm25", "pm10"):
+        return values
+    ppb = ugm3_to_ppb(pollutant, values)
+    return ppb / 1000.0 if pollutant in ("o3", "co") else ppb
+
+
+def _truncate(values: np.ndarray, decimals: int) -> np.ndarray:
+    scale = 10.0 ** decimals
+    # The epsilon keeps e.g. 9.1 from truncating to 9.0 through float error
+    return np.floor(values * scale + 1e-9) / scale
+
+
+def _interpolate(values: np.ndarray, bands: Sequence[Tuple[float, float, int, int]], decimals: int) -> np.ndarray:
+    """
+    Piecewise-linear breakpoint interpolation over an array. Negative or
+    missing concentrations give NaN; concentrations above the last band
+    are capped at MAX_INDEX.
+    """
+    c_low, c_high, i_low, i_high = (np.array(column, dtype="float64") for column in zip(*bands))
+    conc = _truncate(np.asarray(values, dtype="float64"), decimals)
+
+    band = np.clip(np.searchsorted(c_high, conc, side="left"), 0, len(bands) - 1)
+    index = (i_high[band] - i_low[band]) / (c_high[band] - c_low[band]) * (conc - c_low[band]) + i_low[band]
+    # EPA rounds the index to the nearest integer
+    index = np.floor(index + 0.5)
+    index = np.where(conc > c_high[-1], MAX_INDEX, index)
+    return np.where(np.isnan(conc) | (conc < 0), np.nan, index)
+
+
+def sub_index(pollutant: str, concentration, concentration_1h=None) -> np.ndarray:
+    """
+    AQI sub-index for concentrations already averaged over the pollutant's
+    period (AVERAGING_HOURS) and in breakpoint units.
+
+    For o3, `concentration_1h` (ppm) also applies where it is 0.125 ppm or
+    more, and the higher index wins. For so2 this is the 1h table only;
+    see us_aqi_frame for the 24h rule from 305 ppb.
+    """
+    index = _interpolate(concentration, BREAKPOINTS[pollutant], TRUNCATE_DECIMALS[pollutant])
+    if pollutant == "o3":
+        eight_hour = np.asarray(concentration, dtype="float64")
+        # Above 0.200 ppm the 8h table is undefined; the 1h value decides
+        index = np.where(_truncate(eight_hour, 3) > BREAKPOINTS["o3"][-1][1], np.nan, index)
+        if concentration_1h is not None:
+            one_hour = np.asarray(concentration_1h, dtype="float64")
+            hourly = _interpolate(one_hour, O3_1H_BREAKPOINTS, TRUNCATE_DECIMALS["o3_1h"])
+            hourly = np.where(_truncate(one_hour, 3) >= O3_1H_BREAKPOINTS[0][0], hourly, np.nan)
+            index = np.fmax(index, hourly)
+    return index
+
+
+def trailing_mean(
+    values,
+    timestamps,
+    hours: int,
+    groups=None,
+    min_coverage: float = MIN_COVERAGE
+) -> np.ndarray:
+    """
+    Mean over the trailing `hours` wall-clock hours (t - hours, t] of each
+    row, within its group (e.g. city). Gaps shorten the window instead of
+    stretching it, and a mean needs `min_coverage` of the hours, else NaN.
+    Rows may come in any order; results follow the input order.
+    """
+    values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64")
+    times = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True))
+    codes = pd.factorize(np.asarray(groups, dtype=object))[0] if groups is not None else np.zeros(len(values), int)
+
+    order = np.lexsort((times.asi8, codes))
+    series = pd.Series(values[order], index=times[order])
+    min_periods = int(np.ceil(hours * min_coverage))
+    # Rows are sorted by group, so the grouped output is in `order` too
+    rolled = series.groupby(codes[order], sort=False).rolling(f"{hours}h", min_periods=min_periods).mean()
+
+    out = np.empty(len(values))
+    out[order] = rolled.to_numpy()
+    return out
+
+
+def us_aqi_frame(
+    df: pd.DataFrame,
+    columns: Optional[Mapping[str, str]] = None,
+    time_col: str = "event_timestamp",
+    city_col: Optional[str] = "city"
+) -> pd.DataFrame:
+    """
+    Sub-indices (aqi_<pollutant>), the overall `us_aqi` and the
+    `dominant_pollutant` for every row of an hourly frame, from µg/m³
+    concentrations. `columns` maps pollutant -> column (default: the
+    pollutant names); pollutants without a column are ignored.
+    """
+    columns = {p: (columns or {}).get(p, p) for p in POLLUTANTS}
+    columns = {p: c for p, c in columns.items() if c in df.columns}
+    groups = df[city_col] if city_col and city_col in df.columns else None
+
+    def averaged(pollutant: str, hours: int) -> np.ndarray:
+        column = df[columns[pollutant]]
+        if hours == 1:
+            return to_breakpoint_units(pollutant, pd.to_numeric(column, errors="coerce"))
+        return to_breakpoint_units(pollutant, trailing_mean(column, df[time_col], hours, groups))
+
+    result = pd.DataFrame(index=df.index)
+    for pollutant in columns:
+        concentration = averaged(pollutant, AVERAGING_HOURS[pollutant])
+        if pollutant == "o3":
+            result["aqi_o3"] = sub_index("o3", concentration, averaged("o3", 1))
+        elif pollutant == "so2":
+            # From 305 ppb (1h) the index is 200 or more and EPA takes it
+            # from the 24h average instead
+            daily = np.fmax(_interpolate(averaged("so2", 24), BREAKPOINTS["so2"], 0), 200)
+            high = _truncate(concentration, 0) >= BREAKPOINTS["so2"][4][0]
+            result["aqi_so2"] = np.where(high, daily, sub_index("so2", concentration))
+        else:
+            result[f"aqi_{pollutant}"] = sub_index(pollutant, concentration)
+
+    indices = result[[f"aqi_{p}" for p in columns]].to_numpy(dtype="float64")
+    present = ~np.isnan(indices).all(axis=1) if len(columns) else np.zeros(len(df), dtype=bool)
+    filled = np.where(np.isnan(indices), -1.0, indices)
+    result["us_aqi"] = np.where(present, filled.max(axis=1, initial=-1.0), np.nan)
+    names = np.array(list(columns), dtype=object)
+    result["dominant_pollutant"] = np.where(
+        present, names[filled.argmax(axis=1)] if len(columns) else None, None
+    )
+    return result
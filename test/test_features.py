@@ -0,0 +1,364 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features import feature_pipeline
+from src.features.materialization import content_hash
+from src.features.rolling_features import ROLLING_COLUMNS, RollingStateStore, RollingWindowState
+from src.features.training_pipeline import AsOfSource, build_training_set, hourly_spine
+from src.models.predict import latest_feature_vector, predict_aqi
+from src.storage.hourly_array_store import HourlyArrayStore
+
+
+def test_hourly_spine_covers_every_entity_hour():
+    spine = hourly_spine(["karachi", "lahore"], "2024-01-01 00:00", "2024-01-01 05:30")
+    assert len(spine) == 12
+    assert str(spine["event_timestamp"].dt.tz) == "UTC"
+
+
+def test_training_set_asof_joins_without_leakage():
+    spine = hourly_spine(["karachi", "lahore"], "2024-01-01 00:00", "2024-01-01 03:00")
+    spine = spine.sample(frac=1, random_state=0)
+
+    pollutants = pd.DataFrame({
+        "city": ["karachi", "karachi", "lahore"],
+        "event_timestamp": pd.to_datetime(["2024-01-01 00:00", "2024-01-01 02:00", "2024-01-01 01:00"], utc=True),
+        "pm25": [10.0, 30.0, 99.0],
+    })
+    weather = pd.DataFrame({
+        "city": ["karachi", "lahore"],
+        # Only ever observed at 00:00; one hour tolerance
+        "event_timestamp": pd.to_datetime(["2024-01-01 00:00", "2024-01-01 00:00"], utc=True),
+        "temperature": [20.0, 15.0],
+    })
+
+    result = build_training_set(spine, [
+        AsOfSource("pollutants", pollutants),
+        AsOfSource("weather", weather, tolerance=pd.Timedelta(hours=1)),
+    ])
+
+    # Output follows the spine's order and index
+    assert result.index.equals(spine.index)
+    assert (result["city"] == spine["city"]).all()
+
+    by_key = result.set_index(["city", "event_timestamp"]).sort_index()
+    karachi = by_key.loc["karachi"]
+    assert karachi["pm25_pollutants"].tolist() == [10.0, 10.0, 30.0, 30.0]
+    assert karachi["weather_event_timestamp"].isna().tolist() == [False, False, True, True]
+
+    lahore = by_key.loc["lahore"]
+    # Nothing from the future: the 01:00 reading is not visible at 00:00
+    assert np.isnan(lahore["pm25_pollutants"].iloc[0])
+    assert lahore["pm25_pollutants"].iloc[1:].tolist() == [99.0, 99.0, 99.0]
+    assert (result["pollutants_event_timestamp"].dropna() <= result.loc[
+        result["pollutants_event_timestamp"].notna(), "event_timestamp"
+    ]).all()
+
+
+def test_training_set_strictly_before_spine():
+    spine = hourly_spine(["karachi"], "2024-01-01 01:00", "2024-01-01 01:00")
+    features = pd.DataFrame({
+        "city": ["karachi", "karachi"],
+        "event_timestamp": pd.to_datetime(["2024-01-01 00:00", "2024-01-01 01:00"], utc=True),
+        "aqi": [50.0, 80.0],
+    })
+
+    result = build_training_set(spine, [AsOfSource("features", features, allow_exact_matches=False)])
+
+    assert result["aqi_features"].tolist() == [50.0]
+
+
+class _FindOnlyCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        window = query["event_timestamp"]
+        return [
+            d for d in self.docs
+            if d["entity"]["city"] == query["entity.city"] and window["$gte"] <= d["event_timestamp"] < window["$lt"]
+        ]
+
+
+def test_compute_features_resolves_lags_from_one_range_query(monkeypatch):
+    ts = datetime(2024, 1, 2, 12)
+    docs = [
+        {"entity": {"city": "karachi"}, "event_timestamp": ts - timedelta(hours=h), "features": {"aqi": 100.0 + h}}
+        for h in (1, 2, 3, 24, 25)
+    ]
+    docs.append({"entity": {"city": "lahore"}, "event_timestamp": ts - timedelta(hours=1), "features": {"aqi": 999.0}})
+    fake = _FindOnlyCollection(docs)
+    monkeypatch.setattr(feature_pipeline, "feature_collection", lambda: fake)
+
+    features = feature_pipeline.compute_features(
+        {"aqi": 202.0, "timestamp": ts}, weather={"temperature": 30.0}
+    )
+
+    assert len(fake.queries) == 1
+    assert features["aqi_lag_1"] == 101.0
+    assert features["aqi_lag_3"] == 103.0
+    assert features["aqi_lag_24"] == 124.0
+    assert features["aqi_change_rate"] == (202.0 - 101.0) / 101.0
+    assert features["temperature"] == 30.0
+    assert (features["hour"], features["day"], features["month"]) == (12, 2, 1)
+
+
+def _raw_series():
+    hours = pd.date_range("2024-01-01 00:00", periods=72, freq="h")
+    raw = pd.DataFrame({
+        "event_timestamp": hours,
+        "aqi": [100.0 + (i * 7) % 40 for i in range(72)],
+        "temperature": 25.0,
+        "humidity": 60.0,
+        "wind_speed": 3.0,
+    })
+    # A gap in the series and an hour with no AQI reading
+    raw = raw.drop(index=[30, 31])
+    raw.loc[50, "aqi"] = None
+    raw.loc[10, "aqi"] = 0.0
+    return raw.reset_index(drop=True)
+
+
+def test_batch_features_match_live_computation():
+    raw = _raw_series()
+    frame = feature_pipeline.compute_features_frame(raw)
+
+    stored = raw[raw["aqi"].notna()]
+    history = {ts.to_pydatetime(): aqi for ts, aqi in zip(stored["event_timestamp"], stored["aqi"])}
+
+    assert len(frame) == len(stored)
+    for row in frame.itertuples(index=False):
+        ts = row.event_timestamp.to_pydatetime()
+        live = feature_pipeline.compute_features(
+            {"aqi": row.aqi, "timestamp": ts},
+            weather={"temperature": 25.0, "humidity": 60.0, "wind_speed": 3.0},
+            history=history,
+        )
+        batch = row._asdict()
+        for name, expected in live.items():
+            actual = batch[name]
+            if expected is None:
+                assert pd.isna(actual), (ts, name)
+            else:
+                assert actual == expected, (ts, name)
+
+
+def _pollutant_series():
+    raw = _raw_series()
+    rng = np.random.default_rng(7)
+    raw["pm25"] = rng.uniform(20, 300, len(raw)).round(1)
+    raw.loc[5:8, "pm25"] = None
+    raw["o3"] = rng.uniform(1, 60, len(raw)).round(1)
+    return raw
+
+
+def test_rolling_state_matches_batch_rolling_features():
+    raw = _pollutant_series()
+    frame = feature_pipeline.compute_features_frame(raw)
+
+    state = RollingWindowState()
+    for row in frame.to_dict("records"):
+        values = {c: (None if pd.isna(row.get(c)) else row.get(c)) for c in ROLLING_COLUMNS}
+        live = state.update(row["event_timestamp"], values)
+        for name, expected in live.items():
+            actual = row[name]
+            if expected is None:
+                assert pd.isna(actual), (row["event_timestamp"], name)
+            else:
+                assert actual == expected, (row["event_timestamp"], name)
+
+
+def test_rolling_state_windows_skip_gaps_and_rewrite_last_hour():
+    ts = datetime(2024, 1, 1)
+    state = RollingWindowState(columns=("aqi",), windows=(3,))
+    state.update(ts, {"aqi": 10.0})
+    state.update(ts + timedelta(hours=1), {"aqi": 20.0})
+    first = state.update(ts + timedelta(hours=2), {"aqi": 99.0})
+    rewritten = state.update(ts + timedelta(hours=2), {"aqi": 30.0})
+
+    assert first["aqi_roll_max_3h"] == 99.0
+    assert rewritten["aqi_roll_mean_3h"] == 20.0
+    assert rewritten["aqi_ewma_3h"] == 22.5
+
+    # Two missing hours leave only the new value in the 3h window
+    after_gap = state.update(ts + timedelta(hours=5), {"aqi": 40.0})
+    assert after_gap["aqi_roll_mean_3h"] == 40.0
+    assert after_gap["aqi_roll_std_3h"] is None
+    assert after_gap["aqi_ewma_3h"] == 31.25
+
+    with pytest.raises(ValueError):
+        state.update(ts, {"aqi": 1.0})
+
+
+def test_rolling_state_round_trips_through_store():
+    class _StateCollection:
+        def __init__(self):
+            self.docs = {}
+
+        def find_one(self, query):
+            return self.docs.get(query["_id"])
+
+        def update_one(self, query, update, upsert=False):
+            self.docs.setdefault(query["_id"], {"_id": query["_id"]}).update(update["$set"])
+
+    raw = _pollutant_series()
+    state = RollingWindowState.from_history(raw.iloc[:40])
+    store = RollingStateStore(_StateCollection())
+    store.save("Karachi", state)
+
+    restored = store.load("karachi")
+    assert restored.last_timestamp == state.last_timestamp
+    assert store.load("karachi", windows=(3, 6)) is None
+
+    nxt = raw.iloc[40].to_dict()
+    values = {c: (None if pd.isna(nxt.get(c)) else nxt.get(c)) for c in ROLLING_COLUMNS}
+    assert restored.update(nxt["event_timestamp"], values) == state.update(nxt["event_timestamp"], values)
+
+
+def test_lags_and_prediction_inputs_come_from_array_store(monkeypatch, tmp_path):
+    store = HourlyArrayStore(str(tmp_path))
+    frame = feature_pipeline.compute_features_frame(_raw_series())
+    store.write_frame("karachi", frame)
+
+    def no_database():
+        raise AssertionError("MongoDB should not be queried")
+
+    monkeypatch.setattr(feature_pipeline, "USE_ARRAY_STORE", True)
+    monkeypatch.setattr(feature_pipeline, "_array_store", store)
+    monkeypatch.setattr(feature_pipeline, "feature_collection", no_database)
+
+    ts = datetime(2024, 1, 3, 12)
+    features = feature_pipeline.compute_features({"aqi": 150.0, "timestamp": ts})
+    expected = frame.set_index("event_timestamp")["aqi"]
+    assert features["aqi_lag_1"] == expected[ts - timedelta(hours=1)]
+    assert features["aqi_lag_24"] == expected[ts - timedelta(hours=24)]
+
+    class _Model:
+        def predict(self, rows):
+            return rows[:, 0] * 2
+
+    # 02:00 on Jan 3 has no AQI, so the latest usable hour is 01:00
+    names = ["aqi", "aqi_roll_mean_24h"]
+    ts_used, row = latest_feature_vector("karachi", names, at=datetime(2024, 1, 3, 2, 15), store=store)
+    assert ts_used == datetime(2024, 1, 3, 1)
+    assert row.shape == (1, 2) and row[0, 1] == frame.set_index("event_timestamp").loc[ts_used, names[1]]
+    assert predict_aqi(_Model(), "karachi", names, at=ts_used, store=store)["prediction"] == 2 * row[0, 0]
+
+
+class _MemoryManifest:
+    def __init__(self):
+        self.entries = {}
+
+    def load(self, city, start, end, feature_version):
+        return {
+            ts: entry for (c, v, ts), entry in self.entries.items()
+            if c == city and v == feature_version and start <= ts <= end
+        }
+
+    def record(self, city, feature_version, entries):
+        for ts, input_hash, features_hash in entries:
+            self.entries[(city, feature_version, pd.Timestamp(ts))] = {
+                "input_hash": input_hash, "features_hash": features_hash
+            }
+        return len(entries)
+
+
+def test_run_batch_recomputes_only_changed_inputs(monkeypatch):
+    raw = _raw_series()
+    manifest = _MemoryManifest()
+    written = []
+    monkeypatch.setattr(feature_pipeline, "load_raw_series", lambda city, start, end: raw[
+        (raw["event_timestamp"] >= start) & (raw["event_timestamp"] <= end)
+    ].reset_index(drop=True))
+    monkeypatch.setattr(feature_pipeline, "feature_manifest", lambda: manifest)
+    monkeypatch.setattr(
+        feature_pipeline, "store_features_batch",
+        lambda frame, city: written.append(list(frame["event_timestamp"])) or len(frame)
+    )
+    # Small chunks, so the dirty horizon has to carry across them
+    monkeypatch.setattr(feature_pipeline, "BATCH_CHUNK_DAYS", 1)
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 3, 23)
+
+    assert feature_pipeline.run_batch(start, end) == raw["aqi"].notna().sum()
+
+    written.clear()
+    assert feature_pipeline.run_batch(start, end) == 0
+    assert written == []
+
+    # A late correction rewrites that hour and the later rows depending on it
+    corrected = datetime(2024, 1, 2, 12)
+    raw.loc[raw["event_timestamp"] == corrected, "aqi"] += 25
+    count = feature_pipeline.run_batch(start, end)
+    rewritten = [ts for chunk in written for ts in chunk]
+    assert count == len(rewritten) > 0
+    assert min(rewritten) == corrected
+    assert pd.Timestamp(datetime(2024, 1, 3, 23)) in rewritten
+
+    # A new feature version has no manifest entries: everything is rebuilt
+    written.clear()
+    monkeypatch.setattr(feature_pipeline, "FEATURE_VERSION", "v3")
+    assert feature_pipeline.run_batch(start, end) == raw["aqi"].notna().sum()
+
+
+def test_content_hash_ignores_representation():
+    a = content_hash({"aqi": 100, "pm25": float("nan"), "o3": 3.5}, ["aqi", "pm25", "o3", "co"])
+    b = content_hash({"o3": np.float64(3.5), "aqi": 100.0, "pm25": None}, ["co", "o3", "pm25", "aqi"])
+    assert a == b
+    assert a != content_hash({"aqi": 101.0, "o3": 3.5}, ["aqi", "pm25", "o3", "co"])
+
+
+def test_feature_collection_is_created_as_timeseries_on_first_use(monkeypatch):
+    calls = []
+    db = type("FakeDB", (dict,), {"name": "aqi_test"})()
+
+    monkeypatch.setattr(feature_pipeline, "STORAGE_MODE", "timeseries")
+    monkeypatch.setattr(feature_pipeline, "_prepared_dbs", set())
+    monkeypatch.setattr(feature_pipeline, "get_db", lambda: db)
+    monkeypatch.setattr(feature_pipeline, "create_timeseries_collection",
+                        lambda database, name, layout: calls.append(("create", name)))
+    monkeypatch.setattr(feature_pipeline, "ensure_indexes_once",
+                        lambda database, names: calls.append(("indexes", tuple(names))))
+    db["features_aqi_v1_ts"] = "collection"
+
+    # e.g. multi_city.ingest_live calling run_pipeline outside __main__
+    assert feature_pipeline.feature_collection() == "collection"
+    feature_pipeline.feature_collection()
+
+    assert calls == [
+        ("create", "features_aqi_v1_ts"),
+        ("indexes", (feature_pipeline.RAW_COLLECTION_NAME, feature_pipeline.MANIFEST_COLLECTION)),
+    ]
+
+
+def test_lagging_rolling_state_replays_stored_hours(monkeypatch):
+    raw = _pollutant_series()
+    frame = feature_pipeline.compute_features_frame(raw)
+    rows = frame.to_dict("records")
+
+    # Saved state stopped at row 10; rows 11-49 were stored later (e.g. by a backfill)
+    saved = RollingWindowState.from_history(frame.iloc[:11])
+    docs = [
+        {"entity": {"city": "karachi"}, "event_timestamp": row["event_timestamp"].to_pydatetime(),
+         "features": {c: row[c] for c in ROLLING_COLUMNS}}
+        for row in rows[:50]
+    ]
+    monkeypatch.setattr(feature_pipeline, "feature_collection", lambda: _FindOnlyCollection(docs))
+    monkeypatch.setattr(
+        feature_pipeline, "rolling_state_store",
+        lambda: SimpleNamespace(load=lambda city: RollingWindowState.from_document(saved.to_document()))
+    )
+
+    current = rows[50]
+    ts = current["event_timestamp"].to_pydatetime()
+    state = feature_pipeline.load_rolling_state("karachi", ts)
+    live = state.update(ts, {c: (None if pd.isna(current[c]) else current[c]) for c in ROLLING_COLUMNS})
+    for name, expected in live.items():
+        if expected is None:
+            assert pd.isna(current[name]), name
+        else:
+            assert current[name] == expected, name
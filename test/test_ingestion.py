@@ -0,0 +1,861 @@
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from src.ingestion import aqi_client_historical, http_transport, merge_data
+from src.ingestion.aqi_client_historical import AQICNHistoricalClient
+from src.ingestion.asof_index import AsOfIndex
+from src.ingestion.http_transport import HttpTransport, RetryPolicy
+from src.ingestion.openmeteo_historical_client import POLLUTANT_FIELDS, OpenMeteoHistoricalAQIClient
+from src.ingestion.response_cache import ResponseCache, aligned_chunks
+from src.ingestion.rate_limit import TokenBucket, backoff_delay
+from src.ingestion.watermark import WATERMARK_COLLECTION, WatermarkStore
+from src.utils.data_contract import validate_hourly_record
+from src.utils.us_aqi import sub_index, to_breakpoint_units, us_aqi_frame
+
+
+def _day_payload(day_str):
+    return {
+        "status": "ok",
+        "data": {
+            "hourly": [
+                {"time": {"iso": f"{day_str}T00:00:00Z"}, "aqi": 100, "iaqi": {"pm25": {"v": 40}}}
+            ]
+        }
+    }
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    started = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # First token is free, the remaining five need 1/50s each
+    assert time.monotonic() - started >= 0.09
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(1, 10):
+        assert 0 <= backoff_delay(attempt, base=1.0, cap=4.0) <= 4.0
+
+
+def test_fetch_range_concurrent_keeps_day_order(monkeypatch):
+    client = AQICNHistoricalClient(token="x", city="karachi", rate_limiter=TokenBucket(rate=1000))
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_get_payload(day_str):
+        with lock:
+            active.append(day_str)
+            peak.append(len(active))
+        # Later days answer faster to shuffle completion order
+        time.sleep(0.02 if day_str.endswith("01") else 0.001)
+        with lock:
+            active.remove(day_str)
+        return _day_payload(day_str)
+
+    monkeypatch.setattr(client, "_get_payload", fake_get_payload)
+
+    records = client.fetch_range(datetime(2025, 1, 1), datetime(2025, 1, 10), max_workers=4)
+
+    days = [r["event_timestamp"].day for r in records]
+    assert days == list(range(1, 11))
+    assert max(peak) <= 4
+
+
+def test_fetch_range_retries_then_skips(monkeypatch):
+    client = AQICNHistoricalClient(token="x", city="karachi")
+    calls = {}
+
+    def flaky_get_payload(day_str):
+        calls[day_str] = calls.get(day_str, 0) + 1
+        if day_str == "2025-01-02":
+            return {"status": "error", "data": "Over quota"}
+        if calls[day_str] == 1:
+            raise ConnectionError("reset")
+        return _day_payload(day_str)
+
+    monkeypatch.setattr(client, "_get_payload", flaky_get_payload)
+    monkeypatch.setattr(aqi_client_historical.time, "sleep", lambda _: None)
+
+    records = client.fetch_range(datetime(2025, 1, 1), datetime(2025, 1, 3), max_retries=3)
+
+    assert [r["event_timestamp"].day for r in records] == [1, 3]
+    assert calls == {"2025-01-01": 2, "2025-01-02": 3, "2025-01-03": 2}
+
+
+class _ScriptedAdapter(BaseAdapter):
+    """Returns canned status codes instead of touching the network."""
+
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = self.statuses.pop(0)
+        response.url = request.url
+        response.request = request
+        response._content = b'{"status": "ok"}'
+        return response
+
+    def close(self):
+        pass
+
+
+def test_transport_retries_retryable_status(monkeypatch):
+    transport = HttpTransport(retry=RetryPolicy(max_attempts=3))
+    adapter = _ScriptedAdapter([503, 429, 200])
+    transport.session.mount("https://", adapter)
+    monkeypatch.setattr(http_transport.time, "sleep", lambda _: None)
+
+    response = transport.get("https://example.test/feed", params={"a": 1})
+
+    assert response.status_code == 200
+    assert adapter.calls == 3
+    stats = transport.stats()["example.test"]
+    assert stats["requests"] == 3
+    assert stats["errors"] == 2
+    assert stats["retries"] == 2
+
+
+def test_transport_returns_last_response_when_exhausted(monkeypatch):
+    transport = HttpTransport()
+    adapter = _ScriptedAdapter([500, 500])
+    transport.session.mount("https://", adapter)
+    monkeypatch.setattr(http_transport.time, "sleep", lambda _: None)
+
+    response = transport.get("https://example.test/feed", retry=RetryPolicy(max_attempts=2))
+
+    assert response.status_code == 500
+    assert adapter.calls == 2
+
+
+def test_get_transport_is_shared():
+    assert http_transport.get_transport() is http_transport.get_transport()
+
+
+class _FakeJSONTransport:
+    """Serves Open-Meteo style hourly payloads for any date range."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None, retry=None):
+        self.calls.append(dict(params))
+        start = date.fromisoformat(params["start_date"])
+        end = date.fromisoformat(params["end_date"])
+        times = []
+        day = start
+        while day <= end:
+            times.extend(f"{day.isoformat()}T{hour:02d}:00" for hour in range(24))
+            day += timedelta(days=1)
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(
+            {"latitude": 24.86, "hourly": {"time": times, "pm10": [1.0] * len(times)}}
+        ).encode()
+        return response
+
+
+def test_cache_key_ignores_token_and_param_order(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    a = cache.key("https://x/feed", {"token": "a", "date": "2024-01-01", "hourly": ["pm10", "pm2_5"]})
+    b = cache.key("https://x/feed", {"hourly": "pm10,pm2_5", "date": "2024-01-01", "token": "b"})
+    assert a == b
+
+
+def test_cache_ttl_rules(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), archive_after_days=7, recent_ttl_seconds=60)
+    today = date.today()
+    assert cache.ttl_for({"end_date": (today - timedelta(days=30)).isoformat()}) is None
+    assert cache.ttl_for({"end_date": today.isoformat()}) == 60
+    assert cache.ttl_for({}) == 60
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), max_bytes=10_000_000)
+    for i in range(3):
+        cache.put("https://x/feed", {"date": f"2020-01-0{i + 1}"}, {"blob": os.urandom(2000).hex()})
+        time.sleep(0.01)
+    # Reading the oldest entry makes it most recently used
+    assert cache.get("https://x/feed", {"date": "2020-01-01"}) is not None
+
+    sizes = [os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(tmp_path) for name in names]
+    cache.max_bytes = sum(sizes) - min(sizes)
+    cache.evict()
+
+    assert cache.get("https://x/feed", {"date": "2020-01-01"}) is not None
+    assert cache.get("https://x/feed", {"date": "2020-01-02"}) is None
+
+
+def test_cache_put_walks_directory_only_when_over_budget(tmp_path, monkeypatch):
+    from src.ingestion import response_cache
+
+    walks = []
+    real_walk = os.walk
+    monkeypatch.setattr(response_cache.os, "walk", lambda top: walks.append(top) or real_walk(top))
+    cache = ResponseCache(directory=str(tmp_path), max_bytes=10_000_000)
+
+    for i in range(20):
+        cache.put("https://x/feed", {"date": f"2020-01-{i + 1:02d}"}, {"blob": "a" * 100})
+    # One scan to learn the starting size, then the running total
+    assert len(walks) == 1
+
+    cache.max_bytes = 1
+    cache.put("https://x/feed", {"date": "2020-02-01"}, {"blob": "b" * 100})
+    assert len(walks) == 2
+    assert cache.get("https://x/feed", {"date": "2020-01-01"}) is None
+
+    threads = [
+        threading.Thread(target=lambda: [cache.get("https://x/feed", {"date": "2020-03-01"}) for _ in range(200)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.misses == 801
+
+
+def test_fetch_hourly_reuses_aligned_chunks(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    transport = _FakeJSONTransport()
+    params = {"latitude": 24.86, "longitude": 67.0, "hourly": "pm10"}
+
+    first = cache.fetch_hourly(transport, "https://x/archive", params, date(2024, 1, 10), date(2024, 3, 5))
+    calls_after_first = len(transport.calls)
+    second = cache.fetch_hourly(transport, "https://x/archive", params, date(2024, 1, 11), date(2024, 3, 5))
+
+    assert first["hourly"]["time"][0] == "2024-01-10T00:00"
+    assert first["hourly"]["time"][-1] == "2024-03-05T23:00"
+    assert second["hourly"]["time"][0] == "2024-01-11T00:00"
+    assert len(first["hourly"]["pm10"]) == len(first["hourly"]["time"])
+    # Same aligned chunks, so the second window is served from disk
+    assert len(transport.calls) == calls_after_first
+    assert aligned_chunks(date(2024, 1, 10), date(2024, 3, 5), 30)[0][0] <= date(2024, 1, 10)
+
+
+def test_fetch_hourly_requests_whole_archived_chunks(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    transport = _FakeJSONTransport()
+    params = {"latitude": 24.86, "longitude": 67.0, "hourly": "pm10"}
+    chunks = aligned_chunks(date(2024, 1, 10), date(2024, 1, 20), 30, clip_from=date.today())
+
+    first = cache.fetch_hourly(transport, "https://x/archive", params, date(2024, 1, 10), date(2024, 1, 20))
+    calls_after_first = len(transport.calls)
+    # Walking forward within the same archived chunk is served from disk
+    second = cache.fetch_hourly(transport, "https://x/archive", params, date(2024, 1, 21), date(2024, 1, 25))
+
+    assert [(c["start_date"], c["end_date"]) for c in transport.calls] == [
+        (start.isoformat(), end.isoformat()) for start, end in chunks
+    ]
+    assert chunks[-1][1] > date(2024, 1, 25)
+    assert len(transport.calls) == calls_after_first
+    assert first["hourly"]["time"][-1] == "2024-01-20T23:00"
+    assert second["hourly"]["time"][0] == "2024-01-21T00:00"
+    assert second["hourly"]["time"][-1] == "2024-01-25T23:00"
+
+
+def test_aligned_chunks_clip_only_recent_windows():
+    cutoff = date(2024, 3, 1)
+
+    archived = aligned_chunks(date(2024, 1, 10), date(2024, 1, 20), 30, clip_from=cutoff)
+    recent = aligned_chunks(date(2024, 2, 25), date(2024, 3, 5), 30, clip_from=cutoff)
+
+    assert all((end - start).days == 29 for start, end in archived)
+    assert recent[-1][1] == date(2024, 3, 5)
+
+
+class _FakeCollection:
+    """Just enough of a pymongo collection for the watermark and upsert paths."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        doc.update(update["$set"])
+
+    def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            key = tuple(sorted(op._filter.items()))
+            self.docs.setdefault(key, {}).update(op._doc["$set"])
+        return SimpleNamespace(bulk_api_result={"nUpserted": len(operations)})
+
+
+def _merged_window(start, end):
+    hours = pd.date_range(start, end, freq="h", tz="UTC")
+    weather = [float(i) for i in range(len(hours))]
+    # Most recent hour has no weather yet
+    weather[-1] = None
+    return pd.DataFrame({
+        "event_timestamp": hours,
+        "pm25_pollutants": 10.0,
+        "us_aqi": 53.0,
+        "dominant_pollutant": "pm25",
+        "temperature_weather": weather,
+    })
+
+
+def test_incremental_merge_advances_watermark(monkeypatch):
+    db = {WATERMARK_COLLECTION: _FakeCollection(), merge_data.MERGED_COLLECTION: _FakeCollection()}
+    fetched = []
+
+    def fake_fetch(city, token, start, end, cache):
+        fetched.append(pd.Timestamp(start))
+        return _merged_window(start, end)
+
+    monkeypatch.setattr(merge_data, "_fetch_merged_window", fake_fetch)
+
+    first = merge_data.merge_historical_data("karachi", "x", use_cache=False, incremental=True, db=db)
+    mark = WatermarkStore(db[WATERMARK_COLLECTION]).get(merge_data.MERGE_JOB, "karachi")
+
+    assert len(first) == merge_data.HISTORY_DAYS * 24 + 1
+    # The incomplete last hour is stored but not covered by the watermark
+    assert mark == first["event_timestamp"].iloc[-2]
+
+    second = merge_data.merge_historical_data(
+        "karachi", "x", use_cache=False, incremental=True, db=db, overlap_hours=3
+    )
+
+    assert fetched[1] == pd.Timestamp(mark) - pd.Timedelta(hours=3)
+    assert second["event_timestamp"].min() == fetched[1]
+    assert len(db[merge_data.MERGED_COLLECTION].docs) == len(first)
+
+
+def test_incremental_watermark_stops_before_first_incomplete_hour(monkeypatch):
+    db = {WATERMARK_COLLECTION: _FakeCollection(), merge_data.MERGED_COLLECTION: _FakeCollection()}
+
+    def fake_fetch(city, token, start, end, cache):
+        window = _merged_window(start, end)
+        # A late recent hour; later hours are complete
+        window.loc[len(window) - 10, "pm25_pollutants"] = None
+        return window
+
+    monkeypatch.setattr(merge_data, "_fetch_merged_window", fake_fetch)
+
+    delta = merge_data.merge_historical_data("karachi", "x", use_cache=False, incremental=True, db=db)
+    mark = WatermarkStore(db[WATERMARK_COLLECTION]).get(merge_data.MERGE_JOB, "karachi")
+
+    assert mark == delta["event_timestamp"].iloc[-11]
+
+    gap = delta.drop(index=[5]).reset_index(drop=True)
+    assert merge_data._leading_complete_hour(gap) == delta["event_timestamp"].iloc[4]
+
+
+def test_incremental_watermark_moves_past_permanent_hole(monkeypatch):
+    db = {WATERMARK_COLLECTION: _FakeCollection(), merge_data.MERGED_COLLECTION: _FakeCollection()}
+    now = pd.Timestamp.now(tz="UTC").floor("h")
+    # An hour the archive never fills in, and one that is simply absent
+    hole = now - pd.Timedelta(days=30)
+    absent = now - pd.Timedelta(days=20)
+    fetched = []
+    warnings = []
+
+    def fake_fetch(city, token, start, end, cache):
+        fetched.append(pd.Timestamp(start))
+        window = _merged_window(start, end)
+        window.loc[window["event_timestamp"] == hole, "pm25_pollutants"] = None
+        return window[window["event_timestamp"] != absent].reset_index(drop=True)
+
+    monkeypatch.setattr(merge_data, "_fetch_merged_window", fake_fetch)
+    monkeypatch.setattr(merge_data.logger, "warning", warnings.append)
+
+    first = merge_data.merge_historical_data("karachi", "x", use_cache=False, incremental=True, db=db)
+    mark = WatermarkStore(db[WATERMARK_COLLECTION]).get(merge_data.MERGE_JOB, "karachi")
+
+    assert mark == first["event_timestamp"].iloc[-2]
+
+    merge_data.merge_historical_data("karachi", "x", use_cache=False, incremental=True, db=db)
+
+    # The next window starts at the watermark, not back at the hole
+    assert fetched[1] == pd.Timestamp(mark) - pd.Timedelta(hours=merge_data.INCREMENTAL_OVERLAP_HOURS)
+    assert warnings == []
+
+
+def test_incremental_watermark_stall_is_logged(monkeypatch):
+    db = {WATERMARK_COLLECTION: _FakeCollection(), merge_data.MERGED_COLLECTION: _FakeCollection()}
+    now = pd.Timestamp.now(tz="UTC").floor("h")
+    # Still inside the archive delay, but well past the usual lag
+    hole = now - pd.Timedelta(days=3)
+    warnings = []
+
+    def fake_fetch(city, token, start, end, cache):
+        window = _merged_window(start, end)
+        window.loc[window["event_timestamp"] == hole, "pm25_pollutants"] = None
+        return window
+
+    monkeypatch.setattr(merge_data, "_fetch_merged_window", fake_fetch)
+    monkeypatch.setattr(merge_data.logger, "warning", warnings.append)
+
+    merge_data.merge_historical_data("karachi", "x", use_cache=False, incremental=True, db=db)
+    merge_data.merge_historical_data("karachi", "x", use_cache=False, incremental=True, db=db)
+    mark = WatermarkStore(db[WATERMARK_COLLECTION]).get(merge_data.MERGE_JOB, "karachi")
+
+    assert pd.Timestamp(mark) == hole - pd.Timedelta(hours=1)
+    assert len(warnings) == 1
+    assert "stalled" in warnings[0]
+
+
+def test_fetch_merged_window_trims_lookback_and_adds_us_aqi(monkeypatch):
+    requested = {}
+
+    class FakePollutants:
+        def __init__(self, latitude, longitude, start_date, end_date, cache=None, city="karachi"):
+            requested["pollutants"] = (start_date, end_date)
+
+        def fetch_frame(self):
+            start, end = requested["pollutants"]
+            hours = pd.date_range(start, pd.Timestamp(end) + pd.Timedelta(hours=23), freq="h", tz="UTC")
+            frame = pd.DataFrame({
+                "city": "karachi", "event_timestamp": hours, "source": "open-meteo", "ingested_at": pd.Timestamp.now()
+            })
+            for name in POLLUTANT_FIELDS:
+                frame[name] = 1.0
+            frame["pm25"] = 20.0
+            return frame
+
+    class FakeWeather:
+        def __init__(self, latitude, longitude, city="karachi", cache=None):
+            pass
+
+        def fetch_frame(self, start_date, end_date):
+            hours = pd.date_range(start_date, end_date, freq="h", tz="UTC")
+            return pd.DataFrame({
+                "city": "karachi", "event_timestamp": hours, "source": "open-meteo-weather",
+                "ingested_at": pd.Timestamp.now(), "temperature": 25.0, "humidity": 60.0
+            })
+
+    monkeypatch.setattr(merge_data, "OpenMeteoHistoricalAQIClient", FakePollutants)
+    monkeypatch.setattr(merge_data, "OpenMeteoWeatherHistoricalClient", FakeWeather)
+
+    start, end = datetime(2024, 1, 10), datetime(2024, 1, 10, 23)
+    merged = merge_data._fetch_merged_window("karachi", "x", start, end, cache=None, geo=(1.0, 2.0))
+
+    # The day before was fetched for the 24h averages but is not returned
+    assert requested["pollutants"] == ("2024-01-09", "2024-01-10")
+    assert merged["event_timestamp"].min() == pd.Timestamp(start, tz="UTC")
+    assert len(merged) == 24
+    # 20 µg/m³ PM2.5 over a full 24h window
+    assert (merged["us_aqi"] == sub_index("pm25", [20.0])[0]).all()
+    assert (merged["dominant_pollutant"] == "pm25").all()
+    # One city/ingested_at and a source per input, no _x/_y join leftovers
+    assert not [c for c in merged.columns if c.endswith(("_x", "_y"))]
+    assert (merged["city"] == "karachi").all()
+    assert set(merged[["pollutants_source", "weather_source"]].iloc[0]) == {"open-meteo", "open-meteo-weather"}
+
+    raw = merge_data.to_raw_documents("Karachi", merged)
+    assert raw[0]["entity"] == {"city": "karachi"}
+    assert raw[0]["aqi"] == merged["us_aqi"].iloc[0] == raw[0]["pm25"]
+    assert raw[0]["temperature"] == 25.0 and raw[0]["wind_speed"] is None
+
+
+def test_append_merged_rejects_rows_without_us_aqi():
+    window = _merged_window(datetime(2024, 1, 1), datetime(2024, 1, 1, 2)).drop(columns=["us_aqi"])
+
+    with pytest.raises(ValueError, match="us_aqi"):
+        merge_data._append_merged(_FakeCollection(), "karachi", window)
+
+
+def test_columnar_open_meteo_matches_record_path(monkeypatch):
+    times = [f"2024-01-01T{hour:02d}:00" for hour in range(24)]
+    payload = {"hourly": {"time": times}}
+    for i, field in enumerate(POLLUTANT_FIELDS.values()):
+        payload["hourly"][field] = [float(i + hour) for hour in range(24)]
+    # Nulls and a variable missing from the response both become NaN
+    payload["hourly"]["pm2_5"][3] = None
+    del payload["hourly"]["ozone"]
+
+    client = OpenMeteoHistoricalAQIClient(latitude=1.0, longitude=2.0, start_date="2024-01-01", end_date="2024-01-01")
+    monkeypatch.setattr(client, "_get_payload", lambda: payload)
+
+    frame = client.fetch_frame()
+    expected = merge_data.flatten_dataframe(pd.DataFrame(client.fetch()), "pollutants", "pollutants")
+
+    assert str(frame["event_timestamp"].dtype) == "datetime64[ns, UTC]"
+    assert (frame["event_timestamp"] == pd.to_datetime(expected["event_timestamp"], utc=True)).all()
+    for name in POLLUTANT_FIELDS:
+        assert frame[name].dtype == "float64"
+        pd.testing.assert_series_equal(
+            frame[name], expected[f"{name}_pollutants"].astype("float64"), check_names=False
+        )
+
+
+def test_flatten_dataframe_matches_row_wise_expansion():
+    df = pd.DataFrame({
+        "aqi": [10, 20, 30],
+        "pollutants": [{"pm25": 1.0, "pm10": 2.0}, {"pm25": 3.0}, None],
+    }, index=[5, 6, 7])
+
+    flat = merge_data.flatten_dataframe(df, "pollutants", "pollutants")
+
+    assert list(flat.columns) == ["aqi", "pm25_pollutants", "pm10_pollutants"]
+    assert list(flat.index) == [5, 6, 7]
+    assert flat["pm25_pollutants"].tolist()[:2] == [1.0, 3.0]
+    assert flat["pm10_pollutants"].isna().tolist() == [False, True, True]
+
+
+def test_flatten_dataframe_with_known_schema():
+    df = pd.DataFrame({"weather": [{"temperature": 30.0, "extra": 1}, {"humidity": 50.0}]})
+
+    flat = merge_data.flatten_dataframe(df, "weather", "weather", keys=["temperature", "humidity", "pressure"])
+
+    assert list(flat.columns) == ["temperature_weather", "humidity_weather", "pressure_weather"]
+    assert flat["pressure_weather"].isna().all()
+    assert flat.loc[1, "humidity_weather"] == 50.0
+
+
+def _weather_history():
+    # Deliberately unsorted, naive-string timestamps with a gap at 03:00
+    return pd.DataFrame({
+        "event_timestamp": ["2024-01-01T04:00", "2024-01-01T00:00", "2024-01-01T02:00", "2024-01-01T01:00"],
+        "temperature_weather": [4.0, 0.0, 2.0, 1.0],
+    })
+
+
+def test_asof_index_nearest_and_backward():
+    weather_df = _weather_history()
+    index = AsOfIndex(weather_df)
+    query = pd.Timestamp("2024-01-01T03:40", tz="UTC")
+
+    assert index.lookup(query, direction="nearest")["temperature_weather"] == 4.0
+    assert index.lookup(query, direction="backward")["temperature_weather"] == 2.0
+    assert index.lookup(query, direction="backward", tolerance=pd.Timedelta(minutes=30)) is None
+    assert index.lookup("2023-12-31T23:00", direction="backward") is None
+    # The caller's frame is not re-parsed or reordered
+    assert weather_df["event_timestamp"].tolist()[0] == "2024-01-01T04:00"
+
+
+def test_asof_index_batch_lookup_preserves_input_order():
+    index = AsOfIndex(_weather_history())
+    queries = pd.to_datetime(
+        ["2024-01-01T02:10", "2024-01-01T09:00", "2024-01-01T00:00", "2024-01-01T03:30"], utc=True
+    )
+
+    matched = index.lookup_many(queries, direction="nearest", tolerance=pd.Timedelta(hours=1))
+
+    assert matched["temperature_weather"].tolist()[0] == 2.0
+    assert pd.isna(matched["temperature_weather"].iloc[1])
+    assert matched["temperature_weather"].tolist()[2:] == [0.0, 4.0]
+
+
+def test_merge_live_data_attaches_nearest_weather(monkeypatch):
+    live = {
+        "city": "karachi",
+        "aqi": 150,
+        "pollutants": {"pm25": 150},
+        "event_timestamp": datetime(2024, 1, 1, 1, 50, tzinfo=timezone.utc),
+        "source": "aqicn",
+    }
+    monkeypatch.setattr(merge_data.AQICNLiveClient, "fetch", lambda self: live)
+
+    merged = merge_data.merge_live_data("karachi", "x", weather_df=AsOfIndex(_weather_history()))
+
+    assert merged.loc[0, "temperature_weather"] == 2.0
+    assert merged.loc[0, "weather_event_timestamp"] == pd.Timestamp("2024-01-01T02:00", tz="UTC")
+    assert merged.loc[0, "pm25_pollutants"] == 150
+
+
+def test_plan_repair_requests_coalesces_and_splits():
+    from src.ingestion.gap_repair import plan_repair_requests
+    from src.storage.coverage import MissingRange
+
+    t0 = datetime(2024, 1, 1)
+    gaps = [
+        MissingRange("karachi", t0 + timedelta(hours=30), t0 + timedelta(hours=31)),
+        MissingRange("karachi", t0 + timedelta(hours=2), t0 + timedelta(hours=4)),
+        # 4 stored hours after the first two gaps -> bridged
+        MissingRange("karachi", t0 + timedelta(hours=35), t0 + timedelta(hours=36)),
+        # A week later -> own request
+        MissingRange("karachi", t0 + timedelta(days=9), t0 + timedelta(days=9, hours=1)),
+        MissingRange("lahore", t0, t0 + timedelta(days=5)),
+    ]
+
+    requests = plan_repair_requests(gaps, max_days=2, bridge_hours=48)
+
+    assert [(r.city, r.start, r.end, len(r.gaps)) for r in requests] == [
+        ("karachi", t0 + timedelta(hours=2), t0 + timedelta(hours=36), 3),
+        ("karachi", t0 + timedelta(days=9), t0 + timedelta(days=9, hours=1), 1),
+        # Longer than max_days -> split on day boundaries
+        ("lahore", t0, t0 + timedelta(days=2), 1),
+        ("lahore", t0 + timedelta(days=2), t0 + timedelta(days=4), 1),
+        ("lahore", t0 + timedelta(days=4), t0 + timedelta(days=5), 1),
+    ]
+    assert all(r.days <= 2 for r in requests)
+    assert requests[0].missing_hours == 4
+
+
+def test_repair_gaps_fetches_and_upserts_only_missing_hours(monkeypatch):
+    from src.ingestion import gap_repair
+    from src.storage.coverage import MissingRange
+
+    t0 = datetime(2024, 1, 1)
+    gaps = [
+        MissingRange("karachi", t0 + timedelta(hours=3), t0 + timedelta(hours=5)),
+        MissingRange("karachi", t0 + timedelta(hours=10), t0 + timedelta(hours=11)),
+    ]
+    db = {merge_data.MERGED_COLLECTION: _FakeCollection()}
+    fetched, lookups = [], []
+
+    def fake_fetch(city, token, start, end, cache, geo=None):
+        fetched.append((start, end, geo))
+        return _merged_window(start, end)
+
+    monkeypatch.setattr(gap_repair, "find_gaps", lambda *args, **kwargs: gaps)
+    monkeypatch.setattr(gap_repair, "resolve_station_geo", lambda city, token: lookups.append(city) or (1.0, 2.0))
+    monkeypatch.setattr(gap_repair, "_fetch_merged_window", fake_fetch)
+
+    summary = gap_repair.repair_gaps("x", t0, t0 + timedelta(days=1), ["Karachi"], db=db)
+
+    assert fetched == [(t0 + timedelta(hours=3), t0 + timedelta(hours=10), (1.0, 2.0))]
+    assert lookups == ["karachi"]
+    assert summary == {"gaps": 2, "missing_hours": 3, "requests": 1, "repaired_hours": 3}
+    stored = sorted(doc["event_timestamp"] for doc in db[merge_data.MERGED_COLLECTION].docs.values())
+    assert stored == [(t0 + timedelta(hours=h)).replace(tzinfo=timezone.utc) for h in (3, 4, 10)]
+
+
+def test_plan_chunks_covers_range_inclusively():
+    from src.ingestion.backfill_engine import plan_chunks
+
+    chunks = plan_chunks("2024-01-01", "2024-01-25", 10)
+
+    assert [(c.start.day, c.end.day) for c in chunks] == [(1, 10), (11, 20), (21, 25)]
+    assert sum(c.days for c in chunks) == 25
+
+
+def test_backfill_engine_resumes_from_checkpoint(tmp_path):
+    from src.ingestion.backfill_engine import BackfillCheckpoint, BackfillEngine
+
+    calls = []
+    crash_on = {"2024-01-11_2024-01-20"}
+
+    def process(chunk):
+        calls.append(chunk.key)
+        if chunk.key in crash_on:
+            raise RuntimeError("API down")
+        return chunk.days * 24
+
+    def engine(workers):
+        return BackfillEngine("merged:karachi", process, BackfillCheckpoint("merged:karachi", str(tmp_path)),
+                              max_workers=workers)
+
+    first = engine(3).run("2024-01-01", "2024-01-30", 10)
+    assert first == {"chunks": 3, "skipped": 0, "done": 2, "failed": 1, "rows": 480}
+
+    # A fresh engine reloads the checkpoint and only retries the failed chunk
+    crash_on.clear()
+    calls.clear()
+    second = engine(1).run("2024-01-01", "2024-01-30", 10)
+
+    assert calls == ["2024-01-11_2024-01-20"]
+    assert second == {"chunks": 3, "skipped": 2, "done": 1, "failed": 0, "rows": 240}
+    state = json.loads((tmp_path / "merged_karachi.json").read_text())
+    assert len(state["days"]) == 30 and {v["status"] for v in state["days"].values()} == {"done"}
+
+
+def test_backfill_engine_resume_ignores_batch_size(tmp_path):
+    from src.ingestion.backfill_engine import BackfillCheckpoint, BackfillEngine
+
+    calls = []
+
+    def process(chunk):
+        calls.append(chunk.key)
+        return chunk.days * 24
+
+    def engine():
+        return BackfillEngine("merged:karachi", process, BackfillCheckpoint("merged:karachi", str(tmp_path)))
+
+    engine().run("2024-01-01", "2024-01-20", 10)
+    calls.clear()
+    summary = engine().run("2024-01-01", "2024-01-25", 7)
+
+    # Only the new days run, even though no 7-day chunk was recorded
+    assert calls == ["2024-01-21_2024-01-21", "2024-01-22_2024-01-25"]
+    assert summary == {"chunks": 4, "skipped": 2, "done": 2, "failed": 0, "rows": 5 * 24}
+
+
+def test_backfill_checkpoint_reads_per_chunk_state(tmp_path):
+    from src.ingestion.backfill_engine import BackfillCheckpoint, BackfillChunk
+
+    (tmp_path / "merged_karachi.json").write_text(json.dumps({
+        "job": "merged:karachi",
+        "chunks": {"2024-01-01_2024-01-10": {"status": "done"}, "2024-01-11_2024-01-20": {"status": "failed"}}
+    }))
+    checkpoint = BackfillCheckpoint("merged:karachi", str(tmp_path))
+
+    assert checkpoint.is_done(BackfillChunk(date(2024, 1, 3), date(2024, 1, 9)))
+    assert checkpoint.pending(BackfillChunk(date(2024, 1, 8), date(2024, 1, 14))) == [
+        BackfillChunk(date(2024, 1, 11), date(2024, 1, 14))
+    ]
+
+
+def test_run_backfill_writes_where_the_feature_pipeline_reads(monkeypatch, tmp_path):
+    from src.features import feature_pipeline
+    from src.ingestion import backfill
+    from src.ingestion.backfill_engine import BackfillCheckpoint, BackfillEngine
+    from src.utils import mongo_client
+
+    db = {merge_data.MERGED_COLLECTION: _FakeCollection(), merge_data.RAW_COLLECTION: _FakeCollection()}
+    monkeypatch.setattr(mongo_client, "_client", SimpleNamespace(get_database=lambda: db))
+    monkeypatch.setattr(backfill, "resolve_station_geo", lambda city, token: (1.0, 2.0))
+    monkeypatch.setattr(backfill, "_fetch_merged_window", lambda city, token, start, end, cache, geo=None: _merged_window(start, end))
+    monkeypatch.setattr(backfill, "BackfillEngine", lambda job, process, max_workers=1: BackfillEngine(
+        job, process, BackfillCheckpoint(job, str(tmp_path)), max_workers=max_workers
+    ))
+
+    summary = backfill.run_backfill("2024-01-01", "2024-01-02", batch_size_days=1, use_cache=False)
+
+    assert summary["rows"] == 48
+    assert feature_pipeline.raw_collection() is db[merge_data.RAW_COLLECTION]
+    assert len(db[merge_data.RAW_COLLECTION].docs) == 48
+
+
+def test_load_ingestion_config_fills_defaults(tmp_path):
+    from src.utils.config import load_ingestion_config
+
+    path = tmp_path / "ingestion.yaml"
+    path.write_text('date_range:\n  start_date: "2024-01-01"\n  end_date: "2024-02-01"\n')
+    assert load_ingestion_config(str(path))["batch_size_days"] == 10
+
+    path.write_text('date_range:\n  start_date: "2024-01-01"\n')
+    with pytest.raises(ValueError, match="end_date"):
+        load_ingestion_config(str(path))
+
+
+def test_run_hourly_backfill_requests_multi_day_ranges(monkeypatch):
+    from src.ingestion import backfill
+
+    requests_made, written = [], []
+
+    def fake_weather(lat, lon, start_date, end_date):
+        requests_made.append((start_date, end_date))
+        hours = pd.date_range(start_date, pd.Timestamp(end_date) + pd.Timedelta(hours=23), freq="h", tz="UTC")
+        return [{"timestamp": ts.to_pydatetime(), "weather": {"temperature": 20.0}} for ts in hours]
+
+    class FakeHandler:
+        def upsert_records(self, records):
+            written.append(records)
+            return SimpleNamespace(errors=[])
+
+    def fake_pollutants(lat, lon, start_date, end_date):
+        # Pollutants only for the first day of each chunk
+        hours = pd.date_range(start_date, periods=24, freq="h", tz="UTC")
+        return {ts: {"aqi": {"us_aqi": float(ts.hour), "dominant_pollutant": "pm25"}, "pollutants": {}} for ts in hours}
+
+    monkeypatch.setattr(backfill, "fetch_weather_hourly", fake_weather)
+    monkeypatch.setattr(backfill, "fetch_pollutants_hourly", fake_pollutants)
+    monkeypatch.setattr(backfill, "MongoHandler", FakeHandler)
+    monkeypatch.setattr(backfill, "sleep", lambda seconds: None)
+
+    backfill.run_hourly_backfill("2024-01-01", "2024-01-10", batch_size_days=7)
+
+    assert requests_made == [("2024-01-01", "2024-01-07"), ("2024-01-08", "2024-01-10")]
+    assert [len(batch) for batch in written] == [7 * 24, 3 * 24]
+    first = written[0]
+    assert first[0]["city"] == backfill.CITY
+    # Every hour carries its own AQI; hours without pollutants carry none
+    assert [r["aqi"]["us_aqi"] for r in first[:3]] == [0.0, 1.0, 2.0]
+    assert first[24]["aqi"]["us_aqi"] is None
+    assert all(validate_hourly_record(r) for batch in written for r in batch)
+
+
+def test_transport_rate_limits_per_host(monkeypatch):
+    transport = HttpTransport(rate_limits={"limited.test": (2.0, 1.0)})
+    transport.session.mount("https://", _ScriptedAdapter([200, 200, 200]))
+    acquired = []
+    monkeypatch.setattr(http_transport.TokenBucket, "acquire", lambda bucket, tokens=1.0: acquired.append(bucket))
+
+    transport.get("https://limited.test/a")
+    transport.get("https://other.test/a")
+    transport.get("https://limited.test/b")
+
+    assert acquired == [transport._rate_limits["limited.test"]] * 2
+    assert acquired[0].rate == 2.0 and acquired[0].capacity == 1.0
+
+
+def test_ingest_historical_fans_out_per_city(monkeypatch, tmp_path):
+    from src.ingestion import multi_city
+
+    config = tmp_path / "cities.yaml"
+    config.write_text(
+        "cities:\n"
+        "  - {name: Karachi, latitude: 24.86, longitude: 67.0}\n"
+        "  - {name: lahore, station: '@1234'}\n"
+        "  - {name: broken}\n"
+    )
+    cities = multi_city.load_cities(str(config))
+    db = {merge_data.MERGED_COLLECTION: _FakeCollection(), merge_data.RAW_COLLECTION: _FakeCollection()}
+    lookups, windows = [], []
+
+    def fake_fetch(city, token, start, end, cache, geo=None):
+        if city == "broken":
+            raise RuntimeError("no station")
+        windows.append((city, start.date(), end.date()))
+        return _merged_window(start, start + timedelta(hours=2))
+
+    monkeypatch.setattr(multi_city, "resolve_station_geo", lambda query, token: lookups.append(query) or (1.0, 2.0))
+    monkeypatch.setattr(multi_city, "_fetch_merged_window", fake_fetch)
+
+    results = multi_city.ingest_historical(
+        cities, "x", datetime(2024, 1, 1), datetime(2024, 1, 5), db=db, max_workers=3, use_cache=False,
+        window_days=3
+    )
+
+    assert results == {"karachi": 6, "lahore": 6, "broken": None}
+    assert sorted(lookups) == ["@1234", "broken"]
+    assert sorted(w for w in windows if w[0] == "karachi") == [
+        ("karachi", date(2024, 1, 1), date(2024, 1, 3)), ("karachi", date(2024, 1, 4), date(2024, 1, 5))
+    ]
+    assert {doc["city"] for doc in db[merge_data.MERGED_COLLECTION].docs.values()} == {"karachi", "lahore"}
+    # Same hours as raw rows for the feature pipeline, like run_backfill
+    raw = db[merge_data.RAW_COLLECTION].docs.values()
+    assert len(raw) == 12
+    assert {doc["entity"]["city"] for doc in raw} == {"karachi", "lahore"}
+    assert {doc["aqi"] for doc in raw} == {53.0}
+
+
+def test_us_aqi_sub_indices_follow_epa_breakpoints():
+    pm25 = sub_index("pm25", [0.0, 9.0, 9.1, 12.0, 35.4, 55.5, 400.0, np.nan, -1.0])
+    np.testing.assert_array_equal(pm25[:7], [0, 50, 51, 56, 100, 151, 500])
+    assert np.isnan(pm25[7:]).all()
+
+    # 100 µg/m³ NO2 is 53.1 ppb, truncated to 53
+    assert sub_index("no2", to_breakpoint_units("no2", [100.0]))[0] == 50
+    # The 1h ozone table applies from 0.125 ppm and the higher index wins
+    assert sub_index("o3", [0.060], [0.150])[0] == 132
+    assert sub_index("o3", [0.060], [0.100])[0] == 67
+
+
+def test_us_aqi_frame_uses_per_city_rolling_averages():
+    hours = pd.date_range("2024-01-01", periods=30, freq="h", tz="UTC")
+    frame = pd.concat([
+        pd.DataFrame({"city": city, "event_timestamp": hours, "pm25": pm25, "no2": 20.0})
+        for city, pm25 in (("karachi", 40.0), ("lahore", 5.0))
+    ], ignore_index=True).sample(frac=1.0, random_state=0)
+
+    result = us_aqi_frame(frame).join(frame[["city", "event_timestamp"]])
+    karachi = result[result["city"] == "karachi"].sort_values("event_timestamp")
+
+    # The 24h PM2.5 mean needs 18 hours; until then NO2 (1h) is the only index
+    assert karachi["aqi_pm25"].iloc[:17].isna().all()
+    assert (karachi["us_aqi"].iloc[:17] == karachi["aqi_no2"].iloc[:17]).all()
+    assert (karachi["aqi_pm25"].iloc[17:] == 112).all()
+    assert (karachi["dominant_pollutant"].iloc[17:] == "pm25").all()
+    assert (result.loc[result["city"] == "lahore", "aqi_pm25"].dropna() == 28).all()
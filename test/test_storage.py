@@ -0,0 +1,567 @@
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+
+from src.storage.hourly_array_store import HourlyArrayStore, hour_index, index_to_timestamp
+from src.storage.indexes import ensure_indexes, index_report, verify_hot_queries
+from src.storage.mongo import MongoHandler, bulk_upsert
+from src.storage.timeseries import (
+    LAYOUTS,
+    from_timeseries_document,
+    migrate_to_timeseries,
+    to_timeseries_document,
+)
+
+
+class _BulkCollection:
+    """Records bulk_write batches; keys listed in `reject` fail like duplicate-key errors."""
+
+    def __init__(self, reject=()):
+        self.batches = []
+        self.reject = set(reject)
+        self.write_concern = None
+
+    def with_options(self, write_concern=None):
+        self.write_concern = write_concern
+        return self
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append((operations, ordered))
+        errors = [
+            {"index": i, "code": 11000, "errmsg": "duplicate key"}
+            for i, op in enumerate(operations)
+            if op._filter.get("city") in self.reject
+        ]
+        result = {"nMatched": 0, "nModified": 0, "nUpserted": len(operations) - len(errors), "writeErrors": errors}
+        if errors:
+            raise BulkWriteError(result)
+        return SimpleNamespace(bulk_api_result=result)
+
+
+def _records(n, city="karachi"):
+    return [
+        {"city": city, "timestamp": datetime(2024, 1, 1, h % 24), "aqi": {"us_aqi": h}, "weather": {}}
+        for h in range(n)
+    ]
+
+
+def test_bulk_upsert_batches_unordered_upserts():
+    collection = _BulkCollection()
+
+    result = bulk_upsert(collection, _records(25), ("city", "timestamp"), batch_size=10)
+
+    assert [len(ops) for ops, _ in collection.batches] == [10, 10, 5]
+    assert all(ordered is False for _, ordered in collection.batches)
+    first = collection.batches[0][0][0]
+    assert first._filter == {"city": "karachi", "timestamp": datetime(2024, 1, 1, 0)}
+    assert first._upsert is True
+    assert result.upserted == 25 and result.batches == 3 and result.ok
+
+
+def test_bulk_upsert_collects_errors_with_input_offsets():
+    collection = _BulkCollection(reject={"lahore"})
+    records = _records(3) + _records(2, city="lahore")
+
+    result = bulk_upsert(
+        collection, records, ("city", "timestamp"), batch_size=4, write_concern=WriteConcern(w=1)
+    )
+
+    assert not result.ok
+    assert [e["index"] for e in result.errors] == [3, 4]
+    assert result.upserted == 3
+    assert collection.write_concern.document == {"w": 1}
+
+
+def test_bulk_upsert_supports_dotted_keys():
+    collection = _BulkCollection()
+    doc = {"entity": {"city": "karachi"}, "event_timestamp": datetime(2024, 1, 1)}
+
+    bulk_upsert(collection, [doc], ("entity.city", "event_timestamp"))
+
+    assert collection.batches[0][0][0]._filter == {"entity.city": "karachi", "event_timestamp": datetime(2024, 1, 1)}
+
+
+def test_upsert_records_validates_before_writing():
+    handler = MongoHandler.__new__(MongoHandler)
+    handler.storage_mode = "document"
+    handler.collection = _BulkCollection()
+
+    with pytest.raises(ValueError):
+        handler.upsert_records(_records(2) + [{"city": "karachi", "timestamp": datetime(2024, 1, 2)}])
+    assert handler.collection.batches == []
+
+    assert handler.upsert_records(_records(2)).upserted == 2
+
+
+def test_upsert_records_passes_write_concern_in_timeseries_mode():
+    handler = MongoHandler.__new__(MongoHandler)
+    handler.storage_mode = "timeseries"
+    handler.layout = LAYOUTS["raw_aqi_weather_hourly"]
+    handler.collection = MagicMock()
+    concern = WriteConcern(w="majority")
+
+    result = handler.upsert_records(_records(3), batch_size=2, write_concern=concern)
+
+    handler.collection.with_options.assert_called_once_with(write_concern=concern)
+    writer = handler.collection.with_options.return_value
+    assert writer.insert_many.call_count == 2
+    handler.collection.insert_many.assert_not_called()
+    assert result.upserted == 3 and result.batches == 2
+
+
+class _IndexedCollection:
+    def __init__(self, existing=(), plan=None, used=()):
+        self.indexes = {"_id_": {}, **{name: {} for name in existing}}
+        self.plan = plan or {"stage": "COLLSCAN"}
+        self.used = set(used)
+
+    def create_index(self, keys, unique=False, name=None):
+        self.indexes[name] = {"key": keys, "unique": unique}
+        return name
+
+    def index_information(self):
+        return self.indexes
+
+    def aggregate(self, pipeline):
+        return [{"name": n, "accesses": {"ops": int(n in self.used)}} for n in self.indexes]
+
+    def find(self, query):
+        return SimpleNamespace(explain=lambda: {"queryPlanner": {"winningPlan": self.plan}})
+
+
+def test_ensure_indexes_is_idempotent_and_report_diffs():
+    db = {"features_aqi_v1": _IndexedCollection(existing=["legacy_idx"])}
+
+    first = ensure_indexes(db, ["features_aqi_v1"])
+    second = ensure_indexes(db, ["features_aqi_v1"])
+    report = index_report(db, ["features_aqi_v1"])
+
+    assert first == second == {"features_aqi_v1": ["entity.city_1_event_timestamp_1"]}
+    assert db["features_aqi_v1"].indexes["entity.city_1_event_timestamp_1"]["unique"] is True
+    assert report["features_aqi_v1"] == {
+        "missing": [],
+        "undeclared": ["legacy_idx"],
+        "unused": ["entity.city_1_event_timestamp_1", "legacy_idx"],
+    }
+
+
+def test_verify_hot_queries_flags_collection_scans():
+    index_plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "entity.city_1_event_timestamp_1"}}
+    db = {
+        "features_aqi_v1": _IndexedCollection(plan=index_plan),
+        "raw_aqi_weather": _IndexedCollection(),
+    }
+
+    results = verify_hot_queries(db, ["features_aqi_v1", "raw_aqi_weather"])
+
+    by_collection = {(r["collection"], r["query"]): r for r in results}
+    assert by_collection[("features_aqi_v1", "lag history range")]["uses_index"] is True
+    assert by_collection[("features_aqi_v1", "lag history range")]["index"] == "entity.city_1_event_timestamp_1"
+    assert by_collection[("raw_aqi_weather", "batch feature load")]["uses_index"] is False
+
+
+def test_timeseries_document_round_trip():
+    layout = LAYOUTS["features_aqi_v1"]
+    doc = {
+        "_id": "abc",
+        "entity": {"city": "karachi"},
+        "event_timestamp": datetime(2024, 1, 1),
+        "features": {"aqi": 120},
+        "source": "aqicn",
+        "created_at": datetime(2024, 1, 2),
+    }
+
+    converted = to_timeseries_document(doc, layout)
+
+    assert converted == {
+        "event_timestamp": datetime(2024, 1, 1),
+        "features": {"aqi": 120},
+        "meta": {"city": "karachi", "source": "aqicn"},
+    }
+    # The source document is left untouched
+    assert doc["entity"] == {"city": "karachi"}
+    assert from_timeseries_document(converted, layout) == {
+        "entity": {"city": "karachi"},
+        "event_timestamp": datetime(2024, 1, 1),
+        "features": {"aqi": 120},
+        "source": "aqicn",
+    }
+
+
+@pytest.mark.skipif(not os.getenv("MONGO_TEST_URI"), reason="needs a local mongod (MONGO_TEST_URI)")
+def test_migrate_to_timeseries_against_local_mongod():
+    from pymongo import MongoClient
+
+    client = MongoClient(os.getenv("MONGO_TEST_URI"))
+    db = client["aqi_timeseries_migration_test"]
+    client.drop_database(db.name)
+    try:
+        start = datetime(2024, 1, 1)
+        db["raw_aqi_weather_hourly"].insert_many([
+            {"city": "karachi", "timestamp": start + timedelta(hours=h), "aqi": {"us_aqi": h},
+             "weather": {"temperature": 20}, "source": "open-meteo", "ingested_at": start}
+            for h in range(50)
+        ])
+
+        assert migrate_to_timeseries(db, "raw_aqi_weather_hourly", batch_size=20) == 50
+        # Re-running only redoes the newest hour
+        assert migrate_to_timeseries(db, "raw_aqi_weather_hourly", batch_size=20) == 1
+        assert db["raw_aqi_weather_hourly_ts"].count_documents({"meta.city": "karachi"}) == 50
+    finally:
+        client.drop_database(db.name)
+
+
+def test_offline_store_appends_and_prunes_reads(tmp_path):
+    import pandas as pd
+
+    from src.storage import offline_store
+
+    store = offline_store.ParquetOfflineStore(str(tmp_path))
+    hours = pd.date_range("2024-01-31 20:00", periods=8, freq="h", tz="UTC")
+
+    store.append("features", pd.DataFrame({
+        "city": "Karachi", "event_timestamp": hours[:4], "aqi": [1, 2, 3, 4], "hour": hours[:4].hour
+    }))
+    store.append("features", pd.DataFrame({
+        "city": ["karachi"] * 4 + ["lahore"] * 4,
+        "event_timestamp": list(hours[4:]) * 2,
+        "aqi": [5.0, 6.0, 7.0, 8.0, 50.0, 60.0, 70.0, 80.0],
+        "hour": list(hours[4:].hour) * 2,
+    }))
+
+    # One directory per city/year/month
+    assert sorted(p.name for p in (tmp_path / "features" / "city=karachi" / "year=2024").iterdir()) == [
+        "month=1", "month=2"
+    ]
+
+    frame = store.read(
+        "features", columns=["aqi"], start=datetime(2024, 1, 31, 22), end=datetime(2024, 2, 1, 2),
+        cities=["karachi"]
+    )
+    assert list(frame.columns) == ["city", "event_timestamp", "aqi"]
+    assert frame["aqi"].tolist() == [3.0, 4.0, 5.0, 6.0]
+
+    assert store.latest_timestamp("features", "lahore") == hours[-1]
+    assert store.latest_timestamp("missing") is None
+
+
+def test_flatten_documents_for_feature_collection():
+    from src.storage import offline_store
+
+    docs = [{
+        "_id": "x",
+        "entity": {"city": "karachi"},
+        "event_timestamp": datetime(2024, 1, 1),
+        "features": {"aqi": 120, "aqi_lag_1": None},
+        "feature_version": "v1",
+    }]
+
+    frame = offline_store.flatten_documents(docs, offline_store.MATERIALIZATIONS["features"])
+
+    assert set(frame.columns) == {"city", "event_timestamp", "aqi", "aqi_lag_1", "feature_version"}
+    assert frame.loc[0, "aqi"] == 120
+
+
+class _WriteTimeCollection:
+    """find() over in-memory documents, supporting {field: {"$gt": v}} and sort."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query=None, projection=None):
+        docs = list(self.docs)
+        for field_name, condition in (query or {}).items():
+            docs = [d for d in docs if d.get(field_name) is not None and d[field_name] > condition["$gt"]]
+
+        class _Cursor:
+            def batch_size(self, size):
+                return self
+
+            def sort(self, keys):
+                for key, direction in reversed(keys):
+                    docs.sort(key=lambda d: d[key], reverse=direction < 0)
+                return self
+
+            def __iter__(self):
+                return iter(docs)
+
+        return _Cursor()
+
+
+def test_materialize_uses_write_time_watermark_across_cities(tmp_path):
+    from src.storage import offline_store
+
+    def feature_doc(city, hour, aqi, created_at):
+        return {
+            "_id": f"{city}-{hour}-{aqi}",
+            "entity": {"city": city},
+            "event_timestamp": datetime(2024, 1, 1, hour),
+            "features": {"aqi": aqi},
+            "created_at": created_at,
+        }
+
+    first_write = datetime(2024, 1, 2)
+    docs = [feature_doc("karachi", h, 100 + h, first_write) for h in range(10)]
+    docs += [feature_doc("lahore", h, 200 + h, first_write) for h in range(3)]
+    db = {"features_aqi_v1": _WriteTimeCollection(docs)}
+    store = offline_store.ParquetOfflineStore(str(tmp_path))
+
+    assert offline_store.materialize_from_mongo(store, db, "features", chunk_size=4) == 13
+    assert store.materialized_through("features") == first_write
+    # Nothing new was written since
+    assert offline_store.materialize_from_mongo(store, db, "features") == 0
+
+    # Lahore catches up on hours karachi passed long ago, and one karachi
+    # hour is recomputed
+    late_write = datetime(2024, 1, 3)
+    docs += [feature_doc("lahore", h, 200 + h, late_write) for h in range(3, 6)]
+    docs.append(feature_doc("karachi", 5, 999, late_write))
+
+    assert offline_store.materialize_from_mongo(store, db, "features") == 4
+    assert store.materialized_through("features") == late_write
+
+    frame = store.read("features", columns=["aqi"])
+    lahore = frame[frame["city"] == "lahore"]
+    karachi = frame[frame["city"] == "karachi"]
+    assert lahore["aqi"].tolist() == [200.0, 201.0, 202.0, 203.0, 204.0, 205.0]
+    assert len(karachi) == 10
+    assert karachi.loc[karachi["event_timestamp"].dt.hour == 5, "aqi"].tolist() == [999.0]
+    assert list(frame.columns) == ["city", "event_timestamp", "aqi"]
+
+
+class _CursorCollection:
+    """find() over in-memory documents, applying exclusion projections."""
+
+    name = "raw_aqi_weather_hourly"
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.batch_sizes = []
+
+    def find(self, query=None, projection=None):
+        excluded = {k for k, v in (projection or {}).items() if not v}
+        collection = self
+
+        class _Cursor:
+            def __init__(self):
+                self.docs = [{k: v for k, v in d.items() if k not in excluded} for d in collection.docs]
+
+            def batch_size(self, size):
+                collection.batch_sizes.append(size)
+                return self
+
+            def sort(self, keys):
+                return self
+
+            def __iter__(self):
+                return iter(self.docs)
+
+        return _Cursor()
+
+
+def test_iter_arrow_batches_streams_typed_chunks():
+    import pyarrow as pa
+    from src.storage.export import iter_arrow_batches
+
+    docs = [
+        {"_id": i, "city": "karachi", "timestamp": datetime(2024, 1, 1) + timedelta(hours=i),
+         "aqi": {"us_aqi": i if i else None}}
+        for i in range(5)
+    ]
+    # A late document with a stray field and a string where a number was expected
+    docs.append({"_id": 5, "city": "karachi", "timestamp": datetime(2024, 1, 2), "aqi": {"us_aqi": "n/a"}, "x": 1})
+    collection = _CursorCollection(docs)
+
+    batches = list(iter_arrow_batches(collection, chunk_size=2))
+
+    assert [b.num_rows for b in batches] == [2, 2, 2]
+    # One pass for the schema, one for the data, both in chunks
+    assert collection.batch_sizes == [2, 2]
+    assert all(b.schema == batches[0].schema for b in batches)
+    # The union of all chunks: the late column is kept, not dropped
+    assert batches[0].schema.names == ["city", "timestamp", "aqi_us_aqi", "x"]
+    assert pa.types.is_timestamp(batches[0].schema.field("timestamp").type)
+    assert batches[2].column("x").to_pylist() == [None, 1]
+    # Numbers and "n/a" in one column -> string for every chunk, not fatal
+    assert pa.types.is_string(batches[0].schema.field("aqi_us_aqi").type)
+    assert batches[2].column("aqi_us_aqi").to_pylist() == ["4", "n/a"]
+
+
+def test_arrow_schema_unions_late_and_all_null_columns():
+    import pyarrow as pa
+    from src.storage.export import infer_schema, iter_arrow_batches
+
+    docs = [{"city": "karachi", "pm25": None, "aqi": 1}, {"city": "karachi", "pm25": None, "aqi": 2}]
+    docs += [{"city": "lahore", "pm25": 12.5, "aqi": 3.5, "o3": 40.0}]
+    collection = _CursorCollection(docs)
+
+    schema = infer_schema(collection, chunk_size=2)
+    batches = list(iter_arrow_batches(collection, chunk_size=2))
+
+    # pm25 is all null in the first chunk but a double later; aqi widens to double
+    assert schema == pa.schema([("city", pa.string()), ("pm25", pa.float64()), ("aqi", pa.float64()),
+                                ("o3", pa.float64())])
+    assert all(b.schema == schema for b in batches)
+    assert batches[1].column("o3").to_pylist() == [40.0]
+
+
+def test_export_parquet_writes_one_row_group_per_chunk(tmp_path):
+    import pyarrow.parquet as pq
+    from src.storage.export import export_parquet
+
+    docs = [{"_id": i, "city": "karachi", "aqi": float(i)} for i in range(7)]
+    path = str(tmp_path / "hourly.parquet")
+
+    assert export_parquet(_CursorCollection(docs), path, chunk_size=3) == 7
+
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == 3
+    assert parquet_file.read().column("aqi").to_pylist() == [float(i) for i in range(7)]
+
+
+def test_coverage_pipeline_groups_server_side():
+    from src.storage.coverage import coverage_fields, coverage_pipeline
+
+    assert coverage_fields("features_aqi_v1") == ("entity.city", "event_timestamp")
+    assert coverage_fields("raw_aqi_weather_hourly_ts") == ("meta.city", "timestamp")
+
+    pipeline = coverage_pipeline("entity.city", "event_timestamp", start=datetime(2024, 1, 1), cities=["karachi"])
+
+    assert pipeline[0] == {"$match": {
+        "entity.city": {"$in": ["karachi"]}, "event_timestamp": {"$gte": datetime(2024, 1, 1)}
+    }}
+    assert pipeline[1]["$group"]["_id"]["day"] == {"$dateTrunc": {"date": "$event_timestamp", "unit": "day"}}
+
+
+def test_missing_ranges_coalesce_across_days():
+    from src.storage.coverage import FULL_DAY, DayCoverage, missing_ranges
+
+    day1, day2, day4 = datetime(2024, 1, 1), datetime(2024, 1, 2), datetime(2024, 1, 4)
+    days = [
+        # Hours 0-21 on day 1, nothing on day 3, duplicates on day 4
+        DayCoverage("karachi", day1, FULL_DAY & ~(0b11 << 22), 22),
+        DayCoverage("karachi", day2, FULL_DAY & ~(1 << 5), 23),
+        DayCoverage("karachi", day4, 0b1, 3),
+        DayCoverage("lahore", day1, FULL_DAY, 24),
+    ]
+
+    assert days[2].documents > days[2].hours_present
+    assert days[1].missing_hours == [5]
+
+    gaps = missing_ranges(days)
+    assert [(g.city, g.start, g.end) for g in gaps] == [
+        ("karachi", day1 + timedelta(hours=22), day2),
+        ("karachi", day2 + timedelta(hours=5), day2 + timedelta(hours=6)),
+        ("karachi", day2 + timedelta(days=1), day4),
+    ]
+    assert gaps[2].hours == 24
+
+    # Explicit bounds count hours outside the data as missing
+    bounded = missing_ranges(days[3:], start=day1, end=day2 + timedelta(hours=2))
+    assert [(g.start, g.end) for g in bounded] == [(day2, day2 + timedelta(hours=2))]
+
+
+def test_ensure_indexes_once_per_process(monkeypatch):
+    from src.storage import indexes
+
+    calls = []
+    monkeypatch.setattr(indexes, "_ensured", set())
+    monkeypatch.setattr(indexes, "ensure_indexes", lambda db, names: calls.append(list(names)))
+    db = SimpleNamespace(name="aqi_once_test")
+
+    indexes.ensure_indexes_once(db, ["raw_aqi_weather_hourly"])
+    indexes.ensure_indexes_once(db, ["raw_aqi_weather_hourly", "features_aqi_v1"])
+    indexes.ensure_indexes_once(db, ["features_aqi_v1"])
+
+    assert calls == [["raw_aqi_weather_hourly"], ["features_aqi_v1"]]
+
+
+def test_mongo_client_is_lazy_shared_and_configurable(monkeypatch):
+    from src.utils import mongo_client
+
+    created = []
+
+    class FakeClient:
+        def __init__(self, uri, **kwargs):
+            created.append((uri, kwargs))
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(mongo_client, "MongoClient", FakeClient)
+    monkeypatch.setattr(mongo_client, "_client", None)
+    monkeypatch.setenv("MONGO_URI", "mongodb://db.test:27017/aqi")
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "20")
+    monkeypatch.setenv("MONGO_COMPRESSORS", "zstd,zlib")
+    monkeypatch.setattr(mongo_client.importlib.util, "find_spec", lambda name: None)
+
+    assert created == []
+    first = mongo_client.get_mongo_client()
+    assert mongo_client.get_mongo_client() is first
+    assert len(created) == 1
+
+    uri, kwargs = created[0]
+    assert uri == "mongodb://db.test:27017/aqi"
+    assert kwargs["maxPoolSize"] == 20
+    # zstandard is "not installed", so only zlib is negotiated
+    assert kwargs["compressors"] == "zlib"
+
+    mongo_client.close_mongo_client()
+    assert mongo_client.get_mongo_client() is not first
+
+    with pytest.raises(ValueError, match="Unknown MongoDB compressor"):
+        mongo_client.available_compressors(["lz4"])
+
+
+def test_get_database_follows_the_uri(monkeypatch):
+    from pymongo import MongoClient
+    from src.utils import mongo_client
+
+    for uri, expected in (("mongodb://db.test:27017/aqi", "aqi"), ("mongodb://db.test:27017", mongo_client.DEFAULT_DB_NAME)):
+        # connect=False: pymongo only parses the URI here
+        monkeypatch.setattr(mongo_client, "_client", MongoClient(uri, connect=False))
+        assert mongo_client.get_database().name == expected
+    assert mongo_client.get_database("other").name == "other"
+
+
+def test_hourly_array_store_slices_lags_and_windows(tmp_path):
+    store = HourlyArrayStore(str(tmp_path))
+    hours = [datetime(2024, 1, 1) + timedelta(hours=h) for h in range(10)]
+    del hours[4]
+    store.write("Karachi", "aqi", hours, [100.0 + h for h in range(9)])
+    # Later writes grow the file and overwrite in place
+    store.write("karachi", "aqi", [datetime(2024, 1, 1, 12), hours[0]], [200.0, None])
+
+    window = store.window("karachi", "aqi", datetime(2024, 1, 1, 5, 30), 4)
+    # 02:00..05:00, with no row for 04:00
+    assert window[0] == 102.0 and window[1] == 103.0 and np.isnan(window[2]) and window[3] == 104.0
+    lags = store.lags("karachi", "aqi", datetime(2024, 1, 1, 12), [1, 2, 3, 12, 24])
+    assert lags == {1: None, 2: None, 3: 108.0, 12: None, 24: None}
+
+    series = store.read("karachi", "aqi", datetime(2023, 12, 31, 23), datetime(2024, 1, 1, 13))
+    assert len(series) == 15 and np.isnan(series.iloc[0]) and series.iloc[-2] == 200.0
+    assert store.variables("karachi") == ["aqi"]
+
+    # A fresh handle keeps the store's original origin
+    reopened = HourlyArrayStore(str(tmp_path), origin=datetime(2024, 6, 1))
+    assert reopened.origin == store.origin
+    assert reopened.lags("karachi", "aqi", datetime(2024, 1, 1, 12), [4])[4] == 107.0
+
+    with pytest.raises(ValueError):
+        store.write("karachi", "aqi", [datetime(2019, 1, 1)], [1.0])
+    with pytest.raises(ValueError):
+        store.path("../etc", "aqi")
+
+
+def test_hour_index_treats_naive_as_utc():
+    assert hour_index(datetime(1970, 1, 2)) == 24
+    assert hour_index(pd.Timestamp("1970-01-02 05:59", tz="Asia/Karachi")) == 24
+    assert list(hour_index([datetime(1970, 1, 1, 1), datetime(1970, 1, 1, 2, 30)])) == [1, 2]
+    assert index_to_timestamp(24) == datetime(1970, 1, 2)